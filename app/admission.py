@@ -0,0 +1,215 @@
+"""
+Controle de admissão na entrada (middleware ASGI).
+
+Para cada endpoint:
+- limite de tamanho do corpo, verificado ANTES do parse (Content-Length ou
+  contagem dos chunks) -> 413;
+- limite de concorrência com fila de espera limitada -> 429 quando a fila
+  está cheia, 503 quando a espera passa de `max_wait_s`;
+- classe de prioridade: com a carga global alta, classes de menor prioridade
+  são descartadas primeiro (503), e as interativas por último.
+
+Respostas 429/503 trazem `Retry-After`. Os limites padrão podem ser
+sobrescritos por um JSON em ADMISSION_FILE:
+
+{"global_capacity": 128,
+ "endpoints": {"/evaluation": {"max_body_bytes": 20000000, "max_concurrency": 8}}}
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from dataclasses import dataclass, replace
+from typing import Dict, Optional
+
+from app import metrics
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") in ("1", "true", "True")
+ADMISSION_FILE = os.getenv("ADMISSION_FILE", "")
+ADMISSION_GLOBAL_CAPACITY = int(os.getenv("ADMISSION_GLOBAL_CAPACITY", "128"))
+ADMISSION_RETRY_AFTER_S = int(os.getenv("ADMISSION_RETRY_AFTER_S", "2"))
+
+# fração da capacidade global a partir da qual cada classe é descartada
+PRIORITY_SHED_AT = {"batch": 0.6, "standard": 0.85, "interactive": 1.0}
+
+_MB = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class EndpointLimits:
+    max_body_bytes: int = 1 * _MB
+    max_concurrency: int = 32
+    max_queue: int = 64
+    max_wait_s: float = 10.0
+    priority: str = "standard"
+
+
+DEFAULT_LIMITS = EndpointLimits()
+
+ENDPOINT_LIMITS: Dict[str, EndpointLimits] = {
+    "/profile/suggest-name": EndpointLimits(max_body_bytes=256 * 1024, max_concurrency=64, max_queue=128, priority="interactive"),
+    "/analyze": EndpointLimits(max_body_bytes=256 * 1024, max_concurrency=64, max_queue=128, priority="interactive"),
+    "/analyze/bulk": EndpointLimits(max_body_bytes=5 * _MB, max_concurrency=4, max_queue=8, max_wait_s=30.0, priority="batch"),
+    "/evaluation": EndpointLimits(max_body_bytes=20 * _MB, max_concurrency=16, max_queue=32, max_wait_s=30.0),
+    "/evaluation/follow-up": EndpointLimits(max_body_bytes=256 * 1024, max_concurrency=16, max_queue=32, max_wait_s=30.0, priority="interactive"),
+    "/evaluation/multi": EndpointLimits(max_body_bytes=100 * _MB, max_concurrency=4, max_queue=8, max_wait_s=60.0, priority="batch"),
+    "/evaluation/consolidate": EndpointLimits(max_body_bytes=10 * _MB, max_concurrency=8, max_queue=16, priority="batch"),
+    "/evaluation/consolidate/export": EndpointLimits(max_body_bytes=10 * _MB, max_concurrency=8, max_queue=16, priority="batch"),
+    "/reports/executive": EndpointLimits(max_body_bytes=2 * _MB, max_concurrency=8, max_queue=16),
+    "/condition/generate": EndpointLimits(max_body_bytes=256 * 1024, max_concurrency=16, max_queue=32, max_wait_s=30.0),
+    "/questionnaires/from-profile": EndpointLimits(max_body_bytes=256 * 1024, max_concurrency=16, max_queue=32, max_wait_s=30.0),
+    "/questionnaires/update": EndpointLimits(max_body_bytes=512 * 1024, max_concurrency=16, max_queue=32, max_wait_s=30.0),
+    "/questionnaires/register": EndpointLimits(max_body_bytes=512 * 1024, priority="interactive"),
+}
+
+# nunca passam pelo controle (sondas de saúde/observabilidade)
+EXEMPT_PATHS = {"/health", "/metrics", "/docs", "/redoc", "/openapi.json"}
+
+# caminhos sem limites próprios dividem um único gate (e rótulo de métrica):
+# caminhos arbitrários (404, ids na URL) não criam estado novo
+OTHER_PATHS = "other"
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+class EndpointGate:
+    """Semáforo com fila de espera limitada e tempo máximo de espera."""
+
+    def __init__(self, limits: EndpointLimits):
+        self.limits = limits
+        self._semaphore = asyncio.Semaphore(max(1, limits.max_concurrency))
+        self.waiting = 0
+        self.active = 0
+
+    async def acquire(self) -> None:
+        if not self._semaphore.locked():
+            # caminho rápido: há vaga, acquire() retorna sem suspender
+            await self._semaphore.acquire()
+            self.active += 1
+            return
+        if self.waiting >= self.limits.max_queue:
+            raise Rejected(429, "Fila de espera cheia para este endpoint.")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.limits.max_wait_s)
+        except asyncio.TimeoutError:
+            raise Rejected(503, "Tempo de espera na fila esgotado.")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self) -> None:
+        self.active -= 1
+        self._semaphore.release()
+
+
+def load_limits(path: str = ADMISSION_FILE) -> tuple[int, Dict[str, EndpointLimits]]:
+    limits = dict(ENDPOINT_LIMITS)
+    capacity = ADMISSION_GLOBAL_CAPACITY
+    if path:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        capacity = int(data.get("global_capacity", capacity))
+        for endpoint, overrides in data.get("endpoints", {}).items():
+            limits[endpoint] = replace(limits.get(endpoint, DEFAULT_LIMITS), **overrides)
+    return capacity, limits
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, app, global_capacity: Optional[int] = None, limits: Optional[Dict[str, EndpointLimits]] = None):
+        self.app = app
+        file_capacity, file_limits = load_limits()
+        self.global_capacity = global_capacity or file_capacity
+        self.limits = limits if limits is not None else file_limits
+        self._gates: Dict[str, EndpointGate] = {path: EndpointGate(lim) for path, lim in self.limits.items()}
+        self._gates[OTHER_PATHS] = EndpointGate(DEFAULT_LIMITS)
+        self.load = 0  # requisições admitidas ou esperando
+
+    def _gate_key(self, path: str) -> str:
+        return path if path in self.limits else OTHER_PATHS
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        key = self._gate_key(scope["path"])
+        gate = self._gates[key]
+        limits = gate.limits
+
+        try:
+            receive = await self._check_body_size(scope, receive, limits.max_body_bytes)
+            shed_at = PRIORITY_SHED_AT.get(limits.priority, 1.0) * self.global_capacity
+            if self.load >= shed_at:
+                raise Rejected(503, "Serviço sobrecarregado; tente novamente.")
+        except Rejected as r:
+            await self._reject(send, key, r)
+            return
+
+        self.load += 1
+        try:
+            try:
+                await gate.acquire()
+            except Rejected as r:
+                await self._reject(send, key, r)
+                return
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                gate.release()
+        finally:
+            self.load -= 1
+
+    async def _check_body_size(self, scope, receive, max_bytes: int):
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                if int(content_length) > max_bytes:
+                    raise Rejected(413, f"Corpo da requisição excede {max_bytes} bytes.")
+            except ValueError:
+                raise Rejected(400, "Content-Length inválido.")
+            return receive
+
+        if scope.get("method") in ("GET", "HEAD", "OPTIONS"):
+            return receive
+
+        # sem Content-Length (chunked): lê até o limite e reenvia ao app
+        messages = []
+        total = 0
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            total += len(message.get("body", b""))
+            if total > max_bytes:
+                raise Rejected(413, f"Corpo da requisição excede {max_bytes} bytes.")
+            if not message.get("more_body", False):
+                break
+
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        return replay
+
+    async def _reject(self, send, gate_key: str, rejection: Rejected) -> None:
+        metrics.incr(f"admission.rejected.{rejection.status}")
+        metrics.incr(f"admission.rejected.{rejection.status}.{gate_key}")
+        body = json.dumps({"detail": rejection.detail}, ensure_ascii=False).encode("utf-8")
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ]
+        if rejection.status in (429, 503):
+            headers.append((b"retry-after", str(ADMISSION_RETRY_AFTER_S).encode()))
+        await send({"type": "http.response.start", "status": rejection.status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,287 @@
+"""
+Backends de LLM.
+
+Um backend expõe as três operações que os casos de uso precisam:
+- `chat(**kwargs)`: Chat Completions;
+- `respond(**kwargs)`: Responses API (texto + imagem);
+- `stream_chat(**kwargs)`: Chat Completions em streaming (pedaços de texto).
+
+Implementações:
+- `OpenAIBackend`: a API da OpenAI, com o cliente único de `get_client()`;
+- `OpenAICompatibleBackend`: qualquer servidor compatível com a API da
+  OpenAI (vLLM, TGI, llama.cpp etc.) num `base_url` próprio. Servidores sem
+  Responses API (`"responses_api": false`) recebem `respond()` traduzido para
+  Chat Completions, com as imagens como partes `image_url`.
+
+Cada backend guarda o próprio estado de saúde: `LLM_BACKEND_FAILURE_THRESHOLD`
+falhas seguidas do backend (rede, timeout, 429/5xx) o tiram de uso por
+`LLM_BACKEND_COOLDOWN_S`; o monitor (`health_monitor`) sonda periodicamente
+os backends configurados e os devolve ao uso assim que respondem.
+"""
+from __future__ import annotations
+
+import abc
+import asyncio
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from app import metrics
+from app.openai_client import get_client
+from app.recording import get_recorder
+from app.tokens import provider_output_limit
+
+logger = logging.getLogger("llm_backends")
+
+DEFAULT_BACKEND = "openai"
+
+LLM_BACKEND_FAILURE_THRESHOLD = int(os.getenv("LLM_BACKEND_FAILURE_THRESHOLD", "3"))
+LLM_BACKEND_COOLDOWN_S = float(os.getenv("LLM_BACKEND_COOLDOWN_S", "30"))
+# Intervalo das sondas de saúde (0 desliga; o backend volta ao fim do cooldown)
+LLM_HEALTH_INTERVAL_S = float(os.getenv("LLM_HEALTH_INTERVAL_S", "15"))
+LLM_HEALTH_TIMEOUT_S = float(os.getenv("LLM_HEALTH_TIMEOUT_S", "5"))
+
+
+class BackendUnsupported(Exception):
+    """Operação que o backend não oferece (ex.: `previous_response_id` sem Responses API)."""
+
+    # tratado como requisição inválida, não como falha do backend; em
+    # follow-ups equivale a "estado ausente" e o contexto é reenviado
+    status_code = 400
+
+
+def is_backend_fault(exc: BaseException) -> bool:
+    """
+    Falhas que contam contra a saúde do backend: rede, timeout, 429 e 5xx.
+    Erros da requisição (4xx) e bugs locais (exceções sem status) não contam.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    # o SDK só é consultado se já foi importado (nunca no cold start)
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def _sized_output(kwargs: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """Aplica a folga de raciocínio ao limite de saída `key`, conforme o modelo."""
+    if kwargs.get(key) is None:
+        return kwargs
+    return {**kwargs, key: provider_output_limit(kwargs.get("model"), kwargs[key])}
+
+
+class LLMBackend(abc.ABC):
+    name: str = DEFAULT_BACKEND
+    # modelo usado quando nem a requisição nem a rota definem um
+    default_model: Optional[str] = None
+
+    def __init__(self):
+        self._failures = 0
+        self._down_until = 0.0
+
+    @abc.abstractmethod
+    def client(self):
+        """Cliente `AsyncOpenAI` (ou compatível) do backend."""
+
+    async def chat(self, **kwargs):
+        return await self._recorded("chat", kwargs, self.client().chat.completions.create(**self._chat_kwargs(kwargs)))
+
+    async def respond(self, **kwargs):
+        pending = self.client().responses.create(**_sized_output(kwargs, "max_output_tokens"))
+        return await self._recorded("respond", kwargs, pending)
+
+    def _chat_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        # os casos de uso mandam `max_completion_tokens` (modelos de raciocínio recusam `max_tokens`)
+        return _sized_output(kwargs, "max_completion_tokens")
+
+    async def _recorded(self, kind: str, kwargs: Dict[str, Any], pending):
+        recorder = get_recorder()
+        if recorder is None:
+            return await pending
+        start = time.perf_counter()
+        result = await pending
+        recorder.record_llm(kind, kwargs, result, time.perf_counter() - start)
+        return result
+
+    async def stream_chat(self, **kwargs) -> AsyncIterator[str]:
+        stream = await self.client().chat.completions.create(stream=True, **self._chat_kwargs(kwargs))
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def health_check(self) -> bool:
+        try:
+            await asyncio.wait_for(self.client().models.list(), timeout=LLM_HEALTH_TIMEOUT_S)
+        except Exception:
+            logger.warning("[llm_backends] sonda de saúde falhou para %s", self.name)
+            self._mark_down()
+            return False
+        self.record_success()
+        return True
+
+    # --- saúde ---
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def record_success(self) -> None:
+        if self._down_until:
+            logger.info("[llm_backends] %s de volta ao uso", self.name)
+        self._failures = 0
+        self._down_until = 0.0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        metrics.incr(f"backend.{self.name}.failures")
+        if self._failures >= LLM_BACKEND_FAILURE_THRESHOLD:
+            self._mark_down()
+
+    def _mark_down(self) -> None:
+        if self.healthy:
+            metrics.incr(f"backend.{self.name}.marked_down")
+            logger.warning("[llm_backends] %s fora de uso por %.0fs", self.name, LLM_BACKEND_COOLDOWN_S)
+        self._down_until = time.monotonic() + LLM_BACKEND_COOLDOWN_S
+
+
+class OpenAIBackend(LLMBackend):
+    name = DEFAULT_BACKEND
+
+    def client(self):
+        return get_client()
+
+
+@dataclass
+class ChatAsResponse:
+    """Resultado de `respond()` em backends sem Responses API (mesmos campos usados)."""
+    id: Optional[str]
+    output_text: str
+    usage: Any = None
+
+
+def _chat_part(part: Dict[str, Any]) -> Dict[str, Any]:
+    kind = part.get("type")
+    if kind == "input_text":
+        return {"type": "text", "text": part.get("text", "")}
+    if kind == "input_image":
+        return {"type": "image_url", "image_url": {"url": part.get("image_url", "")}}
+    return part
+
+
+def responses_input_to_messages(input: Any, instructions: Optional[str] = None) -> List[Dict[str, Any]]:
+    messages: List[Dict[str, Any]] = []
+    if instructions:
+        messages.append({"role": "system", "content": instructions})
+    if isinstance(input, str):
+        messages.append({"role": "user", "content": input})
+        return messages
+    for item in input:
+        content = item.get("content")
+        if isinstance(content, list):
+            content = [_chat_part(p) for p in content]
+        messages.append({"role": item.get("role", "user"), "content": content})
+    return messages
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: Optional[str] = None,
+        responses_api: bool = True,
+        default_model: Optional[str] = None,
+        timeout_s: Optional[float] = None,
+    ):
+        super().__init__()
+        self.name = name
+        self.base_url = base_url
+        # servidores locais costumam ignorar a chave, mas o SDK exige uma
+        self.api_key = api_key or "unused"
+        self.responses_api = responses_api
+        self.default_model = default_model
+        self.timeout_s = timeout_s
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI
+            kwargs: Dict[str, Any] = {"api_key": self.api_key, "base_url": self.base_url}
+            if self.timeout_s:
+                kwargs["timeout"] = self.timeout_s
+            self._client = AsyncOpenAI(**kwargs)
+        return self._client
+
+    def _chat_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs = super()._chat_kwargs(kwargs)
+        # servidores compatíveis nem sempre aceitam `max_completion_tokens`
+        if "max_completion_tokens" in kwargs:
+            kwargs["max_tokens"] = kwargs.pop("max_completion_tokens")
+        return kwargs
+
+    async def respond(self, **kwargs):
+        if self.responses_api:
+            return await super().respond(**kwargs)
+        if kwargs.get("previous_response_id"):
+            raise BackendUnsupported(f"Backend {self.name} não guarda conversas (sem Responses API).")
+
+        chat_kwargs: Dict[str, Any] = {
+            "model": kwargs["model"],
+            "messages": responses_input_to_messages(kwargs.get("input", []), kwargs.get("instructions")),
+        }
+        if kwargs.get("max_output_tokens") is not None:
+            chat_kwargs["max_completion_tokens"] = kwargs["max_output_tokens"]
+        if kwargs.get("temperature") is not None:
+            chat_kwargs["temperature"] = kwargs["temperature"]
+        completion = await self.chat(**chat_kwargs)
+        return ChatAsResponse(
+            id=None,
+            output_text=completion.choices[0].message.content or "",
+            usage=getattr(completion, "usage", None),
+        )
+
+
+def build_backends(config: Dict[str, Dict[str, Any]]) -> Dict[str, LLMBackend]:
+    """
+    `config`: nome -> {"base_url", "api_key_env", "responses_api",
+    "default_model", "timeout_s"}. O backend "openai" sempre existe.
+    """
+    backends: Dict[str, LLMBackend] = {DEFAULT_BACKEND: OpenAIBackend()}
+    for name, cfg in config.items():
+        if name == DEFAULT_BACKEND and not cfg.get("base_url"):
+            continue
+        if not cfg.get("base_url"):
+            raise RuntimeError(f"Backend {name} sem base_url.")
+        api_key_env = cfg.get("api_key_env")
+        backends[name] = OpenAICompatibleBackend(
+            name=name,
+            base_url=cfg["base_url"],
+            api_key=os.getenv(api_key_env) if api_key_env else None,
+            responses_api=bool(cfg.get("responses_api", True)),
+            default_model=cfg.get("default_model"),
+            timeout_s=float(cfg["timeout_s"]) if cfg.get("timeout_s") else None,
+        )
+    return backends
+
+
+async def check_backends(backends: Iterable[LLMBackend]) -> Dict[str, bool]:
+    backends = list(backends)
+    results = await asyncio.gather(*(b.health_check() for b in backends))
+    return {b.name: ok for b, ok in zip(backends, results)}
+
+
+async def health_monitor(get_backends: Callable[[], Dict[str, LLMBackend]], interval_s: float = LLM_HEALTH_INTERVAL_S) -> None:
+    """Sonda os backends compatíveis (o da OpenAI só é avaliado pelo tráfego)."""
+    while True:
+        await asyncio.sleep(interval_s)
+        try:
+            probed = [b for b in get_backends().values() if isinstance(b, OpenAICompatibleBackend)]
+            if probed:
+                await check_backends(probed)
+        except Exception:
+            logger.exception("[llm_backends] falha no monitor de saúde")
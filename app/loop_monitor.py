@@ -0,0 +1,122 @@
+"""
+Monitor de atraso do event loop e detector de chamadas bloqueantes.
+
+- Batimento: uma tarefa dorme LOOP_MONITOR_INTERVAL_S e mede quanto acordou
+  atrasada; o atraso vai para a métrica `event_loop.lag_s`.
+- Vigia: uma thread confere se o batimento está parado há mais de
+  LOOP_BLOCK_THRESHOLD_S. Se estiver, o loop está preso numa chamada
+  síncrona: a pilha da thread do loop é capturada naquele momento e logada
+  uma vez por travamento, com a rota da requisição em curso (registrada
+  por `LoopMonitorMiddleware` para a tarefa atual) e a duração total ao fim
+  (`event_loop.blocked_s`).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+from app import metrics
+
+logger = logging.getLogger("loop_monitor")
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR", "1") in ("1", "true", "True")
+LOOP_MONITOR_INTERVAL_S = float(os.getenv("LOOP_MONITOR_INTERVAL_S", "0.1"))
+LOOP_BLOCK_THRESHOLD_S = float(os.getenv("LOOP_BLOCK_THRESHOLD_S", "0.25"))
+# quadros da pilha logados por travamento (os mais internos)
+LOOP_BLOCK_STACK_DEPTH = int(os.getenv("LOOP_BLOCK_STACK_DEPTH", "25"))
+
+# tarefa -> "MÉTODO /caminho" das requisições em curso
+_task_routes: Dict[asyncio.Task, str] = {}
+
+
+class LoopMonitorMiddleware:
+    """Associa a tarefa de cada requisição à rota, para os logs do vigia."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        task = asyncio.current_task() if scope["type"] == "http" else None
+        if task is None:
+            await self.app(scope, receive, send)
+            return
+        _task_routes[task] = f"{scope['method']} {scope['path']}"
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _task_routes.pop(task, None)
+
+
+class LoopMonitor:
+    def __init__(
+        self,
+        interval_s: float = LOOP_MONITOR_INTERVAL_S,
+        threshold_s: float = LOOP_BLOCK_THRESHOLD_S,
+    ):
+        self.interval_s = interval_s
+        self.threshold_s = threshold_s
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id = 0
+        self._beat_at = time.monotonic()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Chamado de dentro do event loop (lifespan)."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat_at = time.monotonic()
+        self._heartbeat = asyncio.create_task(self._beat(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1.0)
+
+    async def _beat(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            lag = max(0.0, time.perf_counter() - start - self.interval_s)
+            metrics.observe("event_loop.lag_s", lag)
+            self._beat_at = time.monotonic()
+
+    def _current_route(self) -> str:
+        # lido de outra thread: apenas consultas a dicionários, sem tocar no loop
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        if task is None:
+            return "-"
+        return _task_routes.get(task) or f"tarefa {task.get_name()}"
+
+    def _watch(self) -> None:
+        stalled_since_beat: Optional[float] = None
+        limit = self.interval_s + self.threshold_s
+        while not self._stop.wait(self.threshold_s / 2):
+            beat_at = self._beat_at
+            stalled = time.monotonic() - beat_at
+            if stalled_since_beat is not None and beat_at != stalled_since_beat:
+                # o loop voltou: registra a duração total do travamento
+                metrics.observe("event_loop.blocked_s", beat_at - stalled_since_beat - self.interval_s)
+                stalled_since_beat = None
+            if stalled <= limit or stalled_since_beat is not None:
+                continue
+
+            stalled_since_beat = beat_at
+            metrics.incr("event_loop.blocked")
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=LOOP_BLOCK_STACK_DEPTH)) if frame else "(pilha indisponível)\n"
+            logger.warning(
+                "[loop_monitor] event loop bloqueado há %.0f ms em %s; pilha:\n%s",
+                (stalled - self.interval_s) * 1000, self._current_route(), stack,
+            )
@@ -1,39 +1,168 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
 from app.usecase.consolidate_usecase import aggregate_evaluations
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from app.schemas import (
     ProfileSuggestRequest, ProfileSuggestResponse,
     GenerateQuestionnaireRequest, UpdateQuestionnaireRequest,
     AnalyzeRequest, LLMResponse,
+    AnalyzeBulkRequest, AnalyzeBulkResponse, AnalyzeBulkResult,
     CreateProfileRequest, CreateProfileResponse,
     EvaluationRequest, EvaluationResponse,
-    ResultInput, ExecutiveReportRequest, ExecutiveReportResponse,
+    EvaluationMultiRequest, EvaluationMultiResponse, EvaluationMultiResult,
+    EvaluationFollowUpRequest, EvaluationFollowUpResponse,
+    RegisterQuestionnaireRequest, RegisterQuestionnaireResponse,
+    ResultInput, ExecutiveReportRequest, ExecutiveReportResponse, TokenUsage,
     ConsolidateEvaluationsRequest, ConsolidateEvaluationsResponse, CommonItem,
+    ConsolidateExportRequest,
 )
+from app import metrics
+from app.admission import ADMISSION_ENABLED, AdmissionControlMiddleware
+from app.loop_monitor import LOOP_MONITOR_ENABLED, LoopMonitor, LoopMonitorMiddleware
+from app.llm_backends import LLM_HEALTH_INTERVAL_S, health_monitor
+from app.model_routing import TenantMiddleware, get_backends
+from app.openai_client import get_client
+from app.profiling import PROFILING_ENABLED, ProfilingMiddleware, profile_path, token_matches
+from app.recording import RECORD_CASSETTE, RecorderMiddleware
+from app.prompts import prompt_hash
+from app.tokens import TokenBudgetExceeded, UsageTotals, usage_scope
 from app.usecase.profile_usecase import suggest_profile_name
 from app.usecase.questionnaire_usecase import generate_from_profile, update_questionnaire
-from app.usecase.analyze_usecase import analyze
+from app.usecase.analyze_usecase import analyze, analyze_many
+from app.usecase.analyze_batch_usecase import ANALYZE_MICROBATCH_ENABLED, get_analyze_batcher
 from app.usecase.profile_create_usecase import create_profile_assets
+from app.usecase.profile_catalog_usecase import ASSETS, PROFILE_CATALOG_ENABLED, QUESTIONNAIRE, get_profile_catalog
+from app.usecase.questionnaire_store_usecase import get_questionnaire_store
+from app.usecase.evaluation_multi_usecase import evaluate_images
+from app.usecase.evaluation_followup_usecase import EvaluationSession, follow_up, get_evaluation_sessions
+from app.usecase.consolidate_export_usecase import EXPORT_FORMATS, export_consolidation
 from app.usecase.evaluation_usecase import (
     evaluate_image,
+    evaluate_image_samples,
     generate_executive_report,
 )
 
-app = FastAPI(title="Cognalyze Simple LLM API", version="0.2.0")
+# Configuração de logging feita uma única vez, no ponto de entrada da aplicação
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+# Se "1", o SDK da OpenAI é importado e o cliente criado no startup (em vez de
+# na primeira requisição). Por padrão fica tardio para acelerar o cold start.
+PRELOAD_OPENAI = os.getenv("PRELOAD_OPENAI", "0") in ("1", "true", "True")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PRELOAD_OPENAI:
+        try:
+            get_client()
+        except RuntimeError:
+            logging.getLogger("app").warning("PRELOAD_OPENAI ativo mas OPENAI_API_KEY ausente")
+
+    loop_monitor = None
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor = LoopMonitor()
+        loop_monitor.start()
+
+    tasks = []
+    if LLM_HEALTH_INTERVAL_S > 0 and len(get_backends()) > 1:
+        tasks.append(asyncio.create_task(health_monitor(get_backends)))
+    if PROFILE_CATALOG_ENABLED:
+        # carrega (e, com PROFILE_CATALOG=1, aquece) o catálogo sem segurar o startup
+        tasks.append(asyncio.create_task(get_profile_catalog().run()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        if loop_monitor is not None:
+            loop_monitor.stop()
+
+
+app = FastAPI(title="Cognalyze Simple LLM API", version="0.2.0", lifespan=lifespan)
+
+# Compressão de respostas grandes (Markdown de diagnóstico, questionários).
+# Brotli é usado se o pacote opcional `brotli-asgi` estiver instalado (ele
+# negocia br/gzip pelo Accept-Encoding); caso contrário, apenas gzip.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+else:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+app.add_middleware(TenantMiddleware)
+
+# Rota da requisição em curso, para os logs de bloqueio do event loop
+if LOOP_MONITOR_ENABLED:
+    app.add_middleware(LoopMonitorMiddleware)
+
+# Gravação de cassetes (scripts/replay_load.py): por fora do tenant, por dentro da admissão
+if RECORD_CASSETTE:
+    app.add_middleware(RecorderMiddleware)
+
+# Perfilamento sob demanda (X-Profile / ?profile= / amostragem aleatória)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Adicionado por último = camada mais externa: rejeita antes de ler/parsear o corpo
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware)
+
+
+def _llm_response(content: str, prompt: str, prompt_id: str, include_prompt: bool, usage=None) -> LLMResponse:
+    return LLMResponse(
+        content=content,
+        prompt_id=prompt_id,
+        prompt_hash=prompt_hash(prompt),
+        used_prompt=prompt if include_prompt else None,
+        usage=TokenUsage(**usage.as_dict()) if usage is not None else None,
+    )
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    backends = get_backends()
+    if len(backends) == 1:
+        return {"status": "ok"}
+    return {"status": "ok", "backends": {name: b.healthy for name, b in backends.items()}}
+
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+@app.get("/debug/profiles/{profile_id}")
+async def get_profile(profile_id: str, x_profile_token: str | None = Header(None)):
+    if not token_matches(x_profile_token):
+        raise HTTPException(status_code=403, detail="Token de perfilamento inválido.")
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado.")
+    return FileResponse(path, media_type="application/json", filename=f"{profile_id}.speedscope.json")
 
 @app.post("/condition/generate", response_model=CreateProfileResponse)
 async def post_create_profile(body: CreateProfileRequest):
+    if PROFILE_CATALOG_ENABLED and body.model is None and body.max_output_tokens is None:
+        cached = get_profile_catalog().lookup(ASSETS, body.name, body.description)
+        if cached is not None:
+            return CreateProfileResponse(**cached.content, usage=TokenUsage())
     try:
-        result = await create_profile_assets(
-            name=body.name,
-            description=body.description,
-            model_override=body.model
-        )
-        return CreateProfileResponse(**result)
+        with usage_scope() as usage:
+            result = await create_profile_assets(
+                name=body.name,
+                description=body.description,
+                model_override=body.model,
+                max_output_tokens=body.max_output_tokens,
+            )
+        return CreateProfileResponse(**result, usage=TokenUsage(**usage.as_dict()))
+
+    except TokenBudgetExceeded as te:
+        raise HTTPException(status_code=413, detail=str(te))
 
     except ValueError as ve:
         # Erro conhecido (JSON inválido/campos ausentes) → 502 com detalhe útil
@@ -47,74 +176,235 @@ async def post_create_profile(body: CreateProfileRequest):
 @app.post("/profile/suggest-name", response_model=ProfileSuggestResponse)
 async def post_suggest_profile_name(body: ProfileSuggestRequest):
     try:
-        name = await suggest_profile_name(
-            description=body.description,
-            existing_profiles=body.existing_profiles,
-            proposed_name=body.name
-        )
-        return ProfileSuggestResponse(name=name)
+        with usage_scope() as usage:
+            name = await suggest_profile_name(
+                description=body.description,
+                existing_profiles=body.existing_profiles,
+                proposed_name=body.name,
+                model_override=body.model,
+            )
+        return ProfileSuggestResponse(name=name, usage=TokenUsage(**usage.as_dict()))
+    except TokenBudgetExceeded as te:
+        raise HTTPException(status_code=413, detail=str(te))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/questionnaires/from-profile", response_model=LLMResponse)
 async def post_generate_questionnaire(body: GenerateQuestionnaireRequest):
+    if PROFILE_CATALOG_ENABLED and body.model is None and body.max_output_tokens is None:
+        cached = get_profile_catalog().lookup(QUESTIONNAIRE, body.profile_name, body.profile_description)
+        if cached is not None:
+            return _llm_response(cached.content, cached.prompt, "questionnaire_generate", body.include_used_prompt, UsageTotals())
     try:
-        content, used_prompt = await generate_from_profile(
-            profile_name=body.profile_name,
-            profile_description=body.profile_description,
-            model_override=body.model
-        )
-        return LLMResponse(content=content, used_prompt=used_prompt)
+        with usage_scope() as usage:
+            content, used_prompt = await generate_from_profile(
+                profile_name=body.profile_name,
+                profile_description=body.profile_description,
+                model_override=body.model,
+                max_output_tokens=body.max_output_tokens,
+            )
+        return _llm_response(content, used_prompt, "questionnaire_generate", body.include_used_prompt, usage)
+    except TokenBudgetExceeded as te:
+        raise HTTPException(status_code=413, detail=str(te))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/questionnaires/update", response_model=LLMResponse)
 async def post_update_questionnaire(body: UpdateQuestionnaireRequest):
     try:
-        content, used_prompt = await update_questionnaire(
-            questionnaire_md=body.questionnaire,
-            description_update=body.description_update,
-            model_override=body.model
-        )
-        return LLMResponse(content=content, used_prompt=used_prompt)
+        with usage_scope() as usage:
+            content, used_prompt = await update_questionnaire(
+                questionnaire_md=body.questionnaire,
+                description_update=body.description_update,
+                model_override=body.model,
+                max_output_tokens=body.max_output_tokens,
+            )
+        return _llm_response(content, used_prompt, "questionnaire_update", body.include_used_prompt, usage)
+    except TokenBudgetExceeded as te:
+        raise HTTPException(status_code=413, detail=str(te))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/analyze", response_model=LLMResponse)
 async def post_analyze_message(body: AnalyzeRequest):
     try:
-        content, used_prompt = await analyze(
-            profile_key=body.profile_key,
-            message=body.message,
-            model_override=body.model
-        )
-        return LLMResponse(content=content, used_prompt=used_prompt)
+        with usage_scope() as usage:
+            # o lote compartilha um único max_tokens; limites por item vão direto
+            if ANALYZE_MICROBATCH_ENABLED and body.max_output_tokens is None:
+                content, used_prompt = await get_analyze_batcher().submit(
+                    profile_key=body.profile_key,
+                    message=body.message,
+                    model_override=body.model,
+                )
+            else:
+                content, used_prompt = await analyze(
+                    profile_key=body.profile_key,
+                    message=body.message,
+                    model_override=body.model,
+                    max_output_tokens=body.max_output_tokens,
+                )
+        return _llm_response(content, used_prompt, f"analyze:{body.profile_key}", body.include_used_prompt, usage)
+    except TokenBudgetExceeded as te:
+        raise HTTPException(status_code=413, detail=str(te))
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/questionnaires/register", response_model=RegisterQuestionnaireResponse)
+async def post_register_questionnaire(body: RegisterQuestionnaireRequest):
+    item = await get_questionnaire_store().register(body.questionnaire)
+    return RegisterQuestionnaireResponse(questionnaire_id=item.id, criteria=item.criteria)
+
+@app.post("/analyze/bulk", response_model=AnalyzeBulkResponse)
+async def post_analyze_bulk(body: AnalyzeBulkRequest):
+    with usage_scope() as usage:
+        outcomes = await analyze_many([
+            (i.profile_key, i.message, i.model, i.max_output_tokens) for i in body.items
+        ])
+
+    results = []
+    for index, (item, outcome) in enumerate(zip(body.items, outcomes)):
+        if isinstance(outcome, TokenBudgetExceeded):
+            results.append(AnalyzeBulkResult(index=index, error=str(outcome), status_code=413))
+        elif isinstance(outcome, ValueError):
+            results.append(AnalyzeBulkResult(index=index, error=str(outcome), status_code=400))
+        elif isinstance(outcome, Exception):
+            results.append(AnalyzeBulkResult(index=index, error=str(outcome), status_code=500))
+        else:
+            content, used_prompt = outcome
+            include = body.include_used_prompt if item.include_used_prompt is None else item.include_used_prompt
+            results.append(AnalyzeBulkResult(
+                index=index,
+                content=content,
+                prompt_hash=prompt_hash(used_prompt),
+                used_prompt=used_prompt if include else None,
+            ))
+    return AnalyzeBulkResponse(results=results, usage=TokenUsage(**usage.as_dict()))
+
 @app.post("/evaluation", response_model=EvaluationResponse)
 async def post_questionnaire_with_image(body: EvaluationRequest):
     try:
-        response_message = await evaluate_image(body.questionnaire, body.imageBase64)
+        stored = await get_questionnaire_store().resolve(body.questionnaire, body.questionnaire_id)
+    except KeyError as ke:
+        raise HTTPException(status_code=404, detail=str(ke.args[0]))
+
+    try:
+        with usage_scope() as usage:
+            if body.samples > 1:
+                sampled = await evaluate_image_samples(
+                    stored.questionnaire,
+                    body.imageBase64,
+                    body.samples,
+                    prompt=stored.prompt,
+                    criteria=stored.criteria,
+                    model_override=body.model,
+                    max_output_tokens=body.max_output_tokens,
+                )
+                return EvaluationResponse(
+                    message=sampled.message,
+                    usage=TokenUsage(**usage.as_dict()),
+                    samples=sampled.samples,
+                    consensus=sampled.consensus,
+                )
+
+            response_message, response_id = await evaluate_image(
+                stored.questionnaire,
+                body.imageBase64,
+                prompt=stored.prompt,
+                criteria=stored.criteria,
+                model_override=body.model,
+                max_output_tokens=body.max_output_tokens,
+            )
 
+        # contexto local para follow-ups caso o estado no provedor expire
+        session_id = get_evaluation_sessions().remember(
+            response_id,
+            EvaluationSession(prompt=stored.prompt, image_base64=body.imageBase64, evaluation=response_message),
+        )
         return EvaluationResponse(
             message=response_message,
+            usage=TokenUsage(**usage.as_dict()),
+            response_id=session_id,
         )
     except HTTPException:
         raise
+    except TokenBudgetExceeded as te:
+        raise HTTPException(status_code=413, detail=str(te))
+    except ValueError as ve:
+        # Avaliação incompleta mesmo após reparos (modo estrito)
+        raise HTTPException(status_code=502, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal error: {e}")
 
+@app.post("/evaluation/follow-up", response_model=EvaluationFollowUpResponse)
+async def post_evaluation_follow_up(body: EvaluationFollowUpRequest):
+    try:
+        with usage_scope() as usage:
+            message, response_id, replayed = await follow_up(
+                body.response_id,
+                body.question,
+                model_override=body.model,
+                max_output_tokens=body.max_output_tokens,
+            )
+        return EvaluationFollowUpResponse(
+            message=message,
+            response_id=response_id,
+            replayed=replayed,
+            usage=TokenUsage(**usage.as_dict()),
+        )
+    except KeyError as ke:
+        raise HTTPException(status_code=404, detail=str(ke.args[0]))
+    except TokenBudgetExceeded as te:
+        raise HTTPException(status_code=413, detail=str(te))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {e}")
+
+@app.post("/evaluation/multi", response_model=EvaluationMultiResponse)
+async def post_questionnaire_with_images(body: EvaluationMultiRequest):
+    try:
+        stored = await get_questionnaire_store().resolve(body.questionnaire, body.questionnaire_id)
+    except KeyError as ke:
+        raise HTTPException(status_code=404, detail=str(ke.args[0]))
+
+    try:
+        with usage_scope() as usage:
+            evaluations = await evaluate_images(
+                stored.questionnaire,
+                body.images,
+                prompt=stored.prompt,
+                criteria=stored.criteria,
+                model_override=body.model,
+                max_output_tokens=body.max_output_tokens,
+                group_size=body.group_size,
+            )
+    except TokenBudgetExceeded as te:
+        raise HTTPException(status_code=413, detail=str(te))
+
+    results = []
+    for ev in evaluations:
+        if isinstance(ev.error, TokenBudgetExceeded):
+            results.append(EvaluationMultiResult(index=ev.index, error=str(ev.error), status_code=413))
+        elif isinstance(ev.error, ValueError):
+            results.append(EvaluationMultiResult(index=ev.index, error=str(ev.error), status_code=502))
+        elif ev.error is not None:
+            results.append(EvaluationMultiResult(index=ev.index, error=str(ev.error), status_code=500))
+        else:
+            results.append(EvaluationMultiResult(index=ev.index, message=ev.message))
+    return EvaluationMultiResponse(results=results, usage=TokenUsage(**usage.as_dict()))
+
 @app.post(
     "/reports/executive",
     response_model=ExecutiveReportResponse,
     summary="Gera Relatório Executivo Consolidado a partir de até 10 resultados",
 )
 async def create_executive_report(payload: ExecutiveReportRequest) -> ExecutiveReportResponse:
-    report = await generate_executive_report(payload.results)
-    return ExecutiveReportResponse(report=report)
+    try:
+        with usage_scope() as usage:
+            report = await generate_executive_report(payload.results)
+    except TokenBudgetExceeded as te:
+        raise HTTPException(status_code=413, detail=str(te))
+    return ExecutiveReportResponse(report=report, usage=TokenUsage(**usage.as_dict()))
 
 @app.post(
     "/evaluation/consolidate",
@@ -125,7 +415,13 @@ async def consolidate_evaluations(payload: ConsolidateEvaluationsRequest) -> Con
     if not payload.messages:
         raise HTTPException(status_code=400, detail="Lista de mensagens vazia.")
 
-    agg = aggregate_evaluations(payload.messages)
+    # parse, estatísticas e bootstrap são CPU puro: fora do event loop
+    agg = await asyncio.to_thread(
+        aggregate_evaluations,
+        payload.messages,
+        bootstrap_iterations=payload.bootstrap_iterations,
+        bootstrap_seed=payload.bootstrap_seed,
+    )
 
     return ConsolidateEvaluationsResponse(
         overall=agg["overall"],
@@ -134,4 +430,27 @@ async def consolidate_evaluations(payload: ConsolidateEvaluationsRequest) -> Con
         common_positives=agg["common_positives"],
         alerts=agg["alerts"],
         diagnosis_markdown=agg["diagnosis_markdown"],
+        reliability=agg["reliability"],
+    )
+
+@app.post(
+    "/evaluation/consolidate/export",
+    summary="Exporta notas (mensagem × critério) ou estatísticas por critério em CSV, Arrow ou Parquet",
+    response_class=StreamingResponse,
+)
+async def export_consolidated_evaluations(payload: ConsolidateExportRequest):
+    if not payload.messages:
+        raise HTTPException(status_code=400, detail="Lista de mensagens vazia.")
+
+    try:
+        chunks = export_consolidation(payload.messages, table=payload.table, fmt=payload.format)
+    except RuntimeError as re:
+        # pyarrow ausente
+        raise HTTPException(status_code=501, detail=str(re))
+
+    media_type, ext = EXPORT_FORMATS[payload.format]
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="consolidation_{payload.table}.{ext}"'},
     )
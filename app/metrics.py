@@ -0,0 +1,68 @@
+"""
+Métricas simples em memória (por processo).
+
+Sem dependências externas: contadores e observações (latência, tamanhos etc.)
+expostos em JSON via `GET /metrics`.
+"""
+from __future__ import annotations
+
+import math
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict
+
+# quantas observações recentes manter por série (para percentis)
+_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters: Dict[str, int] = defaultdict(int)
+_observations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=_WINDOW))
+_totals: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "sum": 0.0, "max": 0.0})
+
+
+def incr(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float) -> None:
+    with _lock:
+        _observations[name].append(value)
+        t = _totals[name]
+        t["count"] += 1
+        t["sum"] += value
+        t["max"] = max(t["max"], value)
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    idx = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        obs = {k: sorted(v) for k, v in _observations.items()}
+        totals = {k: dict(v) for k, v in _totals.items()}
+
+    summaries = {}
+    for name, values in obs.items():
+        t = totals[name]
+        summaries[name] = {
+            "count": int(t["count"]),
+            "mean": t["sum"] / t["count"] if t["count"] else None,
+            "max": t["max"],
+            "p50": _percentile(values, 0.50),
+            "p95": _percentile(values, 0.95),
+            "p99": _percentile(values, 0.99),
+        }
+    return {"counters": counters, "observations": summaries}
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _observations.clear()
+        _totals.clear()
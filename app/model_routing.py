@@ -0,0 +1,326 @@
+"""
+Roteamento de modelos por caso de uso.
+
+A política vem de um arquivo JSON (MODEL_ROUTING_FILE) no formato:
+
+{
+  "tiers": {"flagship": "gpt-5.2-2025-12-11", "fast": "gpt-4.1-mini"},
+  "routes": {
+    "suggest_profile_name": {"primary": "fast", "fallback": "flagship", "latency_budget_s": 4},
+    "evaluate_image": {"primary": "flagship", "fallback": "fast", "latency_budget_s": 60}
+  }
+}
+
+`primary`/`fallback` aceitam o nome de um tier ou o nome do modelo. Se o
+primário estourar `latency_budget_s` ou falhar, a chamada é refeita no
+fallback. Sem arquivo (ou rota ausente), tudo usa `get_model()`.
+
+Backends (veja `app.llm_backends`) entram no mesmo arquivo:
+
+{
+  "backends": {"onprem": {"base_url": "http://10.0.0.5:8000/v1", "api_key_env": "ONPREM_API_KEY",
+                          "responses_api": false, "default_model": "qwen2.5-vl-72b"}},
+  "routes": {"analyze": {"primary": "fast", "backend": "onprem", "fallback_backend": "openai"}},
+  "tenants": {"acme": {"backend": "onprem", "tiers": {"flagship": "qwen2.5-vl-72b"}}}
+}
+
+A rota escolhe `backend` (padrão "openai") e, opcionalmente,
+`fallback_backend`; sem `fallback` de modelo, o fallback para outro backend
+usa o mesmo modelo (ou o `default_model` dele). Um tenant (header
+LLM_TENANT_HEADER) com `backend` próprio sobrepõe o da rota e, sem
+`fallback_backend` explícito, nunca cai para outro backend (residência de
+dados). Backends fora de uso (ver `LLMBackend.healthy`) são pulados direto
+para o fallback.
+
+O serviço não autentica quem chama: o header de tenant vem da API
+chamadora. Sem `tenants` na política nem LLM_TENANT_SECRET, o header é
+ignorado (rotas padrão). Caso contrário ele é verificado: com
+LLM_TENANT_SECRET, o tenant só vale com a assinatura HMAC-SHA256 (hex) do id
+no header LLM_TENANT_SIGNATURE_HEADER; sem ela, ou com um tenant que a
+política não declara, a requisição é recusada com 403 em vez de seguir para
+o backend padrão. Caminhos operacionais (EXEMPT_PATHS) não são verificados.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+from app import metrics
+from app.admission import EXEMPT_PATHS
+from app.llm_backends import DEFAULT_BACKEND, LLMBackend, build_backends, is_backend_fault
+from app.openai_client import get_model
+from app.tokens import record_usage
+
+logger = logging.getLogger("model_routing")
+
+MODEL_ROUTING_FILE = os.getenv("MODEL_ROUTING_FILE", "")
+LLM_TENANT_HEADER = os.getenv("LLM_TENANT_HEADER", "x-tenant-id").lower()
+# Segredo compartilhado com a API chamadora para assinar o tenant (vazio = header confiável)
+LLM_TENANT_SECRET = os.getenv("LLM_TENANT_SECRET", "")
+LLM_TENANT_SIGNATURE_HEADER = os.getenv("LLM_TENANT_SIGNATURE_HEADER", "x-tenant-signature").lower()
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Route:
+    primary: str
+    fallback: Optional[str] = None
+    latency_budget_s: Optional[float] = None
+    backend: str = DEFAULT_BACKEND
+    fallback_backend: Optional[str] = None
+
+
+_policy: Optional[dict] = None
+_backends: Optional[Dict[str, LLMBackend]] = None
+_tenant: ContextVar[Optional[str]] = ContextVar("llm_tenant", default=None)
+# Falso em chamadas de fundo (aquecimento), que não afetam a saúde dos backends
+_health_accounting: ContextVar[bool] = ContextVar("llm_health_accounting", default=True)
+
+
+def load_policy(path: str = MODEL_ROUTING_FILE) -> dict:
+    if not path:
+        return {"tiers": {}, "routes": {}, "backends": {}, "tenants": {}}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {
+        "tiers": data.get("tiers", {}),
+        "routes": data.get("routes", {}),
+        "backends": data.get("backends", {}),
+        "tenants": data.get("tenants", {}),
+    }
+
+
+def get_policy() -> dict:
+    global _policy
+    if _policy is None:
+        _policy = load_policy()
+    return _policy
+
+
+def set_policy(policy: Optional[dict]) -> None:
+    """Troca a política em memória (None = recarrega do arquivo no próximo uso)."""
+    global _policy, _backends
+    _policy = policy
+    _backends = None
+
+
+def get_backends() -> Dict[str, LLMBackend]:
+    global _backends
+    if _backends is None:
+        _backends = build_backends(get_policy().get("backends", {}))
+    return _backends
+
+
+def get_backend(name: str) -> LLMBackend:
+    backend = get_backends().get(name)
+    if backend is None:
+        raise RuntimeError(f"Backend de LLM desconhecido: {name}")
+    return backend
+
+
+@contextmanager
+def tenant_scope(tenant: Optional[str]) -> Iterator[None]:
+    token = _tenant.set(tenant)
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def current_tenant() -> Optional[str]:
+    return _tenant.get()
+
+
+@contextmanager
+def without_health_accounting() -> Iterator[None]:
+    """Chamadas feitas aqui dentro não contam sucesso nem falha na saúde dos backends."""
+    token = _health_accounting.set(False)
+    try:
+        yield
+    finally:
+        _health_accounting.reset(token)
+
+
+def _record_failure(backend: LLMBackend) -> None:
+    if _health_accounting.get():
+        backend.record_failure()
+
+
+def tenant_signature(tenant: str, secret: str) -> str:
+    """Assinatura esperada no header LLM_TENANT_SIGNATURE_HEADER."""
+    return hmac.new(secret.encode("utf-8"), tenant.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def tenants_enforced() -> bool:
+    """O header de tenant só é lido (e verificado) se houver tenants ou segredo configurados."""
+    return bool(LLM_TENANT_SECRET) or bool(get_policy().get("tenants"))
+
+
+def verify_tenant(tenant: Optional[str], signature: Optional[str]) -> Optional[str]:
+    """
+    Motivo da recusa, ou None se o tenant pode ser usado. Sem tenant não há
+    o que verificar (rotas padrão).
+    """
+    if tenant is None:
+        return None
+    if LLM_TENANT_SECRET:
+        expected = tenant_signature(tenant, LLM_TENANT_SECRET).encode("ascii")
+        if not signature or not hmac.compare_digest(signature.encode("latin-1"), expected):
+            return "Assinatura do tenant ausente ou inválida."
+    if tenant not in get_policy().get("tenants", {}):
+        return f"Tenant desconhecido: {tenant}"
+    return None
+
+
+class TenantMiddleware:
+    """
+    Lê o tenant do header LLM_TENANT_HEADER para a escolha de backend.
+    Tenant não verificado (ver `verify_tenant`) recebe 403: nunca cai no
+    backend padrão.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS or not tenants_enforced():
+            await self.app(scope, receive, send)
+            return
+        tenant = signature = None
+        for key, value in scope.get("headers", ()):
+            name = key.decode("latin-1").lower()
+            if name == LLM_TENANT_HEADER:
+                tenant = value.decode("latin-1").strip() or None
+            elif name == LLM_TENANT_SIGNATURE_HEADER:
+                signature = value.decode("latin-1").strip()
+        refusal = verify_tenant(tenant, signature)
+        if refusal is not None:
+            metrics.incr("tenant.rejected")
+            body = json.dumps({"detail": refusal}, ensure_ascii=False).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 403,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        with tenant_scope(tenant):
+            await self.app(scope, receive, send)
+
+
+def _resolve_model(name: Optional[str], tiers: Dict[str, str]) -> Optional[str]:
+    if not name:
+        return None
+    return tiers.get(name, name)
+
+
+def get_route(route_name: str, model_override: Optional[str] = None) -> Route:
+    policy = get_policy()
+    tenant_cfg = policy.get("tenants", {}).get(current_tenant() or "", {})
+    tiers = {**policy["tiers"], **tenant_cfg.get("tiers", {})}
+    cfg = policy["routes"].get(route_name, {})
+
+    if tenant_cfg.get("backend"):
+        backend = tenant_cfg["backend"]
+        fallback_backend = tenant_cfg.get("fallback_backend") or backend
+    else:
+        backend = cfg.get("backend") or DEFAULT_BACKEND
+        fallback_backend = cfg.get("fallback_backend") or backend
+
+    primary = (
+        model_override
+        or _resolve_model(cfg.get("primary"), tiers)
+        or get_backend(backend).default_model
+        or get_model()
+    )
+    fallback = _resolve_model(cfg.get("fallback"), tiers)
+    if fallback is None and fallback_backend != backend:
+        fallback = get_backend(fallback_backend).default_model or primary
+    if (fallback_backend, fallback) == (backend, primary):
+        fallback = None
+    budget = cfg.get("latency_budget_s")
+    return Route(
+        primary=primary,
+        fallback=fallback,
+        latency_budget_s=float(budget) if budget else None,
+        backend=backend,
+        fallback_backend=fallback_backend if fallback else None,
+    )
+
+
+def _record_success(prefix: str, backend: LLMBackend, model: str, start: float, result) -> None:
+    if _health_accounting.get():
+        backend.record_success()
+    metrics.observe(f"{prefix}.latency_s", time.perf_counter() - start)
+    metrics.incr(f"{prefix}.model.{model}")
+    if backend.name != DEFAULT_BACKEND:
+        metrics.incr(f"{prefix}.backend.{backend.name}")
+    record_usage(result)
+
+
+async def routed_call(
+    route_name: str,
+    call: Callable[[LLMBackend, str], Awaitable[T]],
+    model_override: Optional[str] = None,
+) -> T:
+    """
+    Executa `call(backend, model)` no alvo primário da rota e, se ele falhar,
+    passar do orçamento de latência ou estiver fora de uso, repete no
+    fallback.
+    """
+    route = get_route(route_name, model_override)
+    prefix = f"route.{route_name}"
+    metrics.incr(f"{prefix}.calls")
+    primary = get_backend(route.backend)
+    fallback = get_backend(route.fallback_backend) if route.fallback else None
+
+    start = time.perf_counter()
+    if fallback is not None and not primary.healthy:
+        metrics.incr(f"{prefix}.failover.unhealthy")
+        logger.warning("[%s] backend %s fora de uso; usando %s/%s", route_name, primary.name, fallback.name, route.fallback)
+    else:
+        try:
+            if fallback is not None and route.latency_budget_s:
+                result = await asyncio.wait_for(call(primary, route.primary), timeout=route.latency_budget_s)
+            else:
+                result = await call(primary, route.primary)
+            _record_success(prefix, primary, route.primary, start, result)
+            return result
+        except asyncio.TimeoutError:
+            _record_failure(primary)
+            if fallback is None:
+                metrics.incr(f"{prefix}.errors")
+                raise
+            metrics.incr(f"{prefix}.failover.timeout")
+            logger.warning(
+                "[%s] %s/%s passou de %.1fs; usando %s/%s",
+                route_name, primary.name, route.primary, route.latency_budget_s, fallback.name, route.fallback,
+            )
+        except Exception as e:
+            if is_backend_fault(e):
+                _record_failure(primary)
+            if fallback is None:
+                metrics.incr(f"{prefix}.errors")
+                raise
+            metrics.incr(f"{prefix}.failover.error")
+            logger.exception("[%s] falha em %s/%s; usando %s/%s", route_name, primary.name, route.primary, fallback.name, route.fallback)
+
+    try:
+        result = await call(fallback, route.fallback)
+    except Exception as e:
+        if is_backend_fault(e):
+            _record_failure(fallback)
+        metrics.incr(f"{prefix}.errors")
+        raise
+    _record_success(prefix, fallback, route.fallback, start, result)
+    return result
@@ -1,15 +1,29 @@
+from __future__ import annotations
+
 import os
-from openai import AsyncOpenAI
+from typing import TYPE_CHECKING
+
 from dotenv import load_dotenv
 load_dotenv()
 
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
 openai_api_key = os.getenv("OPENAI_API_KEY")
 openai_model = os.getenv("OPENAI_MODEL", "gpt-5.2-2025-12-11")
 
+_client: AsyncOpenAI | None = None
+
 def get_client() -> AsyncOpenAI:
+    # um único cliente por processo: reaproveita o pool de conexões HTTP
+    global _client
     if not openai_api_key:
         raise RuntimeError("OPENAI_API_KEY não definido no ambiente.")
-    return AsyncOpenAI(api_key=openai_api_key)
+    if _client is None:
+        # import tardio: o SDK da OpenAI é o import mais caro do cold start
+        from openai import AsyncOpenAI
+        _client = AsyncOpenAI(api_key=openai_api_key)
+    return _client
 
 def get_model(override: str | None = None) -> str:
     return override or openai_model
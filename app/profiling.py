@@ -0,0 +1,219 @@
+"""
+Perfilamento sob demanda de requisições (formato speedscope).
+
+Disparo:
+- header `X-Profile: <PROFILING_TOKEN>` ou query `?profile=<PROFILING_TOKEN>`
+  numa requisição: ela é perfilada e a resposta traz `X-Profile-Id`; o
+  perfil é baixado em `GET /debug/profiles/{id}` (mesmo token no header);
+- amostragem aleatória: PROFILING_SAMPLE_RATE (ex.: 0.001) das requisições
+  são perfiladas e gravadas em PROFILING_DIR.
+
+O perfilador é de amostragem: uma thread lê a pilha da thread do event loop
+a cada PROFILING_INTERVAL_S (`sys._current_frames`). Cada amostra pesa o
+tempo real desde a anterior: com o GIL ocupado pelo loop, a thread
+amostradora acorda atrasada, e contar só amostras subestimaria justamente
+o trabalho de CPU. O perfil mostra tudo o
+que o loop executou enquanto a requisição estava em curso (inclusive outras
+requisições concorrentes e a espera em I/O, que aparece no `select`); o que
+roda em `asyncio.to_thread` não entra. Sem token nem taxa configurados, o
+middleware nem é instalado.
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs
+
+from app import metrics
+
+logger = logging.getLogger("profiling")
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_INTERVAL_S = float(os.getenv("PROFILING_INTERVAL_S", "0.001"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "") or os.path.join(tempfile.gettempdir(), "cognalyze-profiles")
+# perfis mantidos em disco (os mais antigos são apagados)
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "200"))
+
+PROFILING_ENABLED = bool(PROFILING_TOKEN) or PROFILING_SAMPLE_RATE > 0
+
+PROFILE_ID_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+Frame = Tuple[str, str, int]
+
+
+class StackSampler:
+    """
+    Amostra periodicamente a pilha de uma thread e agrega pilhas idênticas,
+    somando o tempo decorrido desde a amostra anterior.
+    """
+
+    def __init__(self, thread_id: int, interval_s: float = PROFILING_INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        # pilha -> segundos atribuídos
+        self.elapsed: Dict[Tuple[Frame, ...], float] = defaultdict(float)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+        self.started_at = 0.0
+        self.duration_s = 0.0
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration_s = time.perf_counter() - self.started_at
+
+    def _run(self) -> None:
+        last = self.started_at
+        while not self._stop.wait(self.interval_s):
+            now = time.perf_counter()
+            delta, last = now - last, now
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[Frame] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                stack.reverse()  # raiz primeiro
+                self.elapsed[tuple(stack)] += delta
+
+    def to_speedscope(self, name: str) -> dict:
+        frame_index: Dict[Frame, int] = {}
+        frames: List[dict] = []
+        samples: List[List[int]] = []
+        weights: List[float] = []
+        for stack, seconds in sorted(self.elapsed.items(), key=lambda item: item[1], reverse=True):
+            ids = []
+            for fr in stack:
+                idx = frame_index.get(fr)
+                if idx is None:
+                    idx = frame_index[fr] = len(frames)
+                    frames.append({"name": fr[0], "file": fr[1], "line": fr[2]})
+                ids.append(idx)
+            samples.append(ids)
+            weights.append(seconds)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "cognalyze-profiling",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+def token_matches(value: Union[str, bytes, None]) -> bool:
+    """
+    Compara bytes (`compare_digest` recusa `str` não ASCII). `str` vem de
+    headers já decodificados em latin-1, como no Starlette.
+    """
+    if not PROFILING_TOKEN or value is None:
+        return False
+    if isinstance(value, str):
+        try:
+            value = value.encode("latin-1")
+        except UnicodeEncodeError:
+            return False
+    return hmac.compare_digest(value, PROFILING_TOKEN.encode("utf-8"))
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Caminho do perfil gravado (None se o id for inválido ou não existir)."""
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    path = os.path.join(PROFILING_DIR, f"{profile_id}.speedscope.json")
+    return path if os.path.isfile(path) else None
+
+
+def _store(profile_id: str, profile: dict) -> None:
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    with open(os.path.join(PROFILING_DIR, f"{profile_id}.speedscope.json"), "w", encoding="utf-8") as f:
+        json.dump(profile, f)
+
+    files = sorted(
+        (os.path.join(PROFILING_DIR, n) for n in os.listdir(PROFILING_DIR) if n.endswith(".speedscope.json")),
+        key=os.path.getmtime,
+    )
+    for old in files[:-PROFILING_MAX_FILES]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def _trigger(self, scope) -> Optional[str]:
+        if PROFILING_TOKEN:
+            for key, value in scope.get("headers", ()):
+                if key == b"x-profile":
+                    if token_matches(value):
+                        return "request"
+                    break
+            qs = scope.get("query_string", b"")
+            if b"profile=" in qs:
+                values = parse_qs(qs).get(b"profile", [])
+                if values and token_matches(values[0]):
+                    return "request"
+        if PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{slug}-{uuid.uuid4().hex[:8]}"
+
+        async def profiled_send(message):
+            if message["type"] == "http.response.start" and trigger == "request":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode("ascii"))]
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+        try:
+            await self.app(scope, receive, profiled_send)
+        finally:
+            sampler.stop()
+            metrics.incr(f"profiling.{trigger}")
+            name = f"{scope['method']} {path} ({sampler.duration_s * 1000:.0f} ms)"
+            try:
+                # montar e gravar o JSON fora do event loop
+                await asyncio.to_thread(lambda: _store(profile_id, sampler.to_speedscope(name)))
+            except OSError:
+                logger.exception("[profiling] falha ao gravar o perfil %s", profile_id)
+            else:
+                logger.info("[profiling] perfil %s gravado (%s)", profile_id, trigger)
@@ -1,3 +1,5 @@
+import hashlib
+
 PROMPTS = {
     "tea": """
     Você é um especialista em acessibilidade cognitiva e sua função é analisar a imagem fornecida com **foco exclusivo em acessibilidade para pessoas com Transtorno do Espectro Autista (TEA)**, seguindo as diretrizes **WCAG (Web Content Accessibility Guidelines)**, **COGA (Cognitive Accessibility User Research)** e **GAIA (Global Accessibility Guidelines for Autism)**.
@@ -199,3 +201,34 @@ PROMPTS = {
 
     """
 }
+
+
+# Perfis embutidos: nome e descrição canônicos usados para gerar o catálogo
+# pré-computado (questionário e diretrizes) — ver profile_catalog_usecase
+BUILTIN_PROFILES = {
+    "tea": (
+        "Transtorno do Espectro Autista (TEA)",
+        "Pessoas no espectro autista: sensibilidade a estímulos sensoriais, preferência por previsibilidade, "
+        "rotinas e linguagem literal; dificuldade com ambiguidade, mudanças inesperadas e excesso de informação.",
+    ),
+    "tdah": (
+        "Transtorno do Déficit de Atenção e Hiperatividade (TDAH)",
+        "Pessoas com TDAH: atenção facilmente desviada por distrações, dificuldade em manter o foco em tarefas longas, "
+        "memória de trabalho limitada e impaciência com processos com muitas etapas ou tempo limitado.",
+    ),
+    "dislexia": (
+        "Dislexia",
+        "Pessoas com dislexia: dificuldade de decodificação e leitura fluente, sensibilidade a fontes, espaçamento, "
+        "contraste e blocos longos de texto; beneficiam-se de linguagem simples e apoio visual.",
+    ),
+    "acessibilidade_cognitiva": (
+        "Acessibilidade Cognitiva",
+        "Pessoas com limitações cognitivas em geral (memória, atenção, compreensão de linguagem, resolução de problemas): "
+        "precisam de conteúdo claro, navegação consistente, prevenção de erros e ajuda disponível.",
+    ),
+}
+
+
+def prompt_hash(prompt: str) -> str:
+    """Impressão digital curta do prompt enviado (para correlacionar sem ecoar o texto)."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,284 @@
+"""
+Gravação de tráfego para testes de carga reproduzíveis (cassetes).
+
+Com RECORD_CASSETTE definido, o `RecorderMiddleware` grava cada requisição
+aos endpoints (corpo sanitizado, status, latência) e os backends de LLM
+gravam cada troca com o provedor (resposta e latência) num arquivo
+JSONL. `scripts/replay_load.py` usa o cassete para subir um backend
+substituto que devolve as mesmas respostas com as latências originais e
+dirigir a aplicação com concorrência configurável.
+
+Sanitização: só os headers `content-type` e o de tenant são mantidos; os
+campos de RECORD_REDACT_FIELDS (imagens, por padrão) viram uma imagem 1×1 e
+todo texto (query, corpos e respostas do LLM) vira um marcador do mesmo
+tamanho com uma impressão digital (HMAC com chave aleatória do processo:
+textos iguais têm o mesmo marcador, mas não dá para confirmar um palpite
+fora do processo). Ficam como vieram só os identificadores de
+RECORD_KEEP_FIELDS. RECORD_VERBATIM_TEXT=1 grava o texto original. O
+parâmetro `profile` (token de perfilamento) nunca é gravado.
+
+As trocas com o LLM são associadas no replay por uma impressão digital do
+texto enviado (`llm_fingerprint`), que ignora as imagens. Com o texto
+redigido, o prompt montado no replay não é o gravado: as respostas são
+servidas por tipo, sem associação exata.
+
+A serialização e a escrita rodam numa thread própria; o event loop só
+enfileira (fila limitada; o excedente é descartado e contado).
+"""
+from __future__ import annotations
+
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from app import metrics
+from app.admission import EXEMPT_PATHS
+
+logger = logging.getLogger("recording")
+
+RECORD_CASSETTE = os.getenv("RECORD_CASSETTE", "")
+RECORD_REDACT_FIELDS = {f.strip() for f in os.getenv("RECORD_REDACT_FIELDS", "imageBase64,images").split(",") if f.strip()}
+# Campos de texto gravados como vieram (identificadores, não conteúdo)
+RECORD_KEEP_FIELDS = {
+    f.strip()
+    for f in os.getenv("RECORD_KEEP_FIELDS", "model,profile_key,questionnaire_id,response_id").split(",")
+    if f.strip()
+}
+# Se "1", mensagens, questionários e respostas do LLM são gravados sem redação
+RECORD_VERBATIM_TEXT = os.getenv("RECORD_VERBATIM_TEXT", "0") in ("1", "true", "True")
+# Registros aguardando a thread de escrita (além disso, são descartados)
+RECORD_QUEUE_MAX_ITEMS = int(os.getenv("RECORD_QUEUE_MAX_ITEMS", "10000"))
+
+# Campos com texto gerado nas respostas do SDK (Chat Completions e Responses)
+_LLM_TEXT_FIELDS = {"content", "text", "output_text", "refusal", "arguments"}
+# Parâmetros de query nunca gravados (`profile` carrega o PROFILING_TOKEN)
+_DROPPED_QUERY_PARAMS = {"profile"}
+_REDACT_KEY = secrets.token_bytes(16)
+
+# PNG 1×1 transparente
+PLACEHOLDER_IMAGE = (
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+_KEPT_HEADERS = {"content-type", os.getenv("LLM_TENANT_HEADER", "x-tenant-id").lower()}
+
+
+def _text_parts(value: Any) -> list:
+    """Textos de mensagens Chat/Responses, na ordem; partes de imagem são ignoradas."""
+    if isinstance(value, str):
+        return [value]
+    out = []
+    if isinstance(value, list):
+        for item in value:
+            if isinstance(item, str):
+                out.append(item)
+            elif isinstance(item, dict):
+                if item.get("type") in ("text", "input_text", "output_text"):
+                    out.append(item.get("text", ""))
+                elif "content" in item:
+                    out.append(f"<{item.get('role', '')}>")
+                    out.extend(_text_parts(item["content"]))
+    return out
+
+
+def llm_fingerprint(kind: str, payload: Dict[str, Any]) -> str:
+    """Mesma chave na gravação (kwargs do SDK) e no replay (JSON recebido pelo substituto)."""
+    texts = _text_parts(payload.get("messages") if kind == "chat" else payload.get("input"))
+    if payload.get("instructions"):
+        texts.insert(0, payload["instructions"])
+    h = hashlib.sha256(kind.encode("utf-8"))
+    for t in texts:
+        h.update(b"\x00")
+        h.update(t.encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def _to_jsonable(result: Any) -> Any:
+    if hasattr(result, "model_dump"):
+        return result.model_dump(mode="json")
+    if hasattr(result, "__dataclass_fields__"):
+        from dataclasses import asdict
+        return asdict(result)
+    return result
+
+
+def redact_text(text: str) -> str:
+    """Marcador com o mesmo tamanho do texto (o tamanho pesa em orçamentos e compressão)."""
+    digest = hmac.new(_REDACT_KEY, text.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+    marker = f"<redigido:{digest}>"
+    return marker + "x" * (len(text) - len(marker))
+
+
+def _redact_strings(value: Any, keep: Callable[[str], bool], key: str = "") -> Any:
+    """Redige as strings de `value` (recursivo); `keep(campo)` preserva as do campo."""
+    if isinstance(value, str):
+        return value if keep(key) else redact_text(value)
+    if isinstance(value, list):
+        return [_redact_strings(v, keep, key) for v in value]
+    if isinstance(value, dict):
+        return {k: _redact_strings(v, keep, k) for k, v in value.items()}
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    # objeto sem forma JSON: seria gravado como str(), com o texto dentro
+    return redact_text(str(value))
+
+
+def sanitize_body(body: bytes) -> Optional[str]:
+    if not body:
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if isinstance(data, dict):
+        for name in RECORD_REDACT_FIELDS & data.keys():
+            value = data[name]
+            if isinstance(value, list):
+                data[name] = [PLACEHOLDER_IMAGE if isinstance(v, str) else v for v in value]
+            elif isinstance(value, str):
+                data[name] = PLACEHOLDER_IMAGE
+    if not RECORD_VERBATIM_TEXT:
+        data = _redact_strings(data, lambda k: k in RECORD_KEEP_FIELDS or k in RECORD_REDACT_FIELDS)
+    return json.dumps(data, ensure_ascii=False)
+
+
+def sanitize_query(query_string: bytes) -> str:
+    """Query com a mesma regra do corpo; parâmetros secretos são removidos."""
+    if not query_string:
+        return ""
+    params = [
+        (k, v if RECORD_VERBATIM_TEXT or k in RECORD_KEEP_FIELDS else redact_text(v))
+        for k, v in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+        if k not in _DROPPED_QUERY_PARAMS
+    ]
+    return urlencode(params)
+
+
+def sanitize_llm_response(response: Any) -> Any:
+    """Resposta do SDK (já em JSON) com o texto gerado redigido; ids e metadados ficam."""
+    if RECORD_VERBATIM_TEXT:
+        return response
+    return _redact_strings(response, lambda k: k not in _LLM_TEXT_FIELDS)
+
+
+class CassetteRecorder:
+    """
+    Grava registros JSONL numa thread própria. Quem chama só enfileira uma
+    função que monta o registro; a montagem (serialização, redação) e a
+    escrita ficam fora do event loop.
+    """
+
+    def __init__(self, path: str, max_pending: int = RECORD_QUEUE_MAX_ITEMS):
+        self.path = path
+        self._queue: "queue.Queue[Optional[Callable[[], Dict[str, Any]]]]" = queue.Queue(maxsize=max(1, max_pending))
+        self._file = open(path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="cassette-writer", daemon=True)
+        self._thread.start()
+
+    def _submit(self, build: Callable[[], Dict[str, Any]]) -> None:
+        try:
+            self._queue.put_nowait(build)
+        except queue.Full:
+            metrics.incr("recording.dropped")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._submit(lambda: record)
+
+    def _run(self) -> None:
+        while True:
+            build = self._queue.get()
+            if build is None:
+                break
+            try:
+                self._file.write(json.dumps(build(), ensure_ascii=False, default=str) + "\n")
+            except Exception:
+                logger.exception("[recording] falha ao gravar registro")
+            if self._queue.empty():
+                self._file.flush()
+        self._file.close()
+
+    def record_llm(self, kind: str, payload: Dict[str, Any], result: Any, latency_s: float) -> None:
+        # a impressão digital usa o texto original: no replay com texto verbatim, as chamadas batem
+        self._submit(lambda: {
+            "type": "llm",
+            "kind": kind,
+            "fingerprint": llm_fingerprint(kind, payload),
+            "model": payload.get("model"),
+            "latency_s": round(latency_s, 4),
+            "response": sanitize_llm_response(_to_jsonable(result)),
+        })
+
+    def close(self) -> None:
+        """Grava o que estiver na fila e fecha o arquivo."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+_recorder: Optional[CassetteRecorder] = None
+
+
+def get_recorder() -> Optional[CassetteRecorder]:
+    """Gravador ativo (None quando RECORD_CASSETTE não está definido)."""
+    global _recorder
+    if _recorder is None and RECORD_CASSETTE:
+        _recorder = CassetteRecorder(RECORD_CASSETTE)
+        atexit.register(_recorder.close)
+        logger.warning("[recording] gravando tráfego em %s", RECORD_CASSETTE)
+    return _recorder
+
+
+class RecorderMiddleware:
+    """Grava método, caminho, headers mantidos, corpo sanitizado, status e latência."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        recorder = get_recorder()
+        if scope["type"] != "http" or recorder is None or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        chunks = []
+        status = {"code": 0}
+
+        async def recording_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def recording_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, recording_receive, recording_send)
+        finally:
+            headers = {
+                k.decode("latin-1").lower(): v.decode("latin-1")
+                for k, v in scope.get("headers", ())
+                if k.decode("latin-1").lower() in _KEPT_HEADERS
+            }
+            body = b"".join(chunks)
+            record = {
+                "type": "request",
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": sanitize_query(scope.get("query_string", b"")),
+                "headers": headers,
+                "status": status["code"],
+                "latency_s": round(time.perf_counter() - start, 4),
+            }
+            recorder._submit(lambda: {**record, "body": sanitize_body(body)})
@@ -1,6 +1,14 @@
 from typing import List, Optional, Literal, Any, Dict
 from pydantic import BaseModel, Field, validator
 
+class TokenUsage(BaseModel):
+    input_tokens: int = Field(0, description="Tokens de entrada reportados pelo provedor (todas as chamadas)")
+    output_tokens: int = Field(0, description="Tokens de saída reportados pelo provedor")
+    cached_tokens: int = Field(0, description="Tokens de entrada servidos do cache de prompt")
+    estimated_input_tokens: int = Field(0, description="Estimativa local dos tokens de entrada (texto)")
+    calls: int = Field(0, description="Chamadas ao LLM feitas para atender a requisição")
+    shared_calls: int = Field(0, description="Dessas, chamadas compartilhadas com outras requisições (micro-batching); os tokens delas são uma cota proporcional")
+
 class ExistingProfile(BaseModel):
     name: str = Field(..., description="Nome do perfil existente")
     description: Optional[str] = Field(None, description="Descrição do perfil existente (se houver)")
@@ -9,44 +17,161 @@ class ProfileSuggestRequest(BaseModel):
     description: str = Field(..., description="Descrição do usuário para classificar/sugerir perfil")
     existing_profiles: List[ExistingProfile] = Field(default_factory=list, description="Lista de perfis já existentes (opcional)")
     name: Optional[str] = Field(None, description="Nome proposto pelo cliente (opcional)")
+    model: Optional[str] = Field(None, description="Modelo OpenAI opcional para override")
 
 class ProfileSuggestResponse(BaseModel):
     name: str = Field(..., description="Nome do perfil escolhido/sugerido")
+    usage: Optional[TokenUsage] = None
 
 class GenerateQuestionnaireRequest(BaseModel):
     profile_name: str = Field(..., description="Nome do perfil")
     profile_description: str = Field(..., description="Descrição do perfil")
     model: Optional[str] = Field(None, description="Modelo OpenAI opcional para override")
+    include_used_prompt: bool = Field(False, description="Devolve o prompt completo em 'used_prompt'")
+    max_output_tokens: Optional[int] = Field(None, gt=0, description="Limite de tokens de saída (só reduz o orçamento da rota)")
 
 class UpdateQuestionnaireRequest(BaseModel):
     questionnaire: str = Field(..., description="Questionário em Markdown para ser atualizado")
     description_update: str = Field(..., description="Nova descrição/observações para atualizar o questionário")
     model: Optional[str] = Field(None, description="Modelo OpenAI opcional para override")
+    include_used_prompt: bool = Field(False, description="Devolve o prompt completo em 'used_prompt'")
+    max_output_tokens: Optional[int] = Field(None, gt=0, description="Limite de tokens de saída (só reduz o orçamento da rota)")
 
 class AnalyzeRequest(BaseModel):
     profile_key: Literal["tea","tdah","dislexia","acessibilidade_cognitiva","outro"]
     message: str
     model: Optional[str] = None
+    include_used_prompt: bool = Field(False, description="Devolve o prompt completo em 'used_prompt'")
+    max_output_tokens: Optional[int] = Field(None, gt=0, description="Limite de tokens de saída (só reduz o orçamento da rota)")
 
 class LLMResponse(BaseModel):
     content: str
-    used_prompt: str
+    prompt_id: str = Field(..., description="Identificador do template de prompt usado")
+    prompt_hash: str = Field(..., description="sha256 (16 hex) do prompt efetivamente enviado")
+    used_prompt: Optional[str] = Field(None, description="Prompt completo (apenas com include_used_prompt=true)")
+    usage: Optional[TokenUsage] = None
+
+ANALYZE_BULK_MAX_ITEMS = 1000
+
+class AnalyzeBulkItem(AnalyzeRequest):
+    include_used_prompt: Optional[bool] = Field(None, description="Sobrescreve 'include_used_prompt' da requisição para este item")
+
+class AnalyzeBulkRequest(BaseModel):
+    items: List[AnalyzeBulkItem] = Field(..., description=f"Mensagens a analisar (1 a {ANALYZE_BULK_MAX_ITEMS})")
+    include_used_prompt: bool = Field(False, description="Devolve o prompt usado em cada item")
+
+    @validator("items")
+    def check_items_length(cls, v):
+        if not (1 <= len(v) <= ANALYZE_BULK_MAX_ITEMS):
+            raise ValueError(f"É necessário enviar entre 1 e {ANALYZE_BULK_MAX_ITEMS} itens.")
+        return v
+
+class AnalyzeBulkResult(BaseModel):
+    index: int
+    content: Optional[str] = None
+    prompt_hash: Optional[str] = None
+    used_prompt: Optional[str] = None
+    error: Optional[str] = None
+    status_code: int = 200
+
+class AnalyzeBulkResponse(BaseModel):
+    results: List[AnalyzeBulkResult]
+    usage: Optional[TokenUsage] = None
 
 class CreateProfileRequest(BaseModel):
     name: str = Field(..., description="Nome do perfil")
     description: str = Field(..., description="Descrição resumida do perfil")
     model: Optional[str] = Field(None, description="Modelo OpenAI (override opcional)")
+    max_output_tokens: Optional[int] = Field(None, gt=0, description="Limite de tokens de saída (só reduz o orçamento da rota)")
 
 class CreateProfileResponse(BaseModel):
     guidelines: str = Field(..., description="Diretrizes recomendadas (Markdown)")
     questionnaire: str = Field(..., description="Questionário (Markdown)")
+    usage: Optional[TokenUsage] = None
+
+EVALUATION_MAX_SAMPLES = 8
 
 class EvaluationRequest(BaseModel):
-    questionnaire: str = Field(..., description="Questionnaire in Markdown format")
+    questionnaire: Optional[str] = Field(None, description="Questionnaire in Markdown format")
+    questionnaire_id: Optional[str] = Field(None, description="Id returned by /questionnaires/register (replaces 'questionnaire')")
     imageBase64: str = Field(..., description="Image encoded in base64")
+    model: Optional[str] = Field(None, description="Optional OpenAI model override")
+    max_output_tokens: Optional[int] = Field(None, gt=0, description="Output token cap (can only lower the route budget)")
+    samples: int = Field(1, ge=1, le=EVALUATION_MAX_SAMPLES, description="Self-consistency: number of evaluations of the same image to consolidate")
+
+    @validator("questionnaire_id", always=True)
+    def check_questionnaire_source(cls, v, values):
+        if not v and not values.get("questionnaire"):
+            raise ValueError("Informe 'questionnaire' ou 'questionnaire_id'.")
+        return v
+
+EVALUATION_MULTI_MAX_IMAGES = 20
+
+class EvaluationMultiRequest(BaseModel):
+    questionnaire: Optional[str] = Field(None, description="Questionnaire in Markdown format")
+    questionnaire_id: Optional[str] = Field(None, description="Id returned by /questionnaires/register (replaces 'questionnaire')")
+    images: List[str] = Field(..., description=f"Images encoded in base64 (1 to {EVALUATION_MULTI_MAX_IMAGES})")
+    model: Optional[str] = Field(None, description="Optional OpenAI model override")
+    max_output_tokens: Optional[int] = Field(None, gt=0, description="Output token cap per image (can only lower the route budget)")
+    group_size: Optional[int] = Field(None, ge=1, le=EVALUATION_MULTI_MAX_IMAGES, description="Images per upstream call (default EVALUATION_MULTI_GROUP_SIZE)")
+
+    @validator("questionnaire_id", always=True)
+    def check_questionnaire_source(cls, v, values):
+        if not v and not values.get("questionnaire"):
+            raise ValueError("Informe 'questionnaire' ou 'questionnaire_id'.")
+        return v
+
+    @validator("images")
+    def check_images_length(cls, v):
+        if not (1 <= len(v) <= EVALUATION_MULTI_MAX_IMAGES):
+            raise ValueError(f"É necessário enviar entre 1 e {EVALUATION_MULTI_MAX_IMAGES} imagens.")
+        return v
+
+class EvaluationMultiResult(BaseModel):
+    index: int
+    message: Optional[str] = None
+    error: Optional[str] = None
+    status_code: int = 200
+
+class EvaluationMultiResponse(BaseModel):
+    results: List[EvaluationMultiResult]
+    usage: Optional[TokenUsage] = None
+
+class RegisterQuestionnaireRequest(BaseModel):
+    questionnaire: str = Field(..., description="Questionário em Markdown a ser registrado")
+
+class RegisterQuestionnaireResponse(BaseModel):
+    questionnaire_id: str = Field(..., description="Hash (sha256) do conteúdo do questionário")
+    criteria: List[str] = Field(default_factory=list, description="Títulos dos critérios (headings ###)")
+
+class CriterionConsensus(BaseModel):
+    name: str
+    n: int
+    median: Optional[float] = None
+    mean: Optional[float] = None
+    stdev: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
 
 class EvaluationResponse(BaseModel):
     message: str
+    usage: Optional[TokenUsage] = None
+    response_id: Optional[str] = Field(None, description="Id for /evaluation/follow-up (upstream response id, or a local id for tiled evaluations)")
+    # apenas com samples > 1
+    samples: Optional[List[str]] = None
+    consensus: Optional[List[CriterionConsensus]] = None
+
+class EvaluationFollowUpRequest(BaseModel):
+    response_id: str = Field(..., description="response_id returned by /evaluation or by a previous follow-up")
+    question: str = Field(..., min_length=1, description="Follow-up question or re-score request")
+    model: Optional[str] = Field(None, description="Optional OpenAI model override")
+    max_output_tokens: Optional[int] = Field(None, gt=0, description="Output token cap (can only lower the route budget)")
+
+class EvaluationFollowUpResponse(BaseModel):
+    message: str
+    response_id: str = Field(..., description="Id to continue the conversation")
+    replayed: bool = Field(False, description="True when the upstream state had expired and the context was resent")
+    usage: Optional[TokenUsage] = None
 
 class ResultInput(BaseModel):
     message: str
@@ -64,9 +189,29 @@ class ExecutiveReportRequest(BaseModel):
 
 class ExecutiveReportResponse(BaseModel):
     report: str
+    usage: Optional[TokenUsage] = None
+
+CONSOLIDATE_MAX_MESSAGES = 10000
+
+CONSOLIDATE_MAX_BOOTSTRAP_ITERATIONS = 10000
 
 class ConsolidateEvaluationsRequest(BaseModel):
     messages: List[str] = Field(default_factory=list)
+    bootstrap_iterations: Optional[int] = Field(
+        None, ge=0, le=CONSOLIDATE_MAX_BOOTSTRAP_ITERATIONS,
+        description="Reamostragens do bootstrap dos IC (0 desliga; padrão CONSOLIDATE_BOOTSTRAP_ITERATIONS)",
+    )
+    bootstrap_seed: Optional[int] = Field(None, description="Seed do bootstrap (resultados reprodutíveis)")
+
+    @validator("messages")
+    def check_messages_length(cls, v):
+        if len(v) > CONSOLIDATE_MAX_MESSAGES:
+            raise ValueError(f"No máximo {CONSOLIDATE_MAX_MESSAGES} mensagens por consolidação.")
+        return v
+
+class ConsolidateExportRequest(ConsolidateEvaluationsRequest):
+    table: Literal["scores", "stats"] = Field("scores", description="scores = mensagem × critério (formato longo); stats = estatísticas por critério")
+    format: Literal["csv", "arrow", "parquet"] = Field("csv", description="arrow/parquet requerem o pacote opcional pyarrow")
 
 class CommonItem(BaseModel):
     text: str
@@ -80,11 +225,23 @@ class CriterionStats(BaseModel):
     max: Optional[float] = None
     stdev: Optional[float] = None
     scores: List[float] = Field(default_factory=list)
+    ci_low: Optional[float] = None   # IC bootstrap da média
+    ci_high: Optional[float] = None
 
 class OverallStats(BaseModel):
     mean_by_criteria: Optional[float] = None
     mean_reported_overall: Optional[float] = None  # se veio "Pontuação Geral" nas mensagens
     n_messages: int
+    ci_low: Optional[float] = None   # IC bootstrap de mean_by_criteria
+    ci_high: Optional[float] = None
+
+class ReliabilityStats(BaseModel):
+    krippendorff_alpha: Optional[float] = None  # métrica intervalar, tolera critérios ausentes
+    icc: Optional[float] = None                 # ICC(2,1) sobre a submatriz completa (icc_criteria × icc_evaluations)
+    icc_criteria: int = 0
+    icc_evaluations: int = 0
+    bootstrap_iterations: int = 0
+    confidence: float = 0.95
 
 class AlertItem(BaseModel):
     criterion: str
@@ -96,4 +253,5 @@ class ConsolidateEvaluationsResponse(BaseModel):
     common_problems: List[CommonItem]
     common_positives: List[CommonItem]
     alerts: List[AlertItem]
-    diagnosis_markdown: str
\ No newline at end of file
+    diagnosis_markdown: str
+    reliability: Optional[ReliabilityStats] = None
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+Estimativa local de tokens, orçamentos por rota e contabilização de uso.
+
+- `estimate_tokens`: heurística (~4 caracteres por token, média para
+  português com o tokenizador da OpenAI). Serve para limites, não cobrança.
+- `TokenBudget`/`get_budget`: limite de entrada (rejeita antes de chamar o
+  LLM) e de saída (vira `max_completion_tokens`/`max_output_tokens`) por rota.
+  O limite de saída é o da resposta visível: em modelos de raciocínio
+  (`is_reasoning_model`) o backend soma REASONING_OUTPUT_HEADROOM_TOKENS,
+  porque os tokens de raciocínio contam no mesmo limite.
+- `usage_scope`/`record_usage`: soma o `usage` real de todas as chamadas
+  ao LLM feitas durante uma requisição (inclusive em tarefas paralelas).
+  Uma chamada compartilhada por várias requisições (micro-batching) é
+  dividida com `split_usage` e somada a cada uma (`shared_calls`).
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import math
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+CHARS_PER_TOKEN = 4.0
+
+# JSON opcional para sobrescrever orçamentos: {"analyze": {"max_output_tokens": 800}}
+TOKEN_BUDGET_FILE = os.getenv("TOKEN_BUDGET_FILE", "")
+
+# Prefixos dos modelos de raciocínio (o nome do modelo, sem o prefixo "org/")
+REASONING_MODEL_PREFIXES = tuple(
+    p.strip().lower() for p in os.getenv("REASONING_MODEL_PREFIXES", "o1,o3,o4,gpt-5").split(",") if p.strip()
+)
+# Folga somada ao limite de saída desses modelos, para o raciocínio não consumir a resposta
+REASONING_OUTPUT_HEADROOM_TOKENS = int(os.getenv("REASONING_OUTPUT_HEADROOM_TOKENS", "4000"))
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+class TokenBudgetExceeded(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class TokenBudget:
+    max_input_tokens: int
+    max_output_tokens: int
+    # acréscimo de saída por critério do questionário (rotas de avaliação)
+    output_tokens_per_criterion: int = 0
+
+
+ROUTE_TOKEN_BUDGETS: Dict[str, TokenBudget] = {
+    "analyze": TokenBudget(max_input_tokens=8000, max_output_tokens=1500),
+    "analyze_batch": TokenBudget(max_input_tokens=32000, max_output_tokens=8000),
+    "suggest_profile_name": TokenBudget(max_input_tokens=4000, max_output_tokens=60),
+    "evaluate_image": TokenBudget(max_input_tokens=12000, max_output_tokens=600, output_tokens_per_criterion=40),
+    "evaluate_image_samples": TokenBudget(max_input_tokens=12000, max_output_tokens=600, output_tokens_per_criterion=40),
+    "evaluation_repair": TokenBudget(max_input_tokens=2000, max_output_tokens=600, output_tokens_per_criterion=40),
+    "evaluation_followup": TokenBudget(max_input_tokens=2000, max_output_tokens=800),
+    "evaluation_followup_replay": TokenBudget(max_input_tokens=16000, max_output_tokens=800),
+    "executive_report": TokenBudget(max_input_tokens=12000, max_output_tokens=1200),
+    "create_profile_assets.guidelines": TokenBudget(max_input_tokens=4000, max_output_tokens=1500),
+    "create_profile_assets.questionnaire": TokenBudget(max_input_tokens=8000, max_output_tokens=3000),
+    "questionnaire_generate": TokenBudget(max_input_tokens=8000, max_output_tokens=1800),
+    "questionnaire_update": TokenBudget(max_input_tokens=12000, max_output_tokens=1800),
+    "questionnaire_relevance": TokenBudget(max_input_tokens=4000, max_output_tokens=120),
+}
+
+_DEFAULT_BUDGET = TokenBudget(max_input_tokens=16000, max_output_tokens=2000)
+_budgets: Optional[Dict[str, TokenBudget]] = None
+
+
+def _load_budgets() -> Dict[str, TokenBudget]:
+    budgets = dict(ROUTE_TOKEN_BUDGETS)
+    if TOKEN_BUDGET_FILE:
+        with open(TOKEN_BUDGET_FILE, encoding="utf-8") as f:
+            for route, overrides in json.load(f).items():
+                budgets[route] = replace(budgets.get(route, _DEFAULT_BUDGET), **overrides)
+    return budgets
+
+
+def get_budget(route: str) -> TokenBudget:
+    global _budgets
+    if _budgets is None:
+        _budgets = _load_budgets()
+    return _budgets.get(route, _DEFAULT_BUDGET)
+
+
+def check_input_budget(route: str, *texts: str) -> int:
+    """Estima os tokens de entrada e rejeita se passar do orçamento da rota."""
+    estimated = sum(estimate_tokens(t) for t in texts)
+    budget = get_budget(route)
+    if estimated > budget.max_input_tokens:
+        raise TokenBudgetExceeded(
+            f"Entrada estimada em {estimated} tokens excede o limite de {budget.max_input_tokens} para '{route}'."
+        )
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.estimated_input_tokens += estimated
+    return estimated
+
+
+def output_budget(route: str, requested: Optional[int] = None, criteria_count: int = 0) -> int:
+    """
+    Limite de saída: orçamento da rota (+ por critério) ou o pedido na
+    requisição, o que for menor.
+    """
+    budget = get_budget(route)
+    limit = budget.max_output_tokens + budget.output_tokens_per_criterion * criteria_count
+    if requested is not None and requested > 0:
+        limit = min(limit, requested)
+    return limit
+
+
+def is_reasoning_model(model: Optional[str]) -> bool:
+    name = (model or "").lower().rsplit("/", 1)[-1]
+    return bool(REASONING_MODEL_PREFIXES) and name.startswith(REASONING_MODEL_PREFIXES)
+
+
+def provider_output_limit(model: Optional[str], limit: int) -> int:
+    """Limite enviado ao provedor para `limit` tokens de resposta visível."""
+    if is_reasoning_model(model):
+        return limit + REASONING_OUTPUT_HEADROOM_TOKENS
+    return limit
+
+
+# =========================
+# Contabilização de uso real (completion.usage)
+# =========================
+@dataclass
+class UsageTotals:
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    estimated_input_tokens: int = 0
+    calls: int = 0
+    # chamadas divididas com outras requisições: os tokens delas são uma cota
+    shared_calls: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "estimated_input_tokens": self.estimated_input_tokens,
+            "calls": self.calls,
+            "shared_calls": self.shared_calls,
+        }
+
+    def add(self, other: "UsageTotals") -> None:
+        for name, value in other.as_dict().items():
+            setattr(self, name, getattr(self, name) + value)
+
+
+_current_usage: contextvars.ContextVar[Optional[UsageTotals]] = contextvars.ContextVar("token_usage", default=None)
+
+
+@contextmanager
+def usage_scope() -> Iterator[UsageTotals]:
+    totals = UsageTotals()
+    token = _current_usage.set(totals)
+    try:
+        yield totals
+    finally:
+        _current_usage.reset(token)
+
+
+def current_usage() -> Optional[UsageTotals]:
+    """Totais do `usage_scope` ativo (None fora de um)."""
+    return _current_usage.get()
+
+
+def _apportion(total: int, weights: Sequence[float]) -> List[int]:
+    """Divide `total` proporcionalmente aos pesos (maiores restos); pesos nulos dividem igualmente."""
+    if not weights:
+        return []
+    if sum(weights) <= 0:
+        weights = [1.0] * len(weights)
+    scale = total / sum(weights)
+    exact = [w * scale for w in weights]
+    parts = [math.floor(x) for x in exact]
+    by_remainder = sorted(range(len(parts)), key=lambda i: exact[i] - parts[i], reverse=True)
+    for i in by_remainder[: total - sum(parts)]:
+        parts[i] += 1
+    return parts
+
+
+def split_usage(totals: UsageTotals, input_weights: Sequence[float], output_weights: Sequence[float]) -> List[UsageTotals]:
+    """
+    Cotas de uma chamada compartilhada: entrada pelos `input_weights` (ex.:
+    tamanho de cada mensagem), saída pelos `output_weights`. As cotas somam
+    exatamente os totais; cada uma conta a chamada como compartilhada.
+    """
+    inputs = _apportion(totals.input_tokens, input_weights)
+    cached = _apportion(totals.cached_tokens, input_weights)
+    estimated = _apportion(totals.estimated_input_tokens, input_weights)
+    outputs = _apportion(totals.output_tokens, output_weights)
+    return [
+        UsageTotals(
+            input_tokens=inputs[i],
+            output_tokens=outputs[i],
+            cached_tokens=cached[i],
+            estimated_input_tokens=estimated[i],
+            calls=totals.calls,
+            shared_calls=totals.calls,
+        )
+        for i in range(len(input_weights))
+    ]
+
+
+def _get(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def record_usage(result: Any) -> None:
+    """Soma o `usage` de uma resposta (Chat Completions ou Responses API)."""
+    totals = _current_usage.get()
+    usage = _get(result, "usage")
+    if totals is None or usage is None:
+        return
+    totals.calls += 1
+    # Chat Completions: prompt_tokens/completion_tokens; Responses: input_tokens/output_tokens
+    totals.input_tokens += _get(usage, "prompt_tokens") or _get(usage, "input_tokens") or 0
+    totals.output_tokens += _get(usage, "completion_tokens") or _get(usage, "output_tokens") or 0
+    details = _get(usage, "prompt_tokens_details") or _get(usage, "input_tokens_details")
+    totals.cached_tokens += _get(details, "cached_tokens") or 0
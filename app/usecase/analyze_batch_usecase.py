@@ -0,0 +1,189 @@
+"""
+Micro-batching opcional do /analyze.
+
+Requisições para o mesmo (profile_key, modelo) que chegam dentro de uma
+janela curta (ou até N itens) viram UMA chamada ao LLM com as mensagens
+delimitadas; a saída é separada por item e devolvida a cada requisição.
+Itens cuja seção não vier na resposta são analisados individualmente.
+
+O uso de tokens vai para o `usage_scope` de cada requisição: a chamada do
+lote é dividida entre os itens (entrada pelo tamanho da mensagem, saída
+pelo tamanho da análise devolvida) e as chamadas individuais vão inteiras
+para o dono.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from app import metrics
+from app.model_routing import routed_call
+from app.prompts import PROMPTS
+from app.tokens import UsageTotals, check_input_budget, current_usage, output_budget, split_usage, usage_scope
+from app.usecase.analyze_usecase import SYSTEM_PROMPT, analyze
+
+logger = logging.getLogger("analyze_batch")
+
+ANALYZE_MICROBATCH_ENABLED = os.getenv("ANALYZE_MICROBATCH", "0") in ("1", "true", "True")
+ANALYZE_MICROBATCH_WINDOW_MS = float(os.getenv("ANALYZE_MICROBATCH_WINDOW_MS", "20"))
+ANALYZE_MICROBATCH_MAX_ITEMS = int(os.getenv("ANALYZE_MICROBATCH_MAX_ITEMS", "8"))
+
+_RESULT_RE = re.compile(r"<<<RESULTADO (\d+)>>>\s*(.*?)\s*<<<FIM \1>>>", re.DOTALL)
+
+BatchKey = Tuple[str, Optional[str]]
+# (mensagem, futuro da requisição, totais do usage_scope dela)
+BatchItem = Tuple[str, asyncio.Future, Optional[UsageTotals]]
+
+
+def _build_batch_prompt(profile_key: str, messages: List[str]) -> str:
+    entries = "\n".join(
+        f"<<<ENTRADA {i}>>>\n{m}\n<<<FIM ENTRADA {i}>>>" for i, m in enumerate(messages, start=1)
+    )
+    block = (
+        f"{len(messages)} entradas independentes, delimitadas abaixo. "
+        "Analise CADA entrada separadamente, sem misturar conteúdo entre elas.\n"
+        f"{entries}\n\n"
+        "FORMATO DE SAÍDA (obrigatório): para cada entrada i, na ordem, escreva\n"
+        "<<<RESULTADO i>>>\n<análise completa da entrada i>\n<<<FIM i>>>"
+    )
+    return PROMPTS[profile_key].format(message=block)
+
+
+def split_batch_output(raw: str, count: int) -> Dict[int, str]:
+    """Mapeia índice (0-based) -> análise, apenas para as seções presentes."""
+    out: Dict[int, str] = {}
+    for m in _RESULT_RE.finditer(raw):
+        idx = int(m.group(1)) - 1
+        if 0 <= idx < count and idx not in out and m.group(2).strip():
+            out[idx] = m.group(2).strip()
+    return out
+
+
+class AnalyzeMicroBatcher:
+    def __init__(self, window_ms: float = ANALYZE_MICROBATCH_WINDOW_MS, max_items: int = ANALYZE_MICROBATCH_MAX_ITEMS):
+        self.window_s = max(0.0, window_ms) / 1000
+        self.max_items = max(1, max_items)
+        self._pending: Dict[BatchKey, List[BatchItem]] = {}
+        self._timers: Dict[BatchKey, asyncio.TimerHandle] = {}
+        # referências fortes para os flushes em andamento (evita coleta pelo GC)
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, profile_key: str, message: str, model_override: Optional[str]) -> Tuple[str, str]:
+        """
+        Mesmo contrato de `analyze`: devolve (content, used_prompt). O
+        used_prompt é o prompt individual do item; o prompt do lote, que
+        contém mensagens de outras requisições, nunca é devolvido.
+        """
+        if profile_key not in PROMPTS:
+            raise ValueError("profile_key inválido")
+
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        key = (profile_key, model_override)
+        bucket = self._pending.setdefault(key, [])
+        bucket.append((message, fut, current_usage()))
+
+        if len(bucket) >= self.max_items:
+            self._start_flush(key)
+        elif len(bucket) == 1:
+            self._timers[key] = loop.call_later(self.window_s, self._start_flush, key)
+        return await fut
+
+    def _start_flush(self, key: BatchKey) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(key, None)
+        if items:
+            task = asyncio.ensure_future(self._flush(key, items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key: BatchKey, items: List[BatchItem]) -> None:
+        profile_key, model_override = key
+        metrics.incr("analyze_batch.batches")
+        metrics.observe("analyze_batch.size", len(items))
+
+        if len(items) == 1:
+            await self._run_single(profile_key, model_override, *items[0])
+            return
+        await self._flush_many(profile_key, model_override, items)
+
+    async def _flush_many(self, profile_key: str, model_override: Optional[str], items: List[BatchItem]) -> None:
+        messages = [m for m, _, _ in items]
+        prompt = _build_batch_prompt(profile_key, messages)
+        parts: Dict[int, str] = {}
+        # o flush herda o contexto de uma das requisições: o uso do lote é
+        # medido à parte e dividido entre todas
+        with usage_scope() as batch_usage:
+            try:
+                parts = await self._call_batch(prompt, model_override, len(items))
+            except Exception:
+                logger.exception("[analyze_batch] falha na chamada em lote; analisando individualmente")
+        shares = split_usage(batch_usage, [len(m) for m in messages], [len(parts.get(i, "")) for i in range(len(items))])
+        for (_, _, owner), share in zip(items, shares):
+            if owner is not None:
+                owner.add(share)
+
+        fallbacks = []
+        for idx, (message, fut, owner) in enumerate(items):
+            if fut.done():
+                continue
+            if idx in parts:
+                fut.set_result((parts[idx], PROMPTS[profile_key].format(message=message)))
+            else:
+                fallbacks.append(self._run_single(profile_key, model_override, message, fut, owner))
+        if fallbacks:
+            metrics.incr("analyze_batch.fallbacks", len(fallbacks))
+            await asyncio.gather(*fallbacks)
+
+    async def _call_batch(self, prompt: str, model_override: Optional[str], count: int) -> Dict[int, str]:
+        check_input_budget("analyze_batch", SYSTEM_PROMPT, prompt)
+        completion = await routed_call(
+            "analyze_batch",
+            lambda backend, model: backend.chat(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
+                ],
+                max_completion_tokens=output_budget("analyze_batch"),
+            ),
+            model_override,
+        )
+        return split_batch_output(completion.choices[0].message.content or "", count)
+
+    async def _run_single(
+        self,
+        profile_key: str,
+        model_override: Optional[str],
+        message: str,
+        fut: asyncio.Future,
+        owner: Optional[UsageTotals],
+    ) -> None:
+        try:
+            with usage_scope() as usage:
+                try:
+                    result = await analyze(profile_key, message, model_override)
+                finally:
+                    if owner is not None:
+                        owner.add(usage)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+            return
+        if not fut.done():
+            fut.set_result(result)
+
+
+_batcher: Optional[AnalyzeMicroBatcher] = None
+
+
+def get_analyze_batcher() -> AnalyzeMicroBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = AnalyzeMicroBatcher()
+    return _batcher
@@ -1,20 +1,56 @@
-from app.openai_client import get_client, get_model
+import asyncio
+import os
+from typing import List, Optional, Tuple, Union
+
+from app.model_routing import routed_call
 from app.prompts import PROMPTS
+from app.tokens import check_input_budget, output_budget
+
+SYSTEM_PROMPT = "Você é um especialista em acessibilidade cognitiva."
 
-async def analyze(profile_key: str, message: str, model_override: str | None):
+async def analyze(profile_key: str, message: str, model_override: str | None, max_output_tokens: Optional[int] = None):
     if profile_key not in PROMPTS:
         raise ValueError("profile_key inválido")
 
-    client = get_client()
-    model = get_model(model_override)
     prompt = PROMPTS[profile_key].format(message=message)
+    check_input_budget("analyze", SYSTEM_PROMPT, prompt)
+    max_tokens = output_budget("analyze", max_output_tokens)
 
-    completion = await client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "Você é um especialista em acessibilidade cognitiva."},
-            {"role": "user", "content": prompt},
-        ],
+    completion = await routed_call(
+        "analyze",
+        lambda backend, model: backend.chat(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            max_completion_tokens=max_tokens,
+        ),
+        model_override,
     )
     content = (completion.choices[0].message.content or "").strip()
     return content, prompt
+
+
+# Quantas análises do /analyze/bulk rodam ao mesmo tempo
+ANALYZE_BULK_CONCURRENCY = int(os.getenv("ANALYZE_BULK_CONCURRENCY", "8"))
+
+async def analyze_many(
+    items: List[Tuple[str, str, Optional[str], Optional[int]]],
+    concurrency: int = ANALYZE_BULK_CONCURRENCY,
+) -> List[Union[Tuple[str, str], Exception]]:
+    """
+    Analisa vários (profile_key, message, model_override, max_output_tokens)
+    em paralelo, com no máximo `concurrency` chamadas simultâneas. O resultado segue a ordem da
+    entrada; falhas individuais voltam como a exceção do item.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(profile_key: str, message: str, model_override: Optional[str], max_output_tokens: Optional[int]):
+        async with semaphore:
+            return await analyze(profile_key, message, model_override, max_output_tokens)
+
+    return await asyncio.gather(
+        *(run_one(*item) for item in items),
+        return_exceptions=True,
+    )
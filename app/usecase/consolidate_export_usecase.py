@@ -0,0 +1,174 @@
+"""
+Exportação tabular da consolidação de avaliações (CSV, Arrow IPC ou Parquet).
+
+Duas tabelas:
+- `scores`: matriz mensagem × critério em formato longo
+  (message_index, criterion, score), gerada mensagem a mensagem;
+- `stats`: estatísticas por critério (n, cobertura, média, mín, máx, desvio
+  padrão), acumuladas de forma incremental (Welford), sem guardar as notas.
+
+A saída é produzida em pedaços (`Iterator[bytes]`) para ser enviada com
+StreamingResponse. Arrow/Parquet dependem do pacote opcional `pyarrow`.
+"""
+from __future__ import annotations
+
+import csv
+import io
+from typing import Dict, Iterable, Iterator, List
+
+from app.usecase.consolidate_usecase import RunningStats, parse_message
+
+# linhas por pedaço de CSV / record batch do Arrow/Parquet
+EXPORT_CHUNK_ROWS = 2000
+
+# formato -> (media type, extensão do arquivo)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+SCORE_COLUMNS = ["message_index", "criterion", "score"]
+STATS_COLUMNS = ["criterion", "n", "total_messages", "mean", "min", "max", "stdev"]
+
+
+def iter_score_rows(messages: Iterable[str]) -> Iterator[tuple]:
+    for idx, message in enumerate(messages):
+        scores = parse_message(message).scores
+        for criterion, score in scores.items():
+            yield (idx, criterion, score)
+
+
+def iter_stats_rows(messages: Iterable[str]) -> Iterator[tuple]:
+    stats: Dict[str, RunningStats] = {}
+    total = 0
+    for message in messages:
+        total += 1
+        scores = parse_message(message).scores
+        for criterion, score in scores.items():
+            stats.setdefault(criterion, RunningStats()).add(score)
+
+    for criterion in sorted(stats):
+        st = stats[criterion]
+        yield (criterion, st.n, total, st.mean, st.min, st.max, st.stdev)
+
+
+def _chunks(rows: Iterator[tuple], size: int) -> Iterator[List[tuple]]:
+    chunk: List[tuple] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_csv(columns: List[str], rows: Iterator[tuple], chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(columns)
+    for chunk in _chunks(rows, chunk_rows):
+        writer.writerows(chunk)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+class _DrainableSink(io.RawIOBase):
+    """
+    Arquivo só de escrita cujo conteúdo é retirado a cada pedaço. `tell()`
+    continua contando o total escrito, que o escritor Parquet usa nos
+    offsets do rodapé.
+    """
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        b = bytes(data)
+        self._parts.append(b)
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("Exportação em Arrow/Parquet requer o pacote opcional 'pyarrow'.")
+    return pa
+
+
+def _arrow_schema(pa, table: str):
+    if table == "scores":
+        return pa.schema([("message_index", pa.int32()), ("criterion", pa.string()), ("score", pa.float64())])
+    return pa.schema([
+        ("criterion", pa.string()), ("n", pa.int32()), ("total_messages", pa.int32()),
+        ("mean", pa.float64()), ("min", pa.float64()), ("max", pa.float64()), ("stdev", pa.float64()),
+    ])
+
+
+def stream_arrow(table: str, rows: Iterator[tuple], fmt: str, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    pa = _import_pyarrow()
+    schema = _arrow_schema(pa, table)
+    sink = _DrainableSink()
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    else:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+
+    try:
+        for chunk in _chunks(rows, chunk_rows):
+            columns = list(zip(*chunk))
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema,
+            )
+            writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def export_consolidation(messages: List[str], table: str = "scores", fmt: str = "csv") -> Iterator[bytes]:
+    """
+    Gera a tabela pedida no formato pedido, em pedaços de bytes. Levanta
+    RuntimeError logo na chamada se o formato exigir `pyarrow` ausente.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação inválido: {fmt}")
+    if fmt != "csv":
+        _import_pyarrow()
+
+    if table == "scores":
+        columns, rows = SCORE_COLUMNS, iter_score_rows(messages)
+    elif table == "stats":
+        columns, rows = STATS_COLUMNS, iter_stats_rows(messages)
+    else:
+        raise ValueError(f"Tabela de exportação inválida: {table}")
+
+    if fmt == "csv":
+        return stream_csv(columns, rows)
+    return stream_arrow(table, rows, fmt)
@@ -1,13 +1,23 @@
 from __future__ import annotations
 
+import bisect
+import hashlib
 import math
 import os
 import re
-from collections import defaultdict
-from dataclasses import dataclass, field
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field, replace
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from app.schemas import AlertItem, CommonItem, CriterionStats, OverallStats
+from app import metrics
+from app.schemas import AlertItem, CommonItem, CriterionStats, OverallStats, ReliabilityStats
+from app.usecase.reliability_usecase import (
+    CONSOLIDATE_BOOTSTRAP_ITERATIONS,
+    CONSOLIDATE_BOOTSTRAP_SEED,
+    ReliabilityResult,
+    compute_reliability,
+)
 
 
 # -----------------------------
@@ -69,11 +79,41 @@ def stdev(values: List[float]) -> float:
     var = sum((x - m) ** 2 for x in values) / (n - 1)
     return math.sqrt(var)
 
+@dataclass
+class RunningStats:
+    """Média/variância incrementais (Welford) + mín/máx."""
+    n: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min: float = math.inf
+    max: float = -math.inf
+
+    def add(self, x: float) -> None:
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    @property
+    def stdev(self) -> float:
+        # amostral, como stdev()
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
 def fmt_pt(value: Optional[float], decimals: int = 1) -> str:
     if value is None or (isinstance(value, float) and math.isnan(value)):
         return "-"
     return f"{value:.{decimals}f}".replace(".", ",")
 
+def fmt_ci(ci: Optional[Tuple[float, float]], decimals: int = 1) -> str:
+    if ci is None:
+        return "-"
+    return f"{fmt_pt(ci[0], decimals)} – {fmt_pt(ci[1], decimals)}"
+
+# Limiar usual de Krippendorff abaixo do qual a concordância é considerada baixa
+LOW_AGREEMENT_ALPHA = 0.667
+
 
 # -----------------------------
 # Parsing
@@ -163,6 +203,211 @@ def normalize_item_key(text: str) -> str:
     return t
 
 
+# -----------------------------
+# Cache de parse e estado incremental
+# -----------------------------
+# O dashboard reenvia a lista inteira (crescente) a cada nova avaliação.
+# - cada mensagem é parseada uma vez só (LRU por hash do conteúdo);
+# - o estado agregado fica em cache pela cadeia de hashes da lista, então
+#   [m1..mN, mN+1] reaproveita o estado de [m1..mN] e só processa mN+1:
+#   as listas são estendidas sem cópia e as estatísticas por critério são
+#   somas acumuladas (custo proporcional às mensagens novas e ao número de
+#   critérios, não a N).
+CONSOLIDATE_PARSE_CACHE_SIZE = int(os.getenv("CONSOLIDATE_PARSE_CACHE_SIZE", "20000"))
+CONSOLIDATE_STATE_CACHE_SIZE = int(os.getenv("CONSOLIDATE_STATE_CACHE_SIZE", "32"))
+
+
+@dataclass(frozen=True)
+class ParsedMessage:
+    scores: Dict[str, float]
+    overall: Optional[float]
+    qualitative: Dict[str, List[str]]
+
+
+def _message_digest(message: str) -> bytes:
+    return hashlib.sha256(message.encode("utf-8")).digest()
+
+
+class _LRU:
+    def __init__(self, max_items: int):
+        self.max_items = max(1, max_items)
+        self._items: "OrderedDict[bytes, Any]" = OrderedDict()
+        self._lock = threading.Lock()  # o export roda no threadpool
+
+    def get(self, key: bytes) -> Any:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: bytes, value: Any) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+_parse_cache = _LRU(CONSOLIDATE_PARSE_CACHE_SIZE)
+_state_cache = _LRU(CONSOLIDATE_STATE_CACHE_SIZE)
+
+
+def parse_message(message: str, digest: Optional[bytes] = None) -> ParsedMessage:
+    """Notas + seções qualitativas de uma mensagem (com cache por conteúdo)."""
+    digest = digest or _message_digest(message)
+    parsed = _parse_cache.get(digest)
+    if parsed is not None:
+        metrics.incr("consolidate.parse_cache.hits")
+        return parsed
+    metrics.incr("consolidate.parse_cache.misses")
+    scores, overall = parse_scores_from_message(message)
+    parsed = ParsedMessage(scores=scores, overall=overall, qualitative=parse_qualitative_sections(message))
+    _parse_cache.put(digest, parsed)
+    return parsed
+
+
+class _Sequence:
+    """
+    Listas de uma sequência de mensagens, compartilhadas pelos estados dos
+    seus prefixos. Só crescem; cada estado lê apenas as suas `n_messages`
+    primeiras posições.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.parsed: List[ParsedMessage] = []
+        self.scores: Dict[str, List[float]] = {}
+        self.overall: List[float] = []
+        # seção -> chave normalizada -> (primeiro texto, índices das mensagens em que aparece)
+        self.tallies: Dict[str, Dict[str, Tuple[str, List[int]]]] = {s: {} for s in _QUALITATIVE_SECTIONS}
+
+
+_QUALITATIVE_SECTIONS = ("positives", "problems", "priorities")
+
+
+@dataclass
+class ConsolidationState:
+    """
+    Agregado das primeiras `n_messages` mensagens de uma `_Sequence`:
+    estatísticas por critério e soma das "Pontuações Gerais" acumuladas.
+    """
+    seq: _Sequence = field(default_factory=_Sequence)
+    n_messages: int = 0
+    stats: Dict[str, RunningStats] = field(default_factory=dict)
+    overall_n: int = 0
+    overall_sum: float = 0.0
+    # (iterações, seed) -> concordância/IC já calculados para estas mensagens
+    reliability: Dict[Tuple[int, int], Optional[ReliabilityResult]] = field(default_factory=dict)
+
+    def extend(self, parsed_messages: Iterable[ParsedMessage]) -> "ConsolidationState":
+        """
+        Novo estado com as mensagens seguintes; este continua válido. As
+        listas só são copiadas se outra sequência já tiver estendido este
+        prefixo (listas que divergem depois de um prefixo comum).
+        """
+        with self.seq.lock:
+            if len(self.seq.parsed) == self.n_messages:
+                new = ConsolidationState(
+                    seq=self.seq,
+                    n_messages=self.n_messages,
+                    stats={c: replace(st) for c, st in self.stats.items()},
+                    overall_n=self.overall_n,
+                    overall_sum=self.overall_sum,
+                )
+            else:
+                metrics.incr("consolidate.state_cache.forks")
+                new = ConsolidationState()
+                for parsed in self.seq.parsed[:self.n_messages]:
+                    new._add(parsed)
+            for parsed in parsed_messages:
+                new._add(parsed)
+        return new
+
+    def _add(self, parsed: ParsedMessage) -> None:
+        seq = self.seq
+        index = self.n_messages
+        seq.parsed.append(parsed)
+        for c, score in parsed.scores.items():
+            seq.scores.setdefault(c, []).append(score)
+            self.stats.setdefault(c, RunningStats()).add(score)
+        if parsed.overall is not None:
+            seq.overall.append(parsed.overall)
+            self.overall_n += 1
+            self.overall_sum += parsed.overall
+        for section in _QUALITATIVE_SECTIONS:
+            tally = seq.tallies[section]
+            for item in parsed.qualitative[section]:
+                k = normalize_item_key(item)
+                entry = tally.get(k)
+                if entry is None:
+                    tally[k] = (item, [index])
+                else:
+                    entry[1].append(index)
+        self.n_messages += 1
+
+    # --- leitura do prefixo deste estado ---
+
+    def parsed(self) -> List[ParsedMessage]:
+        return self.seq.parsed[:self.n_messages]
+
+    def scores(self, criterion: str) -> List[float]:
+        return self.seq.scores[criterion][:self.stats[criterion].n]
+
+    def tally(self, section: str) -> List[Tuple[str, int]]:
+        """(primeiro texto, contagem) dos itens da seção, na ordem de aparição."""
+        with self.seq.lock:
+            entries = list(self.seq.tallies[section].values())
+        n = self.n_messages
+        return [(text, bisect.bisect_left(idx, n)) for text, idx in entries if idx[0] < n]
+
+
+def consolidation_state(messages: List[str]) -> ConsolidationState:
+    """
+    Estado agregado de `messages`, reaproveitando o maior prefixo já
+    consolidado. Só as mensagens depois do prefixo são parseadas/somadas.
+    """
+    digests = [_message_digest(m) for m in messages]
+
+    # chave de cada prefixo: hash encadeado dos hashes das mensagens
+    chain: List[bytes] = []
+    key = b""
+    for d in digests:
+        key = hashlib.sha256(key + d).digest()
+        chain.append(key)
+
+    start, state = 0, None
+    for i in range(len(chain) - 1, -1, -1):
+        cached = _state_cache.get(chain[i])
+        if cached is not None:
+            start, state = i + 1, cached
+            break
+
+    if state is not None and start == len(messages):
+        metrics.incr("consolidate.state_cache.hits")
+        return state
+
+    # o estado em cache continua válido: extend() devolve um novo estado
+    state = state if state is not None else ConsolidationState()
+    metrics.incr("consolidate.state_cache.prefix_hits" if start else "consolidate.state_cache.misses")
+    metrics.observe("consolidate.new_messages", len(messages) - start)
+
+    state = state.extend(parse_message(m, d) for m, d in zip(messages[start:], digests[start:]))
+
+    if chain:
+        _state_cache.put(chain[-1], state)
+    return state
+
+
+def clear_consolidation_caches() -> None:
+    _parse_cache.clear()
+    _state_cache.clear()
+
+
 # -----------------------------
 # Reporting model interno
 # -----------------------------
@@ -176,75 +421,61 @@ class ConsolidatedReport:
     positives: List[str] = field(default_factory=list)
     problems: List[str] = field(default_factory=list)
     priorities: List[str] = field(default_factory=list)
+    reliability: Optional[ReliabilityResult] = None
 
 
-def consolidate(messages: Iterable[str]) -> ConsolidatedReport:
+def consolidate(
+    messages: Iterable[str],
+    bootstrap_iterations: Optional[int] = None,
+    bootstrap_seed: Optional[int] = None,
+) -> ConsolidatedReport:
     msgs = list(messages)  # ✅ garante reuso + total conhecido
+    return _report_from_state(consolidation_state(msgs), bootstrap_iterations, bootstrap_seed)
 
-    score_maps: List[Dict[str, float]] = []
-    overall_list: List[float] = []
 
-    for m in msgs:
-        sm, overall = parse_scores_from_message(m)
-        score_maps.append(sm)
-        if overall is not None:
-            overall_list.append(overall)
+def _state_reliability(state: ConsolidationState, criteria: List[str], iterations: Optional[int], seed: Optional[int]) -> Optional[ReliabilityResult]:
+    key = (
+        CONSOLIDATE_BOOTSTRAP_ITERATIONS if iterations is None else iterations,
+        CONSOLIDATE_BOOTSTRAP_SEED if seed is None else seed,
+    )
+    if key not in state.reliability:
+        state.reliability[key] = compute_reliability(
+            [p.scores for p in state.parsed()], criteria, iterations=key[0], seed=key[1]
+        )
+    return state.reliability[key]
 
-    all_criteria = sorted({k for sm in score_maps for k in sm.keys()})
 
-    per_criterion_scores: Dict[str, List[float]] = {c: [] for c in all_criteria}
-    for sm in score_maps:
-        for c in all_criteria:
-            if c in sm:
-                per_criterion_scores[c].append(sm[c])
+def _report_from_state(
+    state: ConsolidationState,
+    bootstrap_iterations: Optional[int] = None,
+    bootstrap_seed: Optional[int] = None,
+) -> ConsolidatedReport:
+    all_criteria = sorted(state.stats)
 
     per_criterion_stats: Dict[str, Dict[str, float]] = {}
-    for c, vals in per_criterion_scores.items():
-        if not vals:
-            per_criterion_stats[c] = {"mean": float("nan"), "min": float("nan"), "max": float("nan"), "stdev": float("nan"), "n": 0}
-        else:
-            per_criterion_stats[c] = {"mean": mean(vals), "min": min(vals), "max": max(vals), "stdev": stdev(vals), "n": len(vals)}
+    for c in all_criteria:
+        st = state.stats[c]
+        per_criterion_stats[c] = {"mean": st.mean, "min": st.min, "max": st.max, "stdev": st.stdev, "n": st.n}
 
     # ✅ overall determinístico: média das médias por critério (igual seu result.py)
     criterion_means = [v["mean"] for v in per_criterion_stats.values() if not math.isnan(v["mean"])]
     overall = mean(criterion_means) if criterion_means else float("nan")
 
     # se vier "Pontuação Geral" dentro das mensagens, também calculamos uma média separada (opcional)
-    overall_from_msgs = mean(overall_list) if overall_list else None
-
-    # Qualitativo: agrega e remove duplicatas simples
-    pos, prob, pri = [], [], []
-    seen_pos, seen_prob, seen_pri = set(), set(), set()
-
-    for m in messages:
-        q = parse_qualitative_sections(m)
-        for item in q["positives"]:
-            key = normalize_item_key(item)
-            if key not in seen_pos:
-                seen_pos.add(key)
-                pos.append(item)
-        for item in q["problems"]:
-            key = normalize_item_key(item)
-            if key not in seen_prob:
-                seen_prob.add(key)
-                prob.append(item)
-        for item in q["priorities"]:
-            key = normalize_item_key(item)
-            if key not in seen_pri:
-                seen_pri.add(key)
-                pri.append(item)
+    overall_from_msgs = state.overall_sum / state.overall_n if state.overall_n else None
 
     report = ConsolidatedReport(
       criteria=all_criteria,
-      per_criterion_scores=per_criterion_scores,
+      per_criterion_scores={c: state.scores(c) for c in all_criteria},
       per_criterion_stats=per_criterion_stats,
       overall_score=overall,
       overall_score_from_messages=overall_from_msgs,
-      positives=pos,
-      problems=prob,
-      priorities=pri,
+      positives=[t for t, _ in state.tally("positives")],
+      problems=[t for t, _ in state.tally("problems")],
+      priorities=[t for t, _ in state.tally("priorities")],
+      reliability=_state_reliability(state, all_criteria, bootstrap_iterations, bootstrap_seed),
     )
-    report.total_messages = len(msgs)
+    report.total_messages = state.n_messages
     return report
 
 
@@ -263,8 +494,16 @@ def render_markdown(report: ConsolidatedReport, title: str = "Relatório Consoli
         "> Se algum critério não aparecer em todas as avaliações, o **n** dele será menor.\n"
     )
 
-    lines.append("| Critério Avaliado | n (amostra) | Cobertura | Média | Mín | Máx | Desvio Padrão |")
-    lines.append("|---|---:|---:|---:|---:|---:|---:|")
+    rel = report.reliability
+    with_ci = rel is not None and rel.bootstrap_iterations > 0
+    ci_label = f"IC {fmt_pt(rel.confidence * 100, 0)}%" if with_ci else ""
+
+    if with_ci:
+        lines.append(f"| Critério Avaliado | n (amostra) | Cobertura | Média | {ci_label} (média) | Mín | Máx | Desvio Padrão |")
+        lines.append("|---|---:|---:|---:|---:|---:|---:|---:|")
+    else:
+        lines.append("| Critério Avaliado | n (amostra) | Cobertura | Média | Mín | Máx | Desvio Padrão |")
+        lines.append("|---|---:|---:|---:|---:|---:|---:|")
 
     for c in report.criteria:
         st = report.per_criterion_stats[c]
@@ -272,12 +511,14 @@ def render_markdown(report: ConsolidatedReport, title: str = "Relatório Consoli
         total = report.total_messages if hasattr(report, "total_messages") else None
         coverage = f"{n}/{total}" if total else str(n)
 
+        ci_cell = f" {fmt_ci(rel.criterion_ci.get(c))} |" if with_ci else ""
         lines.append(
-            f"| {c} | {n} | {coverage} | {fmt_pt(st['mean'])} | {fmt_pt(st['min'])} | {fmt_pt(st['max'])} | {fmt_pt(st['stdev'])} |"
+            f"| {c} | {n} | {coverage} | {fmt_pt(st['mean'])} |{ci_cell} {fmt_pt(st['min'])} | {fmt_pt(st['max'])} | {fmt_pt(st['stdev'])} |"
         )
 
     lines.append("\n## ⭐ Pontuação Global\n")
-    lines.append(f"- **Global (média das médias por critério):** {fmt_pt(report.overall_score)} / 5,0")
+    overall_ci = f" ({ci_label}: {fmt_ci(rel.overall_ci)})" if with_ci else ""
+    lines.append(f"- **Global (média das médias por critério):** {fmt_pt(report.overall_score)} / 5,0{overall_ci}")
     if report.overall_score_from_messages is not None:
         lines.append(f"- **Global (média das 'Pontuações Gerais' reportadas):** {fmt_pt(report.overall_score_from_messages)} / 5,0")
 
@@ -293,6 +534,21 @@ def render_markdown(report: ConsolidatedReport, title: str = "Relatório Consoli
         for c, s in top_div:
             lines.append(f"- **{c}** — desvio padrão: {fmt_pt(s)}")
 
+    if rel is not None and (rel.krippendorff_alpha is not None or rel.icc is not None):
+        lines.append("\n## 🤝 Concordância entre Avaliações\n")
+        lines.append(
+            "> Mede se as avaliações repetidas concordam além do acaso sobre quais critérios são melhores/piores. "
+            "Referência para o alfa: ≥ 0,80 confiável; 0,67–0,80 aceitável com cautela; < 0,67 baixa.\n"
+        )
+        lines.append(f"- **Alfa de Krippendorff (intervalar):** {fmt_pt(rel.krippendorff_alpha, 2)}")
+        if rel.icc is not None:
+            lines.append(
+                f"- **ICC(2,1) (concordância absoluta):** {fmt_pt(rel.icc, 2)} "
+                f"— {rel.icc_criteria} critérios × {rel.icc_evaluations} avaliações completas"
+            )
+        if rel.krippendorff_alpha is not None and rel.krippendorff_alpha < LOW_AGREEMENT_ALPHA:
+            lines.append("- ⚠️ Concordância baixa: trate as médias com cautela e considere mais avaliações.")
+
     if report.positives:
         lines.append("\n## ✅ Pontos Positivos (agregados)\n")
         for item in report.positives[:10]:
@@ -311,30 +567,18 @@ def render_markdown(report: ConsolidatedReport, title: str = "Relatório Consoli
 
     return "\n".join(lines)
 
-def aggregate_evaluations(messages: List[str]) -> Dict[str, Any]:
-    report = consolidate(messages)
+def aggregate_evaluations(
+    messages: List[str],
+    bootstrap_iterations: Optional[int] = None,
+    bootstrap_seed: Optional[int] = None,
+) -> Dict[str, Any]:
+    state = consolidation_state(messages)
+    report = _report_from_state(state, bootstrap_iterations, bootstrap_seed)
+    rel = report.reliability
 
     # Contagem “recorrente” (agora por normalização)
-    problem_count: Dict[str, Tuple[str, int]] = {}   # key -> (best_text, count)
-    positive_count: Dict[str, Tuple[str, int]] = {}
-
-    for m in messages:
-        q = parse_qualitative_sections(m)
-
-        for item in q["problems"]:
-            k = normalize_item_key(item)
-            if k not in problem_count:
-                problem_count[k] = (item, 0)
-            problem_count[k] = (problem_count[k][0], problem_count[k][1] + 1)
-
-        for item in q["positives"]:
-            k = normalize_item_key(item)
-            if k not in positive_count:
-                positive_count[k] = (item, 0)
-            positive_count[k] = (positive_count[k][0], positive_count[k][1] + 1)
-
-    common_problems = sorted(problem_count.values(), key=lambda x: x[1], reverse=True)
-    common_positives = sorted(positive_count.values(), key=lambda x: x[1], reverse=True)
+    common_problems = sorted(state.tally("problems"), key=lambda x: x[1], reverse=True)
+    common_positives = sorted(state.tally("positives"), key=lambda x: x[1], reverse=True)
 
     # Alertas por divergência
     alerts: List[AlertItem] = []
@@ -349,6 +593,7 @@ def aggregate_evaluations(messages: List[str]) -> Dict[str, Any]:
     for c in report.criteria:
         st = report.per_criterion_stats[c]
         vals = report.per_criterion_scores[c]
+        ci = rel.criterion_ci.get(c) if rel is not None else None
         criteria_out.append(
             CriterionStats(
                 name=c,
@@ -358,6 +603,8 @@ def aggregate_evaluations(messages: List[str]) -> Dict[str, Any]:
                 max=None if math.isnan(st["max"]) else float(st["max"]),
                 stdev=None if math.isnan(st["stdev"]) else float(st["stdev"]),
                 scores=[float(v) for v in vals],
+                ci_low=ci[0] if ci else None,
+                ci_high=ci[1] if ci else None,
             )
         )
 
@@ -368,10 +615,20 @@ def aggregate_evaluations(messages: List[str]) -> Dict[str, Any]:
             mean_by_criteria=None if math.isnan(report.overall_score) else float(report.overall_score),
             mean_reported_overall=report.overall_score_from_messages,
             n_messages=len(messages),
+            ci_low=rel.overall_ci[0] if rel is not None and rel.overall_ci else None,
+            ci_high=rel.overall_ci[1] if rel is not None and rel.overall_ci else None,
         ),
         "criteria": criteria_out,
         "common_problems": [CommonItem(text=t, count=c) for (t, c) in common_problems[:10]],
         "common_positives": [CommonItem(text=t, count=c) for (t, c) in common_positives[:10]],
         "alerts": alerts,
         "diagnosis_markdown": diagnosis_md,
+        "reliability": None if rel is None else ReliabilityStats(
+            krippendorff_alpha=rel.krippendorff_alpha,
+            icc=rel.icc,
+            icc_criteria=rel.icc_criteria,
+            icc_evaluations=rel.icc_evaluations,
+            bootstrap_iterations=rel.bootstrap_iterations,
+            confidence=rel.confidence,
+        ),
     }
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+Perguntas de acompanhamento sobre uma avaliação já feita.
+
+O caminho normal continua a conversa no provedor (`previous_response_id`):
+só a pergunta nova é enviada; questionário e imagem já estão lá. Para o
+caso de o estado do provedor ter expirado (ou a avaliação ter sido feita
+por trechos, sem uma conversa única), guardamos localmente o contexto de
+cada avaliação (prompt, imagem, avaliação, perguntas anteriores) num LRU
+limitado por quantidade e por bytes e, se preciso, a conversa é reenviada
+inteira.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import metrics
+from app.llm_backends import BackendUnsupported
+from app.model_routing import routed_call
+from app.tokens import check_input_budget, output_budget
+from app.usecase.evaluation_usecase import build_evaluation_input, image_data_url
+
+logger = logging.getLogger("evaluation_followup")
+
+# Avaliações cujo contexto fica guardado para reenvio (cada uma guarda a imagem)
+EVALUATION_SESSION_MAX_ITEMS = int(os.getenv("EVALUATION_SESSION_MAX_ITEMS", "64"))
+# Teto de memória do LRU (soma de imagem, prompt, avaliação e histórico)
+EVALUATION_SESSION_MAX_BYTES = int(os.getenv("EVALUATION_SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+LOCAL_ID_PREFIX = "local-"
+
+
+@dataclass(frozen=True)
+class EvaluationSession:
+    prompt: str
+    image_base64: str
+    evaluation: str
+    # (pergunta, resposta) já trocadas depois da avaliação
+    history: Tuple[Tuple[str, str], ...] = field(default_factory=tuple)
+
+    @property
+    def size(self) -> int:
+        """Tamanho aproximado em memória (caracteres guardados)."""
+        return (
+            len(self.prompt) + len(self.image_base64) + len(self.evaluation)
+            + sum(len(q) + len(a) for q, a in self.history)
+        )
+
+
+class EvaluationSessionStore:
+    def __init__(self, max_items: int = EVALUATION_SESSION_MAX_ITEMS, max_bytes: int = EVALUATION_SESSION_MAX_BYTES):
+        self.max_items = max(1, max_items)
+        self.max_bytes = max(0, max_bytes)
+        self.total_bytes = 0
+        self._items: "OrderedDict[str, EvaluationSession]" = OrderedDict()
+
+    def remember(self, response_id: Optional[str], session: EvaluationSession) -> str:
+        """
+        Guarda o contexto e devolve o id para follow-ups (local se não houver
+        id do provedor). Um contexto maior que o teto inteiro não é guardado:
+        o id continua valendo enquanto o provedor mantiver a conversa.
+        """
+        sid = response_id or f"{LOCAL_ID_PREFIX}{uuid.uuid4().hex}"
+        old = self._items.pop(sid, None)
+        if old is not None:
+            self.total_bytes -= old.size
+        if session.size > self.max_bytes:
+            metrics.incr("evaluation_followup.sessions.too_large")
+            return sid
+        self._items[sid] = session
+        self.total_bytes += session.size
+        while len(self._items) > self.max_items or self.total_bytes > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.total_bytes -= evicted.size
+            metrics.incr("evaluation_followup.sessions.evictions")
+        return sid
+
+    def get(self, sid: str) -> Optional[EvaluationSession]:
+        session = self._items.get(sid)
+        if session is not None:
+            self._items.move_to_end(sid)
+        return session
+
+
+_sessions: Optional[EvaluationSessionStore] = None
+
+
+def get_evaluation_sessions() -> EvaluationSessionStore:
+    global _sessions
+    if _sessions is None:
+        _sessions = EvaluationSessionStore()
+    return _sessions
+
+
+def _replay_input(session: EvaluationSession, question: str) -> List[Dict[str, Any]]:
+    items = build_evaluation_input(session.prompt, image_data_url(session.image_base64))
+    items.append({"role": "assistant", "content": session.evaluation})
+    for q, a in session.history:
+        items.append({"role": "user", "content": q})
+        items.append({"role": "assistant", "content": a})
+    items.append({"role": "user", "content": question})
+    return items
+
+
+# erro do provedor para `previous_response_id` expirado/inexistente
+# (código "previous_response_not_found", "Previous response with id ... not found")
+_MISSING_STATE_CODES = ("previous_response_not_found",)
+_MISSING_STATE_RE = re.compile(r"previous[ _]response.*not[ _]found", re.IGNORECASE)
+
+
+def _is_missing_state(exc: Exception) -> bool:
+    """Só o estado ausente no provedor justifica reenviar o contexto; outros 400 propagam."""
+    if isinstance(exc, BackendUnsupported):
+        return True
+    if getattr(exc, "status_code", None) not in (400, 404):
+        return False
+    if getattr(exc, "code", None) in _MISSING_STATE_CODES:
+        return True
+    return bool(_MISSING_STATE_RE.search(str(getattr(exc, "message", None) or exc)))
+
+
+async def follow_up(
+    response_id: str,
+    question: str,
+    model_override: Optional[str] = None,
+    max_output_tokens: Optional[int] = None,
+) -> Tuple[str, str, bool]:
+    """
+    Retorna (resposta, id para o próximo follow-up, se houve reenvio do
+    contexto). Lança KeyError se não houver como continuar a conversa.
+    """
+    sessions = get_evaluation_sessions()
+    session = sessions.get(response_id)
+    max_tokens = output_budget("evaluation_followup", max_output_tokens)
+    check_input_budget("evaluation_followup", question)
+
+    response = None
+    if not response_id.startswith(LOCAL_ID_PREFIX):
+        try:
+            response = await routed_call(
+                "evaluation_followup",
+                lambda backend, model: backend.respond(
+                    model=model,
+                    previous_response_id=response_id,
+                    input=[{"role": "user", "content": question}],
+                    max_output_tokens=max_tokens,
+                ),
+                model_override,
+            )
+            metrics.incr("evaluation_followup.continued")
+        except Exception as e:
+            if not _is_missing_state(e):
+                raise
+            if session is None:
+                raise KeyError(f"Conversa não encontrada: {response_id}")
+            logger.info("[evaluation_followup] estado de %s indisponível no provedor; reenviando contexto", response_id)
+
+    replayed = response is None
+    if replayed:
+        if session is None:
+            raise KeyError(f"Conversa não encontrada: {response_id}")
+        metrics.incr("evaluation_followup.replayed")
+        check_input_budget(
+            "evaluation_followup_replay",
+            session.prompt, session.evaluation, question, *(t for qa in session.history for t in qa),
+        )
+        replay_input = _replay_input(session, question)
+        response = await routed_call(
+            "evaluation_followup",
+            lambda backend, model: backend.respond(model=model, input=replay_input, max_output_tokens=max_tokens),
+            model_override,
+        )
+
+    answer = response.output_text
+    next_id = response.id
+    if session is not None:
+        next_id = sessions.remember(next_id, replace(session, history=session.history + ((question, answer),)))
+    return answer, next_id, replayed
@@ -0,0 +1,156 @@
+"""
+Avaliação de várias imagens com o mesmo questionário.
+
+As imagens são agrupadas (EVALUATION_MULTI_GROUP_SIZE por chamada) e cada
+grupo vira UMA chamada `responses.create` com várias partes `input_image`:
+o prompt do questionário é enviado uma vez por grupo, não uma vez por
+imagem. A saída vem delimitada por imagem, é separada e validada; imagens
+sem seção (ou com seção incompleta) são reavaliadas individualmente.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from app import metrics
+from app.model_routing import routed_call
+from app.tokens import check_input_budget, output_budget
+from app.usecase.evaluation_usecase import (
+    evaluate_image,
+    find_missing_evaluation_parts,
+    image_data_url,
+)
+
+logger = logging.getLogger("evaluation_multi")
+
+EVALUATION_MULTI_GROUP_SIZE = int(os.getenv("EVALUATION_MULTI_GROUP_SIZE", "4"))
+
+_SECTION_RE = re.compile(r"<<<IMAGEM (\d+)>>>\s*(.*?)\s*<<<FIM IMAGEM \1>>>", re.DOTALL)
+
+
+@dataclass
+class ImageEvaluation:
+    index: int
+    message: Optional[str] = None
+    error: Optional[Exception] = None
+
+
+def _build_multi_instructions(count: int) -> str:
+    return (
+        f"\n\nVocê receberá {count} imagens, identificadas como \"Imagem 1\" a \"Imagem {count}\" na ordem em que aparecem. "
+        "Avalie CADA imagem separadamente com o questionário acima, sem misturar observações entre elas.\n"
+        "FORMATO DE SAÍDA (obrigatório): para cada imagem i, na ordem, escreva\n"
+        "<<<IMAGEM i>>>\n<avaliação completa da imagem i, exatamente no formato pedido acima>\n<<<FIM IMAGEM i>>>"
+    )
+
+
+def _build_multi_input(prompt: str, images_base64: List[str]) -> List[Dict[str, Any]]:
+    content: List[Dict[str, Any]] = [{"type": "input_text", "text": prompt + _build_multi_instructions(len(images_base64))}]
+    for i, image in enumerate(images_base64, start=1):
+        content.append({"type": "input_text", "text": f"Imagem {i}:"})
+        content.append({"type": "input_image", "image_url": image_data_url(image)})
+    return [{"role": "user", "content": content}]
+
+
+def split_multi_image_output(raw: str, count: int) -> Dict[int, str]:
+    """Mapeia índice (0-based) -> avaliação, apenas para as seções presentes."""
+    out: Dict[int, str] = {}
+    for m in _SECTION_RE.finditer(raw):
+        idx = int(m.group(1)) - 1
+        if 0 <= idx < count and idx not in out and m.group(2).strip():
+            out[idx] = m.group(2).strip()
+    return out
+
+
+async def _evaluate_group(
+    start: int,
+    images_base64: List[str],
+    prompt: str,
+    criteria: List[str],
+    model_override: Optional[str],
+    max_output_tokens: Optional[int],
+) -> Dict[int, str]:
+    if len(images_base64) == 1:
+        return {}  # um só: vai direto para a avaliação individual (com reparo)
+
+    per_image = output_budget("evaluate_image", max_output_tokens, criteria_count=len(criteria))
+    input_items = _build_multi_input(prompt, images_base64)
+    try:
+        response = await routed_call(
+            "evaluate_image_multi",
+            lambda backend, model: backend.respond(
+                model=model,
+                input=input_items,
+                max_output_tokens=per_image * len(images_base64),
+            ),
+            model_override,
+        )
+        sections = split_multi_image_output(response.output_text or "", len(images_base64))
+    except Exception:
+        logger.exception("[evaluation_multi] falha no grupo a partir da imagem %d; avaliando individualmente", start)
+        return {}
+
+    valid: Dict[int, str] = {}
+    for idx, text in sections.items():
+        missing, summary_missing = find_missing_evaluation_parts(text, criteria)
+        if not missing and not summary_missing:
+            valid[start + idx] = text
+    return valid
+
+
+async def evaluate_images(
+    questionnaire: str,
+    images_base64: List[str],
+    prompt: str,
+    criteria: List[str],
+    model_override: Optional[str] = None,
+    max_output_tokens: Optional[int] = None,
+    group_size: Optional[int] = None,
+) -> List[ImageEvaluation]:
+    """
+    Avalia todas as imagens, na ordem da entrada. Falhas individuais voltam
+    em `ImageEvaluation.error`.
+    """
+    size = max(1, group_size or EVALUATION_MULTI_GROUP_SIZE)
+    check_input_budget("evaluate_image", prompt, _build_multi_instructions(size))
+
+    groups = [(start, images_base64[start:start + size]) for start in range(0, len(images_base64), size)]
+    metrics.incr("evaluation_multi.groups", len(groups))
+    metrics.observe("evaluation_multi.images", len(images_base64))
+
+    grouped = await asyncio.gather(*(
+        _evaluate_group(start, group, prompt, criteria, model_override, max_output_tokens)
+        for start, group in groups
+    ))
+    done: Dict[int, str] = {}
+    for part in grouped:
+        done.update(part)
+
+    results = [ImageEvaluation(index=i, message=done.get(i)) for i in range(len(images_base64))]
+    fallbacks = [r for r in results if r.message is None]
+    if fallbacks:
+        metrics.incr("evaluation_multi.fallbacks", len(fallbacks))
+        outcomes = await asyncio.gather(
+            *(
+                evaluate_image(
+                    questionnaire,
+                    images_base64[r.index],
+                    prompt=prompt,
+                    criteria=criteria,
+                    model_override=model_override,
+                    max_output_tokens=max_output_tokens,
+                )
+                for r in fallbacks
+            ),
+            return_exceptions=True,
+        )
+        for r, outcome in zip(fallbacks, outcomes):
+            if isinstance(outcome, Exception):
+                r.error = outcome
+            else:
+                r.message, _response_id = outcome
+    return results
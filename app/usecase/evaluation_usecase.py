@@ -1,39 +1,399 @@
+import asyncio
 import json
+import logging
+import os
 import re
+import statistics
 from collections import defaultdict
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
 
-from app.openai_client import get_client, get_model
+from app import metrics
+from app.model_routing import routed_call
 from app.prompts import PROMPTS
+from app.schemas import CriterionConsensus
+from app.tokens import check_input_budget, output_budget
+from app.usecase.image_tiling_usecase import TILE_MIME, slice_tall_image
+
+logger = logging.getLogger("evaluation")
 
 PROMPT_QUESTION = "avaliacao_questionario"
 PROMPT_REPORT = "avaliacao_geral"
 
-async def evaluate_image(questionnaire: str, image_base64: str) -> str:
+# Quantas vezes pedimos ao modelo para completar uma avaliação incompleta
+EVALUATION_REPAIR_MAX_ATTEMPTS = int(os.getenv("EVALUATION_REPAIR_MAX_ATTEMPTS", "2"))
+# Se "1", uma avaliação que continua incompleta após os reparos gera ValueError
+EVALUATION_REPAIR_STRICT = os.getenv("EVALUATION_REPAIR_STRICT", "0") in ("1", "true", "True")
+
+SUMMARY_MARKER = "Resumo Executivo"
+
+# Amostragem (self-consistency): "n" pede as k amostras numa única chamada
+# (Chat Completions com `n`; se o modelo recusar, cai para "parallel");
+# "parallel" faz k chamadas simultâneas reaproveitando o mesmo input.
+EVALUATION_SAMPLING_MODE = os.getenv("EVALUATION_SAMPLING_MODE", "n")
+
+# Trechos de uma captura alta avaliados ao mesmo tempo
+EVALUATION_TILE_CONCURRENCY = int(os.getenv("EVALUATION_TILE_CONCURRENCY", "4"))
+# Itens por lista no Resumo Executivo mesclado dos trechos
+_MERGED_SUMMARY_ITEMS = 5
+
+
+async def evaluate_image(
+    questionnaire: str,
+    image_base64: str,
+    prompt: Optional[str] = None,
+    criteria: Optional[List[str]] = None,
+    model_override: Optional[str] = None,
+    max_output_tokens: Optional[int] = None,
+) -> Tuple[str, Optional[str]]:
     """
     Recebe o questionário (markdown) + imagem base64 e pede para o LLM avaliar.
+    Se a saída vier incompleta, pede só o que faltou (mesma conversa).
+    `prompt`/`criteria` podem vir pré-calculados (ex.: questionário registrado).
+
+    Retorna (avaliação, id da última resposta do provedor). O id permite
+    continuar a conversa (follow-ups); é None quando a avaliação foi feita
+    por trechos, em várias conversas.
+    """
+    if prompt is None:
+        prompt = PROMPTS[PROMPT_QUESTION].format(message=questionnaire)
+    if criteria is None:
+        criteria = extract_criteria_titles(questionnaire)
+
+    # só o texto entra na estimativa; os tokens da imagem dependem do provedor
+    check_input_budget("evaluate_image", prompt)
+    max_tokens = output_budget("evaluate_image", max_output_tokens, criteria_count=len(criteria))
+
+    # capturas de página inteira: avalia por trechos legíveis (decodificação fora do loop)
+    tiles = await asyncio.to_thread(slice_tall_image, image_base64)
+    if tiles:
+        return await _evaluate_tiles(tiles, prompt, criteria, model_override, max_tokens), None
+
+    response = await routed_call(
+        "evaluate_image",
+        lambda backend, model: backend.respond(
+            model=model,
+            input=build_evaluation_input(prompt, image_data_url(image_base64)),
+            max_output_tokens=max_tokens,
+        ),
+        model_override,
+    )
+
+    return await _repair_evaluation(response, criteria, model_override)
+
+
+def image_data_url(image_base64: str, mime: str = "image/jpeg") -> str:
+    return f"data:{mime};base64,{image_base64}"
+
+
+def _build_tile_note(index: int, total: int) -> str:
+    return (
+        f"\n\nATENÇÃO: esta imagem é o trecho {index} de {total} (de cima para baixo) de uma página longa, "
+        "com uma pequena sobreposição entre trechos. Avalie apenas o que está visível neste trecho. "
+        "Se um critério não puder ser verificado neste trecho, use N/A no lugar da nota."
+    )
+
+
+def _tile_score_re(criterion: str) -> "re.Pattern[str]":
+    return re.compile(rf"(?m)^{re.escape(criterion)}:\s*([1-5]|N/?A)\s*$", re.IGNORECASE)
+
+
+async def _evaluate_tiles(
+    tiles: List[str],
+    prompt: str,
+    criteria: List[str],
+    model_override: Optional[str],
+    max_tokens: int,
+) -> str:
     """
-    client = get_client()
-    model = get_model()
-    prompt = PROMPTS[PROMPT_QUESTION].format(message=questionnaire)
+    Avalia cada trecho (paralelismo limitado) e mescla: pior nota por
+    critério, listas do resumo sem duplicatas. Trechos sem saída são
+    ignorados; se todos falharem, a exceção do primeiro é propagada.
+    """
+    metrics.incr("evaluation.tiled")
+    metrics.observe("evaluation.tiles", len(tiles))
+    semaphore = asyncio.Semaphore(max(1, EVALUATION_TILE_CONCURRENCY))
+
+    async def run_tile(i: int, tile: str) -> str:
+        tile_input = build_evaluation_input(prompt + _build_tile_note(i, len(tiles)), image_data_url(tile, TILE_MIME))
+        async with semaphore:
+            response = await routed_call(
+                "evaluate_image_tile",
+                lambda backend, model: backend.respond(model=model, input=tile_input, max_output_tokens=max_tokens),
+                model_override,
+            )
+        return response.output_text or ""
+
+    outcomes = await asyncio.gather(
+        *(run_tile(i, tile) for i, tile in enumerate(tiles, start=1)),
+        return_exceptions=True,
+    )
+    outputs = [o for o in outcomes if not isinstance(o, Exception)]
+    if not outputs:
+        raise outcomes[0]
+    if len(outputs) < len(tiles):
+        metrics.incr("evaluation.tiles.failed", len(tiles) - len(outputs))
+        logger.warning("[evaluate_image] %d de %d trechos falharam", len(tiles) - len(outputs), len(tiles))
+    return merge_tile_evaluations(outputs, criteria)
 
-    response = await client.responses.create(
-        model=model,
-        input=[
+
+def merge_tile_evaluations(outputs: List[str], criteria: List[str]) -> str:
+    """
+    Uma avaliação no formato normal a partir das avaliações dos trechos.
+    Nota do critério = pior nota entre os trechos que puderam verificá-lo
+    (3, o fallback do prompt, se nenhum pôde).
+    """
+    scores: Dict[str, int] = {}
+    for c in criteria:
+        pattern = _tile_score_re(c)
+        values = [int(m.group(1)) for o in outputs for m in pattern.finditer(o) if m.group(1).isdigit()]
+        scores[c] = min(values) if values else 3
+
+    sections: Dict[str, List[str]] = {"positives": [], "problems": [], "priorities": []}
+    seen: Dict[str, set] = {k: set() for k in sections}
+    for o in outputs:
+        q = parse_evaluation_message(o)
+        for key, items in sections.items():
+            for item in q[key]:
+                norm = re.sub(r"\W+", " ", item.lower()).strip()
+                if norm and norm not in seen[key]:
+                    seen[key].add(norm)
+                    items.append(item)
+
+    lines = [f"{c}: {scores[c]}" for c in criteria]
+    overall = f"{sum(scores.values()) / len(scores):.1f}".replace(".", ",") if scores else "N/A"
+    lines += ["", SUMMARY_MARKER, "✅ Pontos Positivos:"]
+    lines += [f"- {i}" for i in sections["positives"][:_MERGED_SUMMARY_ITEMS]]
+    lines.append("❌ Principais Problemas:")
+    lines += [f"- {i}" for i in sections["problems"][:_MERGED_SUMMARY_ITEMS]]
+    lines.append(f"📊 Pontuação Geral: {overall}")
+    lines.append("🔧 Prioridades de Correção:")
+    lines += [f"{n}. {i}" for n, i in enumerate(sections["priorities"][:_MERGED_SUMMARY_ITEMS], start=1)]
+    return "\n".join(lines)
+
+
+def build_evaluation_input(prompt: str, image_url: str) -> List[Dict[str, Any]]:
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "input_text", "text": prompt},
+                {"type": "input_image", "image_url": image_url},
+            ],
+        }
+    ]
+
+
+@dataclass
+class SampledEvaluation:
+    message: str  # amostra mais próxima da mediana (texto completo, com Resumo Executivo)
+    samples: List[str] = field(default_factory=list)
+    consensus: List[CriterionConsensus] = field(default_factory=list)
+
+
+async def evaluate_image_samples(
+    questionnaire: str,
+    image_base64: str,
+    samples: int,
+    prompt: Optional[str] = None,
+    criteria: Optional[List[str]] = None,
+    model_override: Optional[str] = None,
+    max_output_tokens: Optional[int] = None,
+) -> SampledEvaluation:
+    """
+    Avalia a mesma imagem `samples` vezes e devolve a consolidação por
+    critério (mediana, média, dispersão). A data URL da imagem e o input
+    são montados uma única vez e reaproveitados por todas as amostras.
+    Amostras incompletas contam só com as notas presentes (sem reparo);
+    amostras que falham ficam de fora, e só sem nenhuma a exceção propaga.
+    Se a chamada com `n` devolver menos escolhas, o resto vem de chamadas
+    avulsas.
+    """
+    if prompt is None:
+        prompt = PROMPTS[PROMPT_QUESTION].format(message=questionnaire)
+    if criteria is None:
+        criteria = extract_criteria_titles(questionnaire)
+
+    check_input_budget("evaluate_image", prompt)
+    max_tokens = output_budget("evaluate_image", max_output_tokens, criteria_count=len(criteria))
+    image_url = image_data_url(image_base64)
+    metrics.observe("evaluation.samples", samples)
+
+    outputs: List[str] = []
+    if EVALUATION_SAMPLING_MODE == "n" and samples > 1:
+        chat_messages = [
             {
                 "role": "user",
                 "content": [
-                    {"type": "input_text", "text": prompt},
-                    {
-                        "type": "input_image",
-                        "image_url": f"data:image/jpeg;base64,{image_base64}",
-                    },
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": image_url}},
                 ],
             }
-        ],
+        ]
+        try:
+            completion = await routed_call(
+                "evaluate_image_samples",
+                lambda backend, model: backend.chat(
+                    model=model,
+                    messages=chat_messages,
+                    n=samples,
+                    max_completion_tokens=max_tokens,
+                ),
+                model_override,
+            )
+            outputs = [c.message.content or "" for c in completion.choices[:samples]]
+            metrics.incr("evaluation.samples.single_call")
+        except Exception:
+            logger.exception("[evaluate_image] amostragem com n=%d falhou; usando chamadas paralelas", samples)
+            metrics.incr("evaluation.samples.single_call_failed")
+        if 0 < len(outputs) < samples:
+            # servidores compatíveis podem ignorar `n` e devolver uma escolha só
+            metrics.incr("evaluation.samples.shortfall", samples - len(outputs))
+            logger.warning("[evaluate_image] n=%d devolveu %d amostras; completando com chamadas", samples, len(outputs))
+
+    missing = samples - len(outputs)
+    if missing > 0:
+        input_items = build_evaluation_input(prompt, image_url)
+        outcomes = await asyncio.gather(
+            *(
+                routed_call(
+                    "evaluate_image",
+                    lambda backend, model: backend.respond(model=model, input=input_items, max_output_tokens=max_tokens),
+                    model_override,
+                )
+                for _ in range(missing)
+            ),
+            return_exceptions=True,
+        )
+        errors = [o for o in outcomes if isinstance(o, Exception)]
+        outputs += [o.output_text for o in outcomes if not isinstance(o, Exception)]
+        if not outputs:
+            raise errors[0]
+        if errors:
+            # consolida as amostras que vieram em vez de descartar as já pagas
+            metrics.incr("evaluation.samples.failed", len(errors))
+            logger.warning("[evaluate_image] %d de %d amostras falharam", len(errors), samples)
+
+    return consolidate_samples(outputs, criteria)
+
+
+def parse_criterion_scores(output: str, criteria: List[str]) -> Dict[str, int]:
+    scores: Dict[str, int] = {}
+    for c in criteria:
+        m = _score_line_re(c).search(output)
+        if m:
+            scores[c] = int(m.group(0).rsplit(":", 1)[1])
+    return scores
+
+
+def consolidate_samples(outputs: List[str], criteria: List[str]) -> SampledEvaluation:
+    parsed = [parse_criterion_scores(o, criteria) for o in outputs]
+
+    consensus: List[CriterionConsensus] = []
+    medians: Dict[str, float] = {}
+    for c in criteria:
+        vals = [p[c] for p in parsed if c in p]
+        if not vals:
+            consensus.append(CriterionConsensus(name=c, n=0))
+            continue
+        medians[c] = statistics.median(vals)
+        consensus.append(CriterionConsensus(
+            name=c,
+            n=len(vals),
+            median=float(medians[c]),
+            mean=statistics.fmean(vals),
+            stdev=statistics.stdev(vals) if len(vals) > 1 else 0.0,
+            min=float(min(vals)),
+            max=float(max(vals)),
+        ))
+
+    # representante: completo primeiro, depois o mais próximo da mediana (L1)
+    def rank(i: int) -> Tuple[int, float]:
+        missing, summary_missing = find_missing_evaluation_parts(outputs[i], criteria)
+        distance = sum(abs(parsed[i].get(c, medians[c]) - medians[c]) for c in medians)
+        return (len(missing) + int(summary_missing), distance)
+
+    best = min(range(len(outputs)), key=rank) if outputs else None
+    if best is not None and find_missing_evaluation_parts(outputs[best], criteria)[0]:
+        metrics.incr("evaluation.samples.incomplete_representative")
+
+    return SampledEvaluation(
+        message=outputs[best] if best is not None else "",
+        samples=outputs,
+        consensus=consensus,
     )
 
-    return response.output_text
+
+async def _repair_evaluation(
+    response, criteria: List[str], model_override: Optional[str] = None
+) -> Tuple[str, Optional[str]]:
+    """
+    Valida a avaliação e, se faltarem notas ou o Resumo Executivo, continua a
+    conversa (previous_response_id) pedindo apenas as partes ausentes.
+    A imagem e o questionário não são reenviados.
+    """
+    output = response.output_text
+    missing, summary_missing = find_missing_evaluation_parts(output, criteria)
+    if not missing and not summary_missing:
+        metrics.incr("evaluation.valid_first_try")
+        return output, response.id
+
+    metrics.incr("evaluation.incomplete")
+    last_response_id = response.id
+
+    for attempt in range(1, EVALUATION_REPAIR_MAX_ATTEMPTS + 1):
+        metrics.incr("evaluation.repair.attempts")
+        logger.info(
+            "[evaluate_image] reparo %d/%d | criterios_faltando=%d resumo_faltando=%s",
+            attempt, EVALUATION_REPAIR_MAX_ATTEMPTS, len(missing), summary_missing,
+        )
+        try:
+            repair_prompt = _build_repair_prompt(missing, summary_missing)
+            repair = await routed_call(
+                "evaluation_repair",
+                lambda backend, model: backend.respond(
+                    model=model,
+                    previous_response_id=last_response_id,
+                    input=[{"role": "user", "content": repair_prompt}],
+                    max_output_tokens=output_budget("evaluation_repair", criteria_count=len(missing)),
+                ),
+                model_override,
+            )
+        except Exception:
+            logger.exception("[evaluate_image] falha na chamada de reparo")
+            metrics.incr("evaluation.repair.errors")
+            break
+
+        last_response_id = repair.id
+        output = merge_evaluation_outputs(output, repair.output_text, criteria)
+        missing, summary_missing = find_missing_evaluation_parts(output, criteria)
+        if not missing and not summary_missing:
+            metrics.incr("evaluation.repair.success")
+            return output, last_response_id
+
+    metrics.incr("evaluation.repair.exhausted")
+    logger.warning(
+        "[evaluate_image] avaliação segue incompleta após reparos | criterios_faltando=%s resumo_faltando=%s",
+        missing, summary_missing,
+    )
+    if EVALUATION_REPAIR_STRICT:
+        validate_evaluation_output(output, criteria)
+    return output, last_response_id
+
+
+def _build_repair_prompt(missing: List[str], summary_missing: bool) -> str:
+    parts = ["Sua avaliação anterior ficou incompleta. Responda SOMENTE com o que falta, no mesmo formato."]
+    if missing:
+        parts.append(
+            "Retorne uma linha \"<NOME DO CRITÉRIO>: <NOTA>\" (NOTA inteira 1 a 5) para cada critério abaixo, nesta ordem:"
+        )
+        parts.extend(missing)
+    if summary_missing:
+        parts.append(
+            f"Depois, retorne o bloco \"{SUMMARY_MARKER}\" completo, exatamente como especificado nas instruções iniciais."
+        )
+    parts.append("Não repita critérios já avaliados e não inclua explicações.")
+    return "\n".join(parts)
 
 
 _CRITERION_RE = re.compile(r"^\s*\d+\.\s*(.+?):\s*(\d+)\s*$")
@@ -175,8 +535,6 @@ async def generate_executive_report(results: List[str]) -> str:
     """
     Recebe várias respostas de avaliação (strings) e gera um relatório bonito.
     """
-    client = get_client()
-    model = get_model()
 
     agg = aggregate_evaluations(results)
 
@@ -189,34 +547,81 @@ async def generate_executive_report(results: List[str]) -> str:
         "top_positives": agg["common_positives"][:5],
     }
 
-    response = await client.responses.create(
-        model=model,
-        input=[
-            {
-                "role": "system",
-                "content": base_prompt,
-            },
-            {
-                "role": "user",
-                "content": (
-                    "Use o diagnóstico consolidado a seguir como verdade e apenas reescreva de forma coesa, curta e priorizada.\n\n"
-                    f"{agg['diagnosis_markdown']}\n\n"
-                    f"Dados estruturados (JSON): {json.dumps(structured_summary, ensure_ascii=False)}\n\n"
-                    "Produza: (1) resumo executivo curto; (2) 3–5 problemas mais comuns; (3) 3 recomendações práticas."
-                ),
-            },
-        ],
+    user_content = (
+        "Use o diagnóstico consolidado a seguir como verdade e apenas reescreva de forma coesa, curta e priorizada.\n\n"
+        f"{agg['diagnosis_markdown']}\n\n"
+        f"Dados estruturados (JSON): {json.dumps(structured_summary, ensure_ascii=False)}\n\n"
+        "Produza: (1) resumo executivo curto; (2) 3–5 problemas mais comuns; (3) 3 recomendações práticas."
+    )
+
+    check_input_budget("executive_report", base_prompt, user_content)
+
+    response = await routed_call(
+        "executive_report",
+        lambda backend, model: backend.respond(
+            model=model,
+            input=[
+                {"role": "system", "content": base_prompt},
+                {"role": "user", "content": user_content},
+            ],
+            max_output_tokens=output_budget("executive_report"),
+        ),
     )
 
     return response.output_text
 
 
 def extract_criteria_titles(questionnaire: str) -> list[str]:
-    return [m.group(1).strip() for m in re.finditer(r"(?m)^###\s+(.+)$", questionnaire)]
+    # "### Resumo Executivo" (quando vier como heading) não é critério
+    return [
+        m.group(1).strip()
+        for m in re.finditer(r"(?m)^###\s+(.+)$", questionnaire)
+        if SUMMARY_MARKER not in m.group(1)
+    ]
+
+def _score_line_re(criterion: str) -> "re.Pattern[str]":
+    return re.compile(rf"(?m)^{re.escape(criterion)}:\s*[1-5]\s*$")
+
+def find_missing_evaluation_parts(output: str, criteria: list[str]) -> Tuple[List[str], bool]:
+    """
+    Retorna (critérios sem linha de nota, se falta o bloco 'Resumo Executivo').
+    """
+    missing = [c for c in criteria if not _score_line_re(c).search(output)]
+    return missing, SUMMARY_MARKER not in output
+
+def merge_evaluation_outputs(original: str, repair: str, criteria: list[str]) -> str:
+    """
+    Junta a avaliação original com a resposta de reparo:
+    - notas na ordem do questionário (original tem prioridade);
+    - Resumo Executivo do original, ou do reparo se o original não tiver.
+    """
+    orig_head, orig_has_summary, orig_summary = original.partition(SUMMARY_MARKER)
+    rep_head, rep_has_summary, rep_summary = repair.partition(SUMMARY_MARKER)
+
+    if orig_has_summary:
+        summary = (SUMMARY_MARKER + orig_summary).strip()
+    elif rep_has_summary:
+        summary = (SUMMARY_MARKER + rep_summary).strip()
+    else:
+        summary = ""
+
+    if criteria:
+        lines: List[str] = []
+        for c in criteria:
+            pattern = _score_line_re(c)
+            m = pattern.search(orig_head) or pattern.search(rep_head)
+            if m:
+                lines.append(m.group(0).strip())
+        head = "\n".join(lines)
+    else:
+        # sem critérios conhecidos: preserva o corpo original
+        head = orig_head.strip()
+
+    return f"{head}\n\n{summary}".strip()
 
 def validate_evaluation_output(output: str, criteria: list[str]) -> None:
-    for c in criteria:
-        if not re.search(rf"(?m)^{re.escape(c)}:\s*[1-5]\s*$", output):
-            raise ValueError(f"Resposta inválida: faltando linha de nota para '{c}'")
-    if "Resumo Executivo" not in output:
+    missing, summary_missing = find_missing_evaluation_parts(output, criteria)
+    if missing:
+        raise ValueError(f"Resposta inválida: faltando linha de nota para '{missing[0]}'")
+    if summary_missing:
         raise ValueError("Resposta inválida: faltando bloco 'Resumo Executivo'")
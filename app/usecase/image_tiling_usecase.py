@@ -0,0 +1,97 @@
+"""
+Fatiamento de capturas de página inteira (muito altas) em trechos.
+
+Uma captura 1280×12000 enviada inteira é reduzida pelo provedor e o texto
+fica ilegível. Aqui ela vira trechos do tamanho de uma tela (largura
+original, altura = largura × EVALUATION_TILE_ASPECT), com sobreposição
+para não cortar elementos ao meio. Usa Pillow (opcional, importado só
+quando necessário); o trabalho é síncrono e deve rodar fora do event loop
+(`asyncio.to_thread`).
+"""
+from __future__ import annotations
+
+import base64
+import io
+import logging
+import math
+import os
+from typing import List, Optional
+
+logger = logging.getLogger("image_tiling")
+
+EVALUATION_TILING_ENABLED = os.getenv("EVALUATION_TILING", "1") in ("1", "true", "True")
+# Só fatia imagens com altura >= largura × este fator
+EVALUATION_TILE_MIN_RATIO = float(os.getenv("EVALUATION_TILE_MIN_RATIO", "2.5"))
+# Altura do trecho em relação à largura (1.25 ≈ 1280×1600)
+EVALUATION_TILE_ASPECT = float(os.getenv("EVALUATION_TILE_ASPECT", "1.25"))
+# Fração da altura do trecho repetida no trecho seguinte
+EVALUATION_TILE_OVERLAP = float(os.getenv("EVALUATION_TILE_OVERLAP", "0.1"))
+EVALUATION_MAX_TILES = int(os.getenv("EVALUATION_MAX_TILES", "10"))
+
+TILE_MIME = "image/png"
+
+_pillow_missing_logged = False
+
+
+def _import_pillow():
+    global _pillow_missing_logged
+    try:
+        from PIL import Image
+    except ImportError:
+        if not _pillow_missing_logged:
+            logger.warning("[image_tiling] Pillow ausente; imagens altas serão enviadas inteiras")
+            _pillow_missing_logged = True
+        return None
+    return Image
+
+
+def tile_offsets(width: int, height: int) -> List[tuple]:
+    """(topo, base) de cada trecho; vazio se a imagem não for alta o bastante."""
+    if width <= 0 or height < width * EVALUATION_TILE_MIN_RATIO:
+        return []
+
+    tile_h = max(1, int(width * EVALUATION_TILE_ASPECT))
+    overlap = int(tile_h * EVALUATION_TILE_OVERLAP)
+    count = math.ceil((height - overlap) / max(1, tile_h - overlap))
+    if count > EVALUATION_MAX_TILES:
+        # trechos mais altos para caber no limite (mantendo a sobreposição)
+        count = EVALUATION_MAX_TILES
+        tile_h = math.ceil((height + (count - 1) * overlap) / count)
+    step = tile_h - overlap
+
+    offsets = []
+    for i in range(count):
+        top = min(i * step, height - tile_h)
+        offsets.append((max(0, top), min(height, top + tile_h)))
+    return offsets
+
+
+def slice_tall_image(image_base64: str) -> Optional[List[str]]:
+    """
+    Devolve os trechos (PNG em base64, de cima para baixo) ou None se a
+    imagem não precisar ser fatiada, não puder ser lida ou Pillow faltar.
+    """
+    if not EVALUATION_TILING_ENABLED:
+        return None
+    Image = _import_pillow()
+    if Image is None:
+        return None
+
+    try:
+        raw = base64.b64decode(image_base64, validate=False)
+        with Image.open(io.BytesIO(raw)) as img:
+            offsets = tile_offsets(*img.size)
+            if not offsets:
+                return None
+            img.load()
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            tiles = []
+            for top, bottom in offsets:
+                buf = io.BytesIO()
+                img.crop((0, top, img.width, bottom)).save(buf, format="PNG", compress_level=1)
+                tiles.append(base64.b64encode(buf.getvalue()).decode("ascii"))
+            return tiles
+    except Exception:
+        logger.exception("[image_tiling] não foi possível fatiar a imagem; enviando inteira")
+        return None
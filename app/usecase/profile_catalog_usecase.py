@@ -0,0 +1,208 @@
+"""
+Catálogo pré-computado dos perfis embutidos (`BUILTIN_PROFILES`).
+
+Para cada perfil guardamos o questionário de `/questionnaires/from-profile`
+e as diretrizes + questionário de `/condition/generate`. Cada entrada é
+indexada por uma impressão digital dos prompts enviados e do modelo que a
+rota usaria: se um prompt ou a política de modelos mudar, a chave muda e a
+entrada deixa de ser servida até ser regenerada.
+
+PROFILE_CATALOG controla o modo: "0" (padrão) desliga; "load" só carrega
+as entradas de PROFILE_CATALOG_DIR (geradas por outro processo, sem chamar
+o LLM); "1" também as gera em segundo plano no startup e, a cada
+PROFILE_CATALOG_REFRESH_S, regenera as que mudaram de chave ou passaram de
+PROFILE_CATALOG_MAX_AGE_S (a antiga continua sendo servida até a nova ficar
+pronta). A geração não conta na saúde dos backends: um aquecimento que
+falha não tira o backend de uso antes do primeiro usuário. O caminho da
+requisição só consulta a memória.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from app import metrics
+from app.model_routing import get_route, without_health_accounting
+from app.prompts import BUILTIN_PROFILES, prompt_hash
+from app.usecase.profile_create_usecase import create_profile_assets, profile_asset_prompts
+from app.usecase.questionnaire_usecase import generate_from_profile, generation_prompts
+
+logger = logging.getLogger("profile_catalog")
+
+PROFILE_CATALOG_MODE = os.getenv("PROFILE_CATALOG", "0").strip().lower()
+PROFILE_CATALOG_GENERATE = PROFILE_CATALOG_MODE in ("1", "true")
+PROFILE_CATALOG_ENABLED = PROFILE_CATALOG_GENERATE or PROFILE_CATALOG_MODE == "load"
+# Diretório opcional para persistir o catálogo entre reinícios (vazio = só memória)
+PROFILE_CATALOG_DIR = os.getenv("PROFILE_CATALOG_DIR", "")
+PROFILE_CATALOG_REFRESH_S = float(os.getenv("PROFILE_CATALOG_REFRESH_S", "3600"))
+PROFILE_CATALOG_MAX_AGE_S = float(os.getenv("PROFILE_CATALOG_MAX_AGE_S", str(7 * 24 * 3600)))
+
+QUESTIONNAIRE = "questionnaire"
+ASSETS = "assets"
+KINDS = (QUESTIONNAIRE, ASSETS)
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    kind: str
+    profile: str
+    key: str
+    # questionário (str) ou {"guidelines", "questionnaire"}
+    content: Any
+    # prompt devolvido em `used_prompt` (só questionário)
+    prompt: Optional[str]
+    generated_at: float
+
+
+def _norm(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip()).casefold()
+
+
+def match_builtin(name: str, description: str) -> Optional[str]:
+    """
+    Chave do perfil embutido pedido: o nome (chave ou nome canônico) e a
+    descrição precisam bater; descrição vazia aceita a canônica.
+    """
+    n, d = _norm(name), _norm(description)
+    for key, (canonical_name, canonical_description) in BUILTIN_PROFILES.items():
+        if n in (key, _norm(canonical_name)) and d in ("", _norm(canonical_description)):
+            return key
+    return None
+
+
+def catalog_key(kind: str, profile: str) -> str:
+    name, description = BUILTIN_PROFILES[profile]
+    if kind == QUESTIONNAIRE:
+        parts = [*generation_prompts(name, description), get_route("questionnaire_generate").primary]
+    else:
+        parts = [
+            *profile_asset_prompts(name, description),
+            get_route("create_profile_assets.guidelines").primary,
+            get_route("create_profile_assets.questionnaire").primary,
+        ]
+    return prompt_hash("\x00".join(parts))
+
+
+async def _generate(kind: str, profile: str) -> Tuple[Any, Optional[str]]:
+    name, description = BUILTIN_PROFILES[profile]
+    if kind == QUESTIONNAIRE:
+        content, prompt = await generate_from_profile(name, description, model_override=None)
+        return content, prompt
+    return await create_profile_assets(name=name, description=description), None
+
+
+class ProfileCatalog:
+    def __init__(self, directory: str = PROFILE_CATALOG_DIR):
+        self.directory = directory
+        self._entries: Dict[Tuple[str, str], CatalogEntry] = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind: str, profile: str) -> str:
+        return os.path.join(self.directory, f"{kind}-{profile}.json")
+
+    def load(self) -> int:
+        """Carrega as entradas persistidas (mesmo com chave antiga; o refresh decide)."""
+        if not self.directory:
+            return 0
+        loaded = 0
+        for kind in KINDS:
+            for profile in BUILTIN_PROFILES:
+                try:
+                    with open(self._path(kind, profile), encoding="utf-8") as f:
+                        entry = CatalogEntry(**json.load(f))
+                except FileNotFoundError:
+                    continue
+                except (OSError, ValueError, TypeError):
+                    logger.exception("[profile_catalog] entrada ilegível: %s/%s", kind, profile)
+                    continue
+                self._entries[(kind, profile)] = entry
+                loaded += 1
+        return loaded
+
+    def _persist(self, entry: CatalogEntry) -> None:
+        if not self.directory:
+            return
+        path = self._path(entry.kind, entry.profile)
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(asdict(entry), f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError:
+            logger.exception("[profile_catalog] falha ao gravar %s", path)
+
+    def lookup(self, kind: str, name: str, description: str) -> Optional[CatalogEntry]:
+        profile = match_builtin(name, description)
+        if profile is None:
+            return None
+        entry = self._entries.get((kind, profile))
+        if entry is None or entry.key != catalog_key(kind, profile):
+            metrics.incr(f"profile_catalog.{kind}.misses")
+            return None
+        metrics.incr(f"profile_catalog.{kind}.hits")
+        return entry
+
+    def _stale(self, kind: str, profile: str, now: float) -> bool:
+        entry = self._entries.get((kind, profile))
+        return (
+            entry is None
+            or entry.key != catalog_key(kind, profile)
+            or now - entry.generated_at > PROFILE_CATALOG_MAX_AGE_S
+        )
+
+    async def refresh(self) -> int:
+        """Regenera (uma por vez) as entradas ausentes, de chave antiga ou vencidas."""
+        refreshed = 0
+        for kind in KINDS:
+            for profile in BUILTIN_PROFILES:
+                if not self._stale(kind, profile, time.time()):
+                    continue
+                key = catalog_key(kind, profile)
+                start = time.perf_counter()
+                try:
+                    with without_health_accounting():
+                        content, prompt = await _generate(kind, profile)
+                except Exception as e:
+                    metrics.incr("profile_catalog.refresh_errors")
+                    logger.warning("[profile_catalog] falha ao gerar %s/%s: %s", kind, profile, e)
+                    continue
+                entry = CatalogEntry(kind, profile, key, content, prompt, time.time())
+                self._entries[(kind, profile)] = entry
+                self._persist(entry)
+                refreshed += 1
+                metrics.incr("profile_catalog.refreshes")
+                metrics.observe("profile_catalog.refresh_s", time.perf_counter() - start)
+        return refreshed
+
+    async def run(self, interval_s: float = PROFILE_CATALOG_REFRESH_S, generate: bool = PROFILE_CATALOG_GENERATE) -> None:
+        """
+        Tarefa de fundo: carrega do disco e, se `generate`, aquece e mantém o
+        catálogo atualizado.
+        """
+        loaded = await asyncio.to_thread(self.load)
+        logger.info("[profile_catalog] %d entradas carregadas do disco", loaded)
+        while generate:
+            try:
+                refreshed = await self.refresh()
+                if refreshed:
+                    logger.info("[profile_catalog] %d entradas regeneradas", refreshed)
+            except Exception:
+                logger.exception("[profile_catalog] falha no refresh")
+            await asyncio.sleep(interval_s)
+
+
+_catalog: Optional[ProfileCatalog] = None
+
+
+def get_profile_catalog() -> ProfileCatalog:
+    global _catalog
+    if _catalog is None:
+        _catalog = ProfileCatalog()
+    return _catalog
@@ -1,16 +1,13 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
 import os
 import re
-from app.openai_client import get_client, get_model
+from app.model_routing import routed_call
+from app.tokens import check_input_budget, output_budget
 
 logger = logging.getLogger("profile_create")
-if not logger.handlers:
-    logging.basicConfig(level=logging.INFO)
-
-DEBUG = os.getenv("DEBUG", "0") in ("1", "true", "True")
 
 
 def _snip(text: str, n: int = 400) -> str:
@@ -178,22 +175,28 @@ _STATIC_RULES_SYSTEM = (
 
 
 # =========================
-# PROMPT JSON (com regras injetadas)
+# PROMPTS (um por artefato; gerados em paralelo)
 # =========================
-PROMPT_JSON_SPEC = """
+PROMPT_GUIDELINES_SPEC = """
 Você é um especialista em acessibilidade cognitiva.
-Gere uma resposta ESTRITAMENTE em JSON (sem markdown, sem explicações) no formato:
-
-{{
-  "guidelines": "Markdown com diretrizes recomendadas (W3C/WCAG/COGA/GAIA) para o perfil informado",
-  "questionnaire": "Markdown com questionário: critérios com notas Likert (1–5) e Resumo Executivo"
-}}
+Gere **apenas** as diretrizes recomendadas (W3C/WCAG/COGA/GAIA) para o perfil informado.
 
 Requisitos:
-- "guidelines": sintetize recomendações práticas mapeadas às diretrizes W3C/WCAG/COGA (cite GAIA apenas se realmente pertinente). Entregue em Markdown com subtítulos e bullets.
-- "questionnaire": **seguir estritamente as REGRAS DURAS abaixo** (imagem estática, formato por critério, referências do CATÁLOGO, âncoras 1/2/3/4/5, Resumo Executivo).
-- NÃO inclua cercas de código (```), apenas JSON puro.
-- NÃO envolva o JSON em Markdown.
+- Sintetize recomendações práticas mapeadas às diretrizes W3C/WCAG/COGA (cite GAIA apenas se realmente pertinente).
+- Entregue em Markdown com subtítulos e bullets.
+- NÃO inclua questionário, critérios com notas ou Resumo Executivo.
+- NÃO inclua cercas de código (```) nem texto antes/depois das diretrizes.
+
+Contexto do perfil:
+Nome: {name}
+Descrição: \"\"\"{description}\"\"\"
+""".strip()
+
+PROMPT_QUESTIONNAIRE_SPEC = """
+Você é um especialista em acessibilidade cognitiva.
+Gere **apenas** o questionário (Markdown) com critérios com notas Likert (1–5) e Resumo Executivo para o perfil informado,
+**seguindo estritamente as REGRAS DURAS abaixo** (imagem estática, formato por critério, referências do CATÁLOGO, âncoras 1/2/3/4/5, Resumo Executivo).
+- NÃO inclua cercas de código (```) nem texto antes/depois do questionário.
 
 Contexto do perfil:
 Nome: {name}
@@ -203,6 +206,11 @@ REGRAS DURAS E CATÁLOGO (uso obrigatório):
 {STATIC_RULES}
 """.strip()
 
+_SYSTEM_PROMPT = "Você é um assistente especialista em acessibilidade (WCAG/COGA) e geração de questionários."
+
+# Quantas vezes refazemos apenas a parte (diretrizes ou questionário) que falhou
+PROFILE_ASSETS_MAX_RETRIES = int(os.getenv("PROFILE_ASSETS_MAX_RETRIES", "1"))
+
 
 # =========================
 # Pós-processamento + validação do questionário
@@ -274,93 +282,133 @@ def _validate_questionnaire_shape(q: str) -> None:
 # =========================
 # Função principal
 # =========================
-async def create_profile_assets(name: str, description: str, model_override: str | None = None) -> dict:
+_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*\n(.*?)\n\s*```\s*$", re.DOTALL)
+
+def _strip_code_fences(text: str) -> str:
+    m = _FENCE_RE.match(text)
+    return m.group(1).strip() if m else text
+
+
+def _postprocess_guidelines(raw: str) -> str:
+    guidelines = _strip_code_fences(raw)
+    if not guidelines:
+        raise ValueError("Diretrizes vazias.")
+    return guidelines
+
+
+def _postprocess_questionnaire(raw: str) -> str:
+    questionnaire = _strip_code_fences(raw)
+    if not questionnaire:
+        raise ValueError("Questionário vazio.")
+
+    # ✅ Fallback/defesa: remove "Critério X:" se o modelo insistir
+    questionnaire = _strip_criterion_prefixes(questionnaire)
+
+    # ✅ Força o Resumo Executivo a ser template fixo
+    questionnaire = _sanitize_questionnaire_template(questionnaire)
+
+    # ✅ Valida shape mínimo (evita questionários “tortos”)
+    _validate_questionnaire_shape(questionnaire)
+    return questionnaire
+
+
+async def _generate_part(
+    model_override: str | None,
+    part: str,
+    user_prompt: str,
+    postprocess,
+    max_output_tokens: int | None = None,
+) -> str:
+    """
+    Gera UMA parte (diretrizes ou questionário), refazendo só ela em caso de falha.
+    Erros de chamada viram RuntimeError; saída inválida vira ValueError.
+    """
+    route = f"create_profile_assets.{part}"
+    check_input_budget(route, _SYSTEM_PROMPT, user_prompt)
+    max_tokens = output_budget(route, max_output_tokens)
+
+    last_error: Exception | None = None
+    for attempt in range(PROFILE_ASSETS_MAX_RETRIES + 1):
+        logger.debug("[create_profile_assets] chamando o LLM (%s, tentativa %d)", part, attempt + 1)
+        try:
+            completion = await routed_call(
+                route,
+                lambda backend, model: backend.chat(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": _SYSTEM_PROMPT},
+                        {"role": "user", "content": user_prompt},
+                    ],
+                    temperature=0.2,
+                    max_completion_tokens=max_tokens,
+                ),
+                model_override,
+            )
+        except Exception as e:
+            logger.exception("[create_profile_assets] erro chamando OpenAI (%s)", part)
+            last_error = RuntimeError(f"Falha na chamada do LLM ({part}): {e}")
+            continue
+
+        raw = (completion.choices[0].message.content or "").strip()
+        logger.info("[create_profile_assets] %s raw length=%d", part, len(raw))
+        logger.debug("[create_profile_assets] raw %s (primeiros 400 chars):\n%s", part, _snip(raw))
+
+        try:
+            return postprocess(raw)
+        except ValueError as e:
+            err_msg = f"Falha ao processar {part} do LLM: {e} raw_snip={_snip(raw)}"
+            logger.error("[create_profile_assets] %s", err_msg)
+            last_error = ValueError(err_msg)
+
+    assert last_error is not None
+    raise last_error
+
+
+def profile_asset_prompts(name: str, description: str) -> tuple[str, str, str]:
+    """(system, prompt das diretrizes, prompt do questionário) usados por create_profile_assets."""
+    guidelines_prompt = PROMPT_GUIDELINES_SPEC.format(name=name, description=description)
+    questionnaire_prompt = PROMPT_QUESTIONNAIRE_SPEC.format(
+        name=name,
+        description=description,
+        STATIC_RULES=_STATIC_RULES_SYSTEM,
+    )
+    return _SYSTEM_PROMPT, guidelines_prompt, questionnaire_prompt
+
+
+async def create_profile_assets(
+    name: str,
+    description: str,
+    model_override: str | None = None,
+    max_output_tokens: int | None = None,
+) -> dict:
     """
     Retorna { "guidelines": str, "questionnaire": str } para o perfil informado.
+    As duas partes são geradas em chamadas concorrentes e validadas de forma independente.
     """
     logger.info("[create_profile_assets] start | name=%s", name)
-    if DEBUG:
-        print("[DEBUG] Montando prompt…")
 
-    client = get_client()
-    model = get_model(model_override)
 
-    user_prompt = PROMPT_JSON_SPEC.format(
-        name=name,
-        description=description,
-        STATIC_RULES=_STATIC_RULES_SYSTEM,
+    _, guidelines_prompt, questionnaire_prompt = profile_asset_prompts(name, description)
+
+    logger.debug("[create_profile_assets] modelo (override): %s", model_override)
+    logger.debug("[create_profile_assets] prompt do questionário (primeiros 400 chars):\n%s", _snip(questionnaire_prompt))
+
+    guidelines, questionnaire = await asyncio.gather(
+        _generate_part(model_override, "guidelines", guidelines_prompt, _postprocess_guidelines, max_output_tokens),
+        _generate_part(model_override, "questionnaire", questionnaire_prompt, _postprocess_questionnaire, max_output_tokens),
+        return_exceptions=True,
     )
 
-    if DEBUG:
-        print("[DEBUG] Modelo:", model)
-        print("[DEBUG] Prompt (primeiros 400 chars):\n", _snip(user_prompt))
-
-    try:
-        if DEBUG:
-            print("[DEBUG] Chamando OpenAI…")
-        completion = await client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Você é um assistente especialista em acessibilidade (WCAG/COGA) e geração de questionários.",
-                },
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.2,
-        )
-        if DEBUG:
-            print("[DEBUG] Resposta recebida da OpenAI")
-    except Exception as e:
-        logger.exception("[create_profile_assets] erro chamando OpenAI")
-        raise RuntimeError(f"Falha na chamada do LLM: {e}")
-
-    raw = (completion.choices[0].message.content or "").strip()
-    logger.info("[create_profile_assets] raw length=%d", len(raw))
-    if DEBUG:
-        print("[DEBUG] Raw (primeiros 400 chars):\n", _snip(raw))
-
-    try:
-        data = json.loads(raw)
-        guidelines = str(data.get("guidelines", "")).strip()
-        questionnaire = str(data.get("questionnaire", "")).strip()
-
-        # ✅ Fallback/defesa: remove "Critério X:" se o modelo insistir
-        questionnaire = _strip_criterion_prefixes(questionnaire)
-
-        # ✅ Força o Resumo Executivo a ser template fixo
-        questionnaire = _sanitize_questionnaire_template(questionnaire)
-
-        # ✅ Valida shape mínimo (evita questionários “tortos”)
-        _validate_questionnaire_shape(questionnaire)
-
-        if not guidelines or not questionnaire:
-            msg = "JSON válido porém campos obrigatórios ausentes (guidelines/questionnaire vazios)."
-            logger.error("[create_profile_assets] %s | raw_snip=%s", msg, _snip(raw))
-            if DEBUG:
-                print("[DEBUG][ERRO]", msg)
-            raise ValueError(msg)
-
-        logger.info("[create_profile_assets] sucesso")
-        return {"guidelines": guidelines, "questionnaire": questionnaire}
-
-    except json.JSONDecodeError as je:
-        err_msg = (
-            f"JSON inválido: {je.msg} (pos={je.pos}, ln={je.lineno}, col={je.colno}). "
-            f"Possível causa: modelo devolveu markdown ao invés de JSON puro. "
-            f"raw_snip={_snip(raw)}"
-        )
-        logger.error("[create_profile_assets] %s", err_msg)
-        if DEBUG:
-            print("[DEBUG][JSONDecodeError]", err_msg)
-        raise ValueError(err_msg)
-
-    except Exception as e:
-        err_msg = f"Falha ao processar JSON do LLM: {e}. raw_snip={_snip(raw)}"
-        logger.error("[create_profile_assets] %s", err_msg)
-        if DEBUG:
-            print("[DEBUG][Exception]", err_msg)
-        raise ValueError(err_msg)
+    # ValueError (saída inválida) tem precedência: main.py o mapeia para 502
+    errors = [r for r in (guidelines, questionnaire) if isinstance(r, BaseException)]
+    for err in errors:
+        if isinstance(err, ValueError):
+            raise err
+    if errors:
+        raise errors[0]
+
+    logger.info("[create_profile_assets] sucesso")
+    return {"guidelines": guidelines, "questionnaire": questionnaire}
 
 
 # =========================
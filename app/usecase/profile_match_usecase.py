@@ -0,0 +1,146 @@
+"""
+Casamento lexical local (BM25) entre uma descrição e os perfis existentes.
+
+Usado para responder `suggest_profile_name` sem LLM quando a descrição
+corresponde claramente a um perfil já cadastrado. O índice é construído a
+partir de nome + descrição de cada perfil (tokens sem acento, sem stopwords)
+e fica em cache por hash do conjunto de perfis.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from app.schemas import ExistingProfile
+
+# Pontuação mínima do melhor perfil para dispensar o LLM
+PROFILE_MATCH_MIN_SCORE = float(os.getenv("PROFILE_MATCH_MIN_SCORE", "1.0"))
+# Margem relativa mínima entre o 1º e o 2º colocados: (top - segundo) / top
+PROFILE_MATCH_MIN_MARGIN = float(os.getenv("PROFILE_MATCH_MIN_MARGIN", "0.6"))
+PROFILE_INDEX_CACHE_SIZE = int(os.getenv("PROFILE_INDEX_CACHE_SIZE", "128"))
+
+# peso do nome em relação à descrição (tokens do nome são repetidos)
+_NAME_WEIGHT = 2
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+_STOPWORDS = {
+    "a", "ao", "aos", "as", "com", "como", "da", "das", "de", "do", "dos", "e", "em", "na", "nas",
+    "no", "nos", "o", "os", "ou", "para", "pela", "pelas", "pelo", "pelos", "por", "que", "se",
+    "sem", "um", "uma", "uns", "umas", "tem", "ter", "ser", "sao", "muito", "mais", "menos",
+    "perfil", "pessoa", "pessoas", "usuario", "usuarios", "usuaria", "usuarias",
+}
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Minúsculas e sem acentos ("Nível" -> "nivel")."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(fold(text)) if t not in _STOPWORDS]
+
+
+@dataclass
+class ProfileIndex:
+    names: List[str]
+    folded_names: List[str]
+    doc_tfs: List[Counter]
+    doc_lens: List[int]
+    avg_len: float
+    idf: Dict[str, float]
+
+    @classmethod
+    def build(cls, profiles: List[ExistingProfile]) -> "ProfileIndex":
+        doc_tfs: List[Counter] = []
+        for p in profiles:
+            tokens = tokenize(p.name) * _NAME_WEIGHT + tokenize(p.description or "")
+            doc_tfs.append(Counter(tokens))
+        doc_lens = [sum(tf.values()) for tf in doc_tfs]
+        n_docs = len(profiles)
+        df: Counter = Counter()
+        for tf in doc_tfs:
+            df.update(tf.keys())
+        idf = {t: math.log(1 + (n_docs - n + 0.5) / (n + 0.5)) for t, n in df.items()}
+        return cls(
+            names=[p.name for p in profiles],
+            folded_names=[" ".join(_TOKEN_RE.findall(fold(p.name))) for p in profiles],
+            doc_tfs=doc_tfs,
+            doc_lens=doc_lens,
+            avg_len=(sum(doc_lens) / n_docs) if n_docs else 0.0,
+            idf=idf,
+        )
+
+    def scores(self, query: str) -> List[float]:
+        terms = set(tokenize(query))
+        out: List[float] = []
+        for tf, length in zip(self.doc_tfs, self.doc_lens):
+            norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * (length / self.avg_len if self.avg_len else 0))
+            s = 0.0
+            for t in terms:
+                f = tf.get(t)
+                if f:
+                    s += self.idf[t] * f * (_BM25_K1 + 1) / (f + norm)
+            out.append(s)
+        return out
+
+    def rank(self, query: str) -> List[Tuple[int, float]]:
+        """(índice do perfil, score) em ordem decrescente de score."""
+        return sorted(enumerate(self.scores(query)), key=lambda x: x[1], reverse=True)
+
+
+_index_cache: "OrderedDict[str, ProfileIndex]" = OrderedDict()
+
+
+def _profiles_key(profiles: List[ExistingProfile]) -> str:
+    payload = json.dumps([[p.name, p.description or ""] for p in profiles], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_profile_index(profiles: List[ExistingProfile]) -> ProfileIndex:
+    key = _profiles_key(profiles)
+    index = _index_cache.get(key)
+    if index is not None:
+        _index_cache.move_to_end(key)
+        return index
+    index = ProfileIndex.build(profiles)
+    _index_cache[key] = index
+    while len(_index_cache) > PROFILE_INDEX_CACHE_SIZE:
+        _index_cache.popitem(last=False)
+    return index
+
+
+def match_existing_profile(description: str, profiles: List[ExistingProfile]) -> Optional[str]:
+    """
+    Retorna o nome do perfil existente quando o casamento lexical é
+    inequívoco; None quando a decisão deve ficar com o LLM.
+    """
+    if not profiles:
+        return None
+
+    index = get_profile_index(profiles)
+
+    # nome idêntico (ignorando caixa/acentos/pontuação) decide na hora
+    folded_query = " ".join(_TOKEN_RE.findall(fold(description)))
+    for name, folded_name in zip(index.names, index.folded_names):
+        if folded_query and folded_query == folded_name:
+            return name
+
+    ranked = index.rank(description)
+    top_idx, top = ranked[0]
+    second = ranked[1][1] if len(ranked) > 1 else 0.0
+    if top < PROFILE_MATCH_MIN_SCORE:
+        return None
+    if (top - second) / top < PROFILE_MATCH_MIN_MARGIN:
+        return None
+    return index.names[top_idx]
@@ -1,9 +1,40 @@
+import os
 from typing import List, Optional
 from app.schemas import ExistingProfile
-from app.openai_client import get_client, get_model
+from app import metrics
+from app.model_routing import routed_call
+from app.tokens import check_input_budget, estimate_tokens, output_budget
+from app.usecase.profile_match_usecase import get_profile_index, match_existing_profile
+
+# Máximo de perfis existentes enviados ao LLM (os mais parecidos com a descrição)
+PROFILE_PROMPT_TOP_K = int(os.getenv("PROFILE_PROMPT_TOP_K", "20"))
+# Orçamento (tokens estimados) para a lista de perfis dentro do prompt
+PROFILE_PROMPT_TOKEN_BUDGET = int(os.getenv("PROFILE_PROMPT_TOKEN_BUDGET", "1500"))
+
+def _select_candidate_profiles(description: str, existing: List[ExistingProfile]) -> List[ExistingProfile]:
+    """
+    Mantém apenas os top-k perfis mais parecidos com a descrição (BM25),
+    respeitando o orçamento de tokens da lista.
+    """
+    if len(existing) <= 1:
+        return list(existing)
+    ranked = get_profile_index(existing).rank(description)
+    selected: List[ExistingProfile] = []
+    used = 0
+    for idx, _score in ranked[:PROFILE_PROMPT_TOP_K]:
+        cost = estimate_tokens(_format_profile(existing[idx]))
+        if selected and used + cost > PROFILE_PROMPT_TOKEN_BUDGET:
+            break
+        selected.append(existing[idx])
+        used += cost
+    return selected
+
+def _format_profile(p: ExistingProfile) -> str:
+    return f"- Nome: {p.name}\n  Descrição: {p.description or 'Sem descrição'}\n"
 
 def _build_profile_classification_prompt(description: str, existing: List[ExistingProfile]) -> str:
-    prompt = (
+    candidates = _select_candidate_profiles(description, existing)
+    return (
         "Você é um assistente especializado em acessibilidade cognitiva. "
         "Sua tarefa é classificar descrições de usuários em perfis cognitivos existentes "
         "ou sugerir um novo perfil, caso necessário.\n\n"
@@ -12,28 +43,40 @@ def _build_profile_classification_prompt(description: str, existing: List[Existi
         "(ex: TEA + TDAH). Evite sugestões fora do escopo da acessibilidade.\n\n"
         f"Descrição recebida:\n{description}\n\n"
         "Perfis existentes:\n"
+        + "".join(_format_profile(p) for p in candidates)
+        + "\nRetorne apenas o nome do perfil (sem explicações)."
     )
-    for p in existing:
-        prompt += f"- Nome: {p.name}\n  Descrição: {p.description or 'Sem descrição'}\n"
-    prompt += (
-        "\nRetorne apenas o nome do perfil (sem explicações)."
-    )
-    return prompt
 
-async def suggest_profile_name(description: str, existing_profiles: List[ExistingProfile], proposed_name: Optional[str] = None) -> str:
+async def suggest_profile_name(
+    description: str,
+    existing_profiles: List[ExistingProfile],
+    proposed_name: Optional[str] = None,
+    model_override: Optional[str] = None,
+) -> str:
     """
     Retorna apenas um nome de perfil sugerido/normalizado a partir da descrição e dos perfis existentes.
+    Casos inequívocos são resolvidos localmente (BM25), sem chamar o LLM.
     """
-    client = get_client()
-    model = get_model()
+    local = match_existing_profile(description, existing_profiles)
+    if local is not None:
+        metrics.incr("suggest_profile_name.local_match")
+        return local
+    metrics.incr("suggest_profile_name.llm")
+
     prompt = _build_profile_classification_prompt(description, existing_profiles)
+    check_input_budget("suggest_profile_name", prompt)
 
-    completion = await client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "Você é um assistente especialista em acessibilidade e perfis de usuários."},
-            {"role": "user", "content": prompt},
-        ],
+    completion = await routed_call(
+        "suggest_profile_name",
+        lambda backend, model: backend.chat(
+            model=model,
+            messages=[
+                {"role": "system", "content": "Você é um assistente especialista em acessibilidade e perfis de usuários."},
+                {"role": "user", "content": prompt},
+            ],
+            max_completion_tokens=output_budget("suggest_profile_name"),
+        ),
+        model_override,
     )
     decision = (completion.choices[0].message.content or "").strip()
     return decision or (proposed_name or "Perfil")
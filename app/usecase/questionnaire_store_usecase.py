@@ -0,0 +1,181 @@
+"""
+Armazenamento de questionários por hash de conteúdo.
+
+O cliente registra o questionário uma vez (`POST /questionnaires/register`) e
+passa a enviar apenas o `questionnaire_id` nas avaliações. O prompt de
+avaliação já renderizado e os títulos dos critérios ficam em memória (LRU
+limitado) e, opcionalmente, em disco para sobreviver a reinícios.
+
+Questionários enviados inline nas avaliações vão para um cache separado, só
+em memória: o tráfego normal não expulsa nem grava os ids registrados.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app import metrics
+from app.prompts import PROMPTS
+from app.usecase.evaluation_usecase import PROMPT_QUESTION, extract_criteria_titles
+
+logger = logging.getLogger("questionnaire_store")
+
+QUESTIONNAIRE_STORE_MAX_ITEMS = int(os.getenv("QUESTIONNAIRE_STORE_MAX_ITEMS", "256"))
+# Diretório opcional para persistir os questionários registrados (vazio = só memória)
+QUESTIONNAIRE_STORE_DIR = os.getenv("QUESTIONNAIRE_STORE_DIR", "")
+# arquivos mantidos em QUESTIONNAIRE_STORE_DIR (os mais antigos são apagados)
+QUESTIONNAIRE_STORE_MAX_FILES = int(os.getenv("QUESTIONNAIRE_STORE_MAX_FILES", "10000"))
+# questionários inline (não registrados) mantidos preparados em memória
+QUESTIONNAIRE_INLINE_CACHE_ITEMS = int(os.getenv("QUESTIONNAIRE_INLINE_CACHE_ITEMS", "256"))
+
+
+@dataclass(frozen=True)
+class StoredQuestionnaire:
+    id: str
+    questionnaire: str
+    prompt: str
+    criteria: List[str]
+
+
+def questionnaire_id_for(questionnaire: str) -> str:
+    return hashlib.sha256(questionnaire.encode("utf-8")).hexdigest()
+
+
+def _prepare(questionnaire: str, qid: Optional[str] = None) -> StoredQuestionnaire:
+    return StoredQuestionnaire(
+        id=qid or questionnaire_id_for(questionnaire),
+        questionnaire=questionnaire,
+        prompt=PROMPTS[PROMPT_QUESTION].format(message=questionnaire),
+        criteria=extract_criteria_titles(questionnaire),
+    )
+
+
+class QuestionnaireStore:
+    def __init__(
+        self,
+        max_items: int = QUESTIONNAIRE_STORE_MAX_ITEMS,
+        directory: str = QUESTIONNAIRE_STORE_DIR,
+        max_files: int = QUESTIONNAIRE_STORE_MAX_FILES,
+        inline_max_items: int = QUESTIONNAIRE_INLINE_CACHE_ITEMS,
+    ):
+        self.max_items = max(1, max_items)
+        self.directory = directory
+        self.max_files = max(1, max_files)
+        self._items: "OrderedDict[str, StoredQuestionnaire]" = OrderedDict()
+        self._inline: "OrderedDict[str, StoredQuestionnaire]" = OrderedDict()
+        self._inline_max_items = max(1, inline_max_items)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, qid: str) -> str:
+        return os.path.join(self.directory, f"{qid}.json")
+
+    def _remember(self, item: StoredQuestionnaire) -> None:
+        self._items[item.id] = item
+        self._items.move_to_end(item.id)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+            metrics.incr("questionnaire_store.evictions")
+
+    def _write(self, qid: str, questionnaire: str) -> None:
+        with open(self._path(qid), "w", encoding="utf-8") as f:
+            json.dump({"questionnaire": questionnaire}, f, ensure_ascii=False)
+
+        files = sorted(
+            (os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".json")),
+            key=os.path.getmtime,
+        )
+        for old in files[:-self.max_files]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def _read(self, qid: str) -> Optional[str]:
+        try:
+            with open(self._path(qid), encoding="utf-8") as f:
+                return json.load(f)["questionnaire"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    async def register(self, questionnaire: str) -> StoredQuestionnaire:
+        qid = questionnaire_id_for(questionnaire)
+        cached = self._items.get(qid)
+        if cached is not None:
+            self._items.move_to_end(qid)
+            return cached
+
+        item = self._inline.pop(qid, None) or _prepare(questionnaire, qid)
+        self._remember(item)
+        metrics.incr("questionnaire_store.registered")
+
+        if self.directory:
+            try:
+                await asyncio.to_thread(self._write, qid, questionnaire)
+            except OSError:
+                logger.exception("[questionnaire_store] falha ao gravar %s", qid)
+        return item
+
+    async def get(self, qid: str) -> Optional[StoredQuestionnaire]:
+        item = self._items.get(qid)
+        if item is not None:
+            self._items.move_to_end(qid)
+            metrics.incr("questionnaire_store.hits")
+            return item
+
+        if self.directory and len(qid) == 64 and all(ch in "0123456789abcdef" for ch in qid):
+            questionnaire = await asyncio.to_thread(self._read, qid)
+            # o prompt é renderizado de novo: o template pode ter mudado entre deploys
+            if questionnaire is not None and questionnaire_id_for(questionnaire) == qid:
+                item = _prepare(questionnaire, qid)
+                self._remember(item)
+                metrics.incr("questionnaire_store.disk_hits")
+                return item
+
+        metrics.incr("questionnaire_store.misses")
+        return None
+
+    def _inline_item(self, questionnaire: str) -> StoredQuestionnaire:
+        qid = questionnaire_id_for(questionnaire)
+        item = self._items.get(qid) or self._inline.get(qid)
+        if item is not None:
+            if qid in self._inline:
+                self._inline.move_to_end(qid)
+            metrics.incr("questionnaire_store.inline_hits")
+            return item
+
+        item = _prepare(questionnaire, qid)
+        self._inline[qid] = item
+        while len(self._inline) > self._inline_max_items:
+            self._inline.popitem(last=False)
+        return item
+
+    async def resolve(self, questionnaire: Optional[str] = None, questionnaire_id: Optional[str] = None) -> StoredQuestionnaire:
+        """
+        Devolve o questionário preparado a partir do id ou do texto completo.
+        Lança KeyError se o id não for conhecido.
+        """
+        if questionnaire_id:
+            item = await self.get(questionnaire_id)
+            if item is None:
+                raise KeyError(f"questionnaire_id desconhecido: {questionnaire_id}")
+            return item
+        if questionnaire is None:
+            raise ValueError("Informe 'questionnaire' ou 'questionnaire_id'.")
+        return self._inline_item(questionnaire)
+
+
+_store: Optional[QuestionnaireStore] = None
+
+
+def get_questionnaire_store() -> QuestionnaireStore:
+    global _store
+    if _store is None:
+        _store = QuestionnaireStore()
+    return _store
@@ -1,4 +1,19 @@
-from app.openai_client import get_client, get_model
+import asyncio
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from app import metrics
+from app.model_routing import routed_call
+from app.tokens import check_input_budget, output_budget
+
+logger = logging.getLogger("questionnaire")
+
+# Limite de saída por critério reescrito em /questionnaires/update
+QUESTIONNAIRE_SECTION_MAX_TOKENS = int(os.getenv("QUESTIONNAIRE_SECTION_MAX_TOKENS", "700"))
 
 WCAG_INDEX = [
     {"id": "1.4.3", "title": "Contrast (Minimum)", "url": "https://www.w3.org/WAI/WCAG22/Understanding/contrast-minimum"},
@@ -126,48 +141,261 @@ Atualize o questionário **mantendo formato e seções** e reforçando:
 Entrada do usuário (imagem/descrição contextual): {{message}}
 """.strip()
 
+# Regras enxutas para reescrever UM critério (sem o template de Resumo Executivo)
+_SECTION_RULES = (
+    "REGRAS DURAS:\n"
+    "- A entrada é SEMPRE **uma imagem estática**; não crie itens sobre animação, movimento, hover, foco, tempo ou áudio.\n"
+    "- Reformule itens de processo para equivalentes visuais verificáveis ou marque N/A.\n"
+    "- Saída **exclusivamente em Markdown**, em **português**, **sem cercas de código**.\n"
+    "\n"
+    + _LIKERT_ANCHORS + "\n" + _CITATION_RULES + "\n" + _render_reference_catalog()
+)
+
+def _build_relevance_prompt(titles: List[str], description_update: str) -> str:
+    numbered = "\n".join(f"{i}. {t}" for i, t in enumerate(titles, start=1))
+    return f"""
+Critérios de um questionário de acessibilidade cognitiva:
+{numbered}
+
+Nova descrição/observação a considerar:
+\"\"\"{description_update}\"\"\"
+
+Quais critérios precisam ser reescritos para refletir a nova descrição?
+Responda SOMENTE com JSON no formato {{"sections": [<números>]}} (lista vazia se nenhum).
+""".strip()
+
+def _build_section_update_prompt(section_md: str, description_update: str) -> str:
+    return f"""
+Você é um especialista em acessibilidade cognitiva.
+
+Critério atual de um questionário (Markdown):
+{section_md}
+
+Nova descrição/observação a considerar:
+\"\"\"{description_update}\"\"\"
+
+Reescreva **somente este critério**, mantendo o heading "### <Nome do Critério>" na primeira linha e os mesmos campos, reforçando:
+- **Âncoras Likert 1/3/5 específicas do critério**.
+- **Referências** apenas do **CATÁLOGO** (≤2 WCAG + 1 COGA); se não aplicável → **WCAG: N/A; COGA: N/A**.
+Não inclua outros critérios nem Resumo Executivo.
+
+{_SECTION_RULES}
+""".strip()
+
+# =========================
+# Divisão do questionário em critérios (### headings)
+# =========================
+_HEADING_RE = re.compile(r"(?m)^###\s+(.+)$")
+# só a linha de título do resumo ("Resumo Executivo", "## Resumo Executivo", "**Resumo Executivo**:"),
+# não linhas que apenas mencionam a expressão
+_SUMMARY_RE = re.compile(r"(?m)^[ \t]*(?:#{1,6}[ \t]*)?(?:\*\*)?Resumo Executivo(?:\*\*)?[ \t]*:?[ \t]*$")
+
+@dataclass
+class QuestionnaireSection:
+    title: str
+    start: int
+    end: int
+
+def split_questionnaire_sections(questionnaire_md: str) -> List[QuestionnaireSection]:
+    """
+    Localiza cada critério (do heading ### até o próximo heading ou até o
+    Resumo Executivo). Os offsets permitem recompor o texto byte a byte.
+    """
+    headings = [m for m in _HEADING_RE.finditer(questionnaire_md) if "Resumo Executivo" not in m.group(1)]
+    sections: List[QuestionnaireSection] = []
+    for i, m in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(questionnaire_md)
+        summary = _SUMMARY_RE.search(questionnaire_md, m.end(), end)
+        if summary:
+            end = summary.start()
+        sections.append(QuestionnaireSection(title=m.group(1).strip(), start=m.start(), end=end))
+    return sections
+
+def splice_sections(questionnaire_md: str, sections: List[QuestionnaireSection], replacements: dict) -> str:
+    """
+    Substitui apenas as seções em `replacements` (índice -> texto novo),
+    preservando o restante do documento sem alterações.
+    """
+    out: List[str] = []
+    cursor = 0
+    for idx, sec in enumerate(sections):
+        if idx not in replacements:
+            continue
+        original = questionnaire_md[sec.start:sec.end]
+        trailing = original[len(original.rstrip()):]
+        out.append(questionnaire_md[cursor:sec.start])
+        out.append(replacements[idx].strip() + trailing)
+        cursor = sec.end
+    out.append(questionnaire_md[cursor:])
+    return "".join(out)
+
+def _parse_relevant_sections(raw: str, total: int) -> Optional[List[int]]:
+    m = re.search(r"\{.*\}", raw, re.DOTALL)
+    if not m:
+        return None
+    try:
+        numbers = json.loads(m.group(0)).get("sections", [])
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(numbers, list):
+        return None
+    return sorted({int(n) - 1 for n in numbers if isinstance(n, int) and 1 <= n <= total})
+
 # =========================
 # API público (assinaturas inalteradas)
 # =========================
-async def generate_from_profile(profile_name: str, profile_description: str, model_override: str | None):
-    client = get_client()
-    model = get_model(model_override)
-
-    prompt = _build_generation_prompt(profile_name, profile_description)
-
-    completion = await client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "Você é um assistente especialista em acessibilidade cognitiva e deve seguir estritamente o formato solicitado."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.2,
-        top_p=0.9,
-        max_tokens=1800,
-        presence_penalty=0.0,
-        frequency_penalty=0.0,
+_SYSTEM_PROMPT = "Você é um assistente especialista em acessibilidade cognitiva e deve seguir estritamente o formato solicitado."
+
+def generation_prompts(profile_name: str, profile_description: str) -> Tuple[str, str]:
+    """(system, user) usados por generate_from_profile."""
+    return _SYSTEM_PROMPT, _build_generation_prompt(profile_name, profile_description)
+
+async def generate_from_profile(
+    profile_name: str,
+    profile_description: str,
+    model_override: str | None,
+    max_output_tokens: Optional[int] = None,
+):
+
+    _, prompt = generation_prompts(profile_name, profile_description)
+    check_input_budget("questionnaire_generate", _SYSTEM_PROMPT, prompt)
+
+    completion = await routed_call(
+        "questionnaire_generate",
+        lambda backend, model: backend.chat(
+            model=model,
+            messages=[
+                {"role": "system", "content": _SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.2,
+            top_p=0.9,
+            max_completion_tokens=output_budget("questionnaire_generate", max_output_tokens),
+            presence_penalty=0.0,
+            frequency_penalty=0.0,
+        ),
+        model_override,
     )
     content = (completion.choices[0].message.content or "").strip()
     # Nota: se quiser, aqui dá para adicionar sanitização leve (ex.: remover cercas ``` se vierem).
     return content, prompt
 
-async def update_questionnaire(questionnaire_md: str, description_update: str, model_override: str | None):
-    client = get_client()
-    model = get_model(model_override)
+async def update_questionnaire(
+    questionnaire_md: str,
+    description_update: str,
+    model_override: str | None,
+    max_output_tokens: Optional[int] = None,
+):
+    """
+    Atualiza o questionário reescrevendo apenas os critérios afetados pela nova
+    descrição. Cai para a reescrita completa se não houver headings ### ou se
+    a etapa de seleção falhar.
+    """
+    sections = split_questionnaire_sections(questionnaire_md)
+    if not sections:
+        metrics.incr("questionnaire_update.full_rewrite")
+        return await _update_questionnaire_full(questionnaire_md, description_update, model_override, max_output_tokens)
+
+
+    relevance_prompt = _build_relevance_prompt([s.title for s in sections], description_update)
+    check_input_budget("questionnaire_relevance", relevance_prompt)
+    try:
+        # etapa barata: por padrão usa o tier rápido da política de roteamento
+        completion = await routed_call(
+            "questionnaire_relevance",
+            lambda backend, model: backend.chat(
+                model=model,
+                messages=[{"role": "user", "content": relevance_prompt}],
+                temperature=0.0,
+                max_completion_tokens=output_budget("questionnaire_relevance"),
+            ),
+        )
+        selected = _parse_relevant_sections(completion.choices[0].message.content or "", len(sections))
+    except Exception:
+        logger.exception("[update_questionnaire] falha na etapa de seleção")
+        selected = None
+
+    if selected is None:
+        metrics.incr("questionnaire_update.full_rewrite")
+        return await _update_questionnaire_full(questionnaire_md, description_update, model_override, max_output_tokens)
+
+    metrics.incr("questionnaire_update.incremental")
+    metrics.observe("questionnaire_update.sections_rewritten", len(selected))
+    if not selected:
+        return questionnaire_md, relevance_prompt
+
+    section_prompts = [
+        _build_section_update_prompt(questionnaire_md[sections[i].start:sections[i].end].strip(), description_update)
+        for i in selected
+    ]
+    for p in section_prompts:
+        check_input_budget("questionnaire_update", _SYSTEM_PROMPT, p)
+    section_max_tokens = min(QUESTIONNAIRE_SECTION_MAX_TOKENS, output_budget("questionnaire_update", max_output_tokens))
+    completions = await asyncio.gather(*[
+        routed_call(
+            "questionnaire_update",
+            lambda backend, model, p=p: backend.chat(
+                model=model,
+                messages=[
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "user", "content": p},
+                ],
+                temperature=0.2,
+                top_p=0.9,
+                max_completion_tokens=section_max_tokens,
+            ),
+            model_override,
+        )
+        for p in section_prompts
+    ], return_exceptions=True)
+
+    failures = [c for c in completions if isinstance(c, Exception)]
+    if failures and len(failures) == len(completions):
+        raise failures[0]
+
+    replacements = {}
+    for idx, completion in zip(selected, completions):
+        if isinstance(completion, Exception):
+            # como na saída inválida: uma seção com falha mantém o texto original
+            logger.warning("[update_questionnaire] falha ao reescrever '%s' (%s); mantendo original", sections[idx].title, completion)
+            metrics.incr("questionnaire_update.section_errors")
+            continue
+        content = (completion.choices[0].message.content or "").strip()
+        # só aceita se o modelo devolveu um único critério começando pelo heading
+        if content.startswith("###") and len(_HEADING_RE.findall(content)) == 1:
+            replacements[idx] = content
+        else:
+            logger.warning("[update_questionnaire] saída inválida para '%s'; mantendo original", sections[idx].title)
+
+    content = splice_sections(questionnaire_md, sections, replacements)
+    used_prompt = "\n\n---\n\n".join([relevance_prompt, *section_prompts])
+    return content, used_prompt
+
+async def _update_questionnaire_full(
+    questionnaire_md: str,
+    description_update: str,
+    model_override: str | None,
+    max_output_tokens: Optional[int] = None,
+):
 
     prompt = _build_update_prompt(questionnaire_md, description_update)
+    check_input_budget("questionnaire_update", _SYSTEM_PROMPT, prompt)
 
-    completion = await client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "Você é um assistente especialista em acessibilidade cognitiva e deve seguir estritamente o formato solicitado."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.2,
-        top_p=0.9,
-        max_tokens=1800,
-        presence_penalty=0.0,
-        frequency_penalty=0.0,
+    completion = await routed_call(
+        "questionnaire_update",
+        lambda backend, model: backend.chat(
+            model=model,
+            messages=[
+                {"role": "system", "content": _SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.2,
+            top_p=0.9,
+            max_completion_tokens=output_budget("questionnaire_update", max_output_tokens),
+            presence_penalty=0.0,
+            frequency_penalty=0.0,
+        ),
+        model_override,
     )
     content = (completion.choices[0].message.content or "").strip()
     return content, prompt
@@ -0,0 +1,192 @@
+"""
+Concordância entre avaliações repetidas e intervalos de confiança.
+
+A matriz de notas tem uma linha por avaliação (mensagem) e uma coluna por
+critério, com NaN onde o critério não apareceu. Sobre ela:
+
+- alfa de Krippendorff (métrica intervalar, aceita lacunas): critérios são
+  as unidades, avaliações são os avaliadores;
+- ICC(2,1) de Shrout & Fleiss (concordância absoluta) sobre a submatriz
+  completa: critérios presentes em pelo menos metade das avaliações e as
+  avaliações que trazem todos eles;
+- IC bootstrap (percentil) da média de cada critério e da pontuação global,
+  reamostrando avaliações inteiras com pesos multinomiais em blocos.
+
+Depende de NumPy, importado só aqui e só quando a consolidação roda.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("reliability")
+
+CONSOLIDATE_BOOTSTRAP_ITERATIONS = int(os.getenv("CONSOLIDATE_BOOTSTRAP_ITERATIONS", "1000"))
+CONSOLIDATE_BOOTSTRAP_SEED = int(os.getenv("CONSOLIDATE_BOOTSTRAP_SEED", "0"))
+CONSOLIDATE_CONFIDENCE = float(os.getenv("CONSOLIDATE_CONFIDENCE", "0.95"))
+
+# reamostragens por bloco: limita a memória da matriz de pesos (bloco × avaliações)
+_BOOTSTRAP_BLOCK = 256
+
+Interval = Tuple[float, float]
+
+
+@dataclass
+class ReliabilityResult:
+    krippendorff_alpha: Optional[float] = None
+    icc: Optional[float] = None
+    icc_criteria: int = 0
+    icc_evaluations: int = 0
+    bootstrap_iterations: int = 0
+    confidence: float = CONSOLIDATE_CONFIDENCE
+    criterion_ci: Dict[str, Interval] = field(default_factory=dict)
+    overall_ci: Optional[Interval] = None
+
+
+def _import_numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    return np
+
+
+def krippendorff_alpha_interval(np, x) -> Optional[float]:
+    """x: avaliações × unidades, NaN = ausente."""
+    mask = ~np.isnan(x)
+    m_u = mask.sum(axis=0)
+    pairable = m_u >= 2
+    if not pairable.any():
+        return None
+
+    v = np.where(mask, x, 0.0)[:, pairable]
+    m_u = m_u[pairable].astype(float)
+    s1 = v.sum(axis=0)
+    s2 = (v * v).sum(axis=0)
+    n = m_u.sum()
+
+    # soma de (vi - vj)^2 sobre pares ordenados i != j = 2 (m Σv² - (Σv)²)
+    d_o = (2 * (m_u * s2 - s1 * s1) / (m_u - 1)).sum() / n
+    t1, t2 = s1.sum(), s2.sum()
+    d_e = 2 * (n * t2 - t1 * t1) / (n * (n - 1))
+    if d_e <= 0:
+        # sem variação nenhuma: concordância perfeita só se também não há desacordo
+        return 1.0 if d_o == 0 else None
+    return float(1 - d_o / d_e)
+
+
+def icc_2_1(np, y) -> Optional[float]:
+    """y: alvos (critérios) × avaliadores (avaliações), sem lacunas."""
+    n, k = y.shape
+    if n < 2 or k < 2:
+        return None
+    grand = y.mean()
+    ss_rows = k * ((y.mean(axis=1) - grand) ** 2).sum()
+    ss_cols = n * ((y.mean(axis=0) - grand) ** 2).sum()
+    ss_total = ((y - grand) ** 2).sum()
+    ms_r = ss_rows / (n - 1)
+    ms_c = ss_cols / (k - 1)
+    ms_e = (ss_total - ss_rows - ss_cols) / ((n - 1) * (k - 1))
+    denom = ms_r + (k - 1) * ms_e + k * (ms_c - ms_e) / n
+    if denom <= 0:
+        return None
+    return float((ms_r - ms_e) / denom)
+
+
+def bootstrap_means(np, x, iterations: int, seed: int, confidence: float) -> Tuple[List[Optional[Interval]], Optional[Interval]]:
+    """
+    IC percentil das médias por coluna e da média das médias, reamostrando
+    linhas. Cada bloco sorteia pesos multinomiais (quantas vezes cada linha
+    entra na reamostra) e resolve as médias com um produto matricial.
+    """
+    n_rows, n_cols = x.shape
+    mask = ~np.isnan(x)
+    filled = np.where(mask, x, 0.0)
+    maskf = mask.astype(float)
+    rng = np.random.default_rng(seed)
+
+    col_means = np.empty((iterations, n_cols))
+    done = 0
+    while done < iterations:
+        b = min(_BOOTSTRAP_BLOCK, iterations - done)
+        idx = rng.integers(0, n_rows, size=(b, n_rows))
+        idx += np.arange(b)[:, None] * n_rows
+        weights = np.bincount(idx.ravel(), minlength=b * n_rows).reshape(b, n_rows).astype(float)
+        sums = weights @ filled
+        counts = weights @ maskf
+        with np.errstate(invalid="ignore", divide="ignore"):
+            col_means[done:done + b] = sums / counts
+        done += b
+
+    alpha = (1 - confidence) / 2
+    q = [100 * alpha, 100 * (1 - alpha)]
+
+    per_col: List[Optional[Interval]] = []
+    for j in range(n_cols):
+        samples = col_means[:, j]
+        samples = samples[~np.isnan(samples)]
+        if samples.size == 0:
+            per_col.append(None)
+        else:
+            lo, hi = np.percentile(samples, q)
+            per_col.append((float(lo), float(hi)))
+
+    with np.errstate(invalid="ignore"):
+        valid = ~np.isnan(col_means)
+        overall = np.where(valid, col_means, 0.0).sum(axis=1) / valid.sum(axis=1)
+    overall = overall[~np.isnan(overall)]
+    overall_ci = None
+    if overall.size:
+        lo, hi = np.percentile(overall, q)
+        overall_ci = (float(lo), float(hi))
+    return per_col, overall_ci
+
+
+def compute_reliability(
+    score_rows: Sequence[Dict[str, float]],
+    criteria: List[str],
+    iterations: Optional[int] = None,
+    seed: Optional[int] = None,
+    confidence: float = CONSOLIDATE_CONFIDENCE,
+) -> Optional[ReliabilityResult]:
+    """
+    `score_rows`: notas por avaliação (critério -> nota). Devolve None se
+    NumPy não estiver instalado.
+    """
+    np = _import_numpy()
+    if np is None:
+        logger.warning("[reliability] NumPy ausente; concordância e IC não calculados")
+        return None
+
+    iterations = CONSOLIDATE_BOOTSTRAP_ITERATIONS if iterations is None else iterations
+    seed = CONSOLIDATE_BOOTSTRAP_SEED if seed is None else seed
+
+    result = ReliabilityResult(confidence=confidence)
+    if not score_rows or not criteria:
+        return result
+
+    col = {c: j for j, c in enumerate(criteria)}
+    x = np.full((len(score_rows), len(criteria)), np.nan)
+    for i, scores in enumerate(score_rows):
+        for c, v in scores.items():
+            j = col.get(c)
+            if j is not None:
+                x[i, j] = v
+
+    result.krippendorff_alpha = krippendorff_alpha_interval(np, x)
+
+    # ICC exige matriz completa: critérios frequentes × avaliações que têm todos eles
+    frequent = np.isnan(x).mean(axis=0) <= 0.5
+    sub = x[:, frequent]
+    y = sub[~np.isnan(sub).any(axis=1)].T
+    result.icc_criteria, result.icc_evaluations = y.shape
+    result.icc = icc_2_1(np, y)
+
+    if iterations > 0 and len(score_rows) >= 2:
+        per_col, overall_ci = bootstrap_means(np, x, iterations, seed, confidence)
+        result.bootstrap_iterations = iterations
+        result.criterion_ci = {c: ci for c, ci in zip(criteria, per_col) if ci is not None}
+        result.overall_ci = overall_ci
+    return result
@@ -0,0 +1,302 @@
+"""
+Teste de carga com tráfego gravado (cassete de RECORD_CASSETTE).
+
+1) sobe um backend substituto compatível com a API da OpenAI que devolve as
+   respostas gravadas, esperando a latência original de cada troca
+   (× --latency-scale); as chamadas são associadas pela impressão digital do
+   texto enviado (`app.recording.llm_fingerprint`), e as sem par recebem uma
+   resposta gravada do mesmo tipo (contadas como `unmatched`);
+2) sobe a aplicação (uvicorn) com todos os backends apontando para ele;
+3) reenvia as requisições gravadas com --concurrency requisições em voo até
+   completar --requests (o cassete é repetido em ciclo, se preciso);
+4) imprime throughput e p50/p95/p99 por endpoint.
+
+Uso:
+    python scripts/replay_load.py cassette.jsonl [--concurrency 16] [--requests 500]
+        [--latency-scale 1.0] [--workers 1] [--routing-file política.json] [--json relatorio.json]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict, deque
+from typing import Dict, List, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_cassette(path: str) -> Tuple[List[dict], List[dict]]:
+    requests, exchanges = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("type") == "request":
+                requests.append(record)
+            elif record.get("type") == "llm":
+                exchanges.append(record)
+    return requests, exchanges
+
+
+# =========================
+# Backend substituto
+# =========================
+
+def build_standin_app(exchanges: List[dict], latency_scale: float):
+    from app.recording import llm_fingerprint
+
+    by_fingerprint: Dict[str, deque] = defaultdict(deque)
+    by_kind: Dict[str, List[dict]] = defaultdict(list)
+    for ex in exchanges:
+        by_fingerprint[ex["fingerprint"]].append(ex)
+        by_kind[ex["kind"]].append(ex)
+    round_robin = {kind: itertools.cycle(items) for kind, items in by_kind.items()}
+    stats = {"matched": 0, "unmatched": 0, "missing": 0}
+
+    app = FastAPI()
+
+    async def replay(kind: str, request: Request):
+        payload = await request.json()
+        queue = by_fingerprint.get(llm_fingerprint(kind, payload))
+        if queue:
+            ex = queue[0]
+            queue.rotate(-1)  # gravações repetidas da mesma chamada se alternam
+            stats["matched"] += 1
+        elif kind in round_robin:
+            ex = next(round_robin[kind])
+            stats["unmatched"] += 1
+        else:
+            stats["missing"] += 1
+            return JSONResponse({"error": {"message": f"nenhuma troca '{kind}' no cassete"}}, status_code=404)
+        await asyncio.sleep(ex["latency_s"] * latency_scale)
+        return JSONResponse(ex["response"])
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        return await replay("chat", request)
+
+    @app.post("/v1/responses")
+    async def responses(request: Request):
+        return await replay("respond", request)
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "replay", "object": "model", "created": 0, "owned_by": "replay"}]}
+
+    @app.get("/_stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def serve_standin(args) -> int:
+    import uvicorn
+
+    _, exchanges = load_cassette(args.cassette)
+    uvicorn.run(build_standin_app(exchanges, args.latency_scale), port=args.serve_standin, log_level="warning")
+    return 0
+
+
+# =========================
+# Gerador de carga
+# =========================
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout_s: float = 30.0) -> None:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout_s:
+        try:
+            with urllib.request.urlopen(url, timeout=0.5) as r:
+                if r.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{url} não respondeu a tempo")
+
+
+def _routing_policy(standin_url: str, routing_file: str) -> dict:
+    policy: dict = {}
+    if routing_file:
+        with open(routing_file, encoding="utf-8") as f:
+            policy = json.load(f)
+    # todos os backends (inclusive o padrão) viram o substituto
+    names = set(policy.get("backends", {})) | {"openai"}
+    policy["backends"] = {name: {"base_url": standin_url} for name in names}
+    return policy
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+async def drive(base_url: str, requests: List[dict], concurrency: int, total: int) -> Tuple[Dict[str, list], float]:
+    import httpx
+
+    results: Dict[str, list] = defaultdict(list)  # caminho -> [(status, latência)]
+    source = itertools.islice(itertools.cycle(requests), total)
+
+    async def worker(client):
+        for req in source:
+            url = req["path"] + (f"?{req['query']}" if req.get("query") else "")
+            body = req["body"].encode("utf-8") if req.get("body") is not None else None
+            start = time.perf_counter()
+            try:
+                r = await client.request(req["method"], url, content=body, headers=req.get("headers") or {})
+                status = r.status_code
+            except httpx.HTTPError:
+                status = 0
+            results[req["path"]].append((status, time.perf_counter() - start))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return results, wall
+
+
+def report(results: Dict[str, list], wall: float) -> dict:
+    out = {"wall_s": round(wall, 3), "endpoints": {}}
+    all_latencies = []
+    for path in sorted(results):
+        rows = results[path]
+        latencies = sorted(lat for _, lat in rows)
+        all_latencies.extend(latencies)
+        statuses: Dict[str, int] = defaultdict(int)
+        for status, _ in rows:
+            statuses[str(status)] += 1
+        out["endpoints"][path] = {
+            "requests": len(rows),
+            "errors": sum(1 for status, _ in rows if not 200 <= status < 300),
+            "throughput_rps": round(len(rows) / wall, 2),
+            "p50_ms": round(_percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1),
+            "statuses": dict(statuses),
+        }
+    all_latencies.sort()
+    out["total"] = {
+        "requests": len(all_latencies),
+        "throughput_rps": round(len(all_latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(_percentile(all_latencies, 0.50) * 1000, 1),
+        "p95_ms": round(_percentile(all_latencies, 0.95) * 1000, 1),
+        "p99_ms": round(_percentile(all_latencies, 0.99) * 1000, 1),
+    }
+    return out
+
+
+def print_report(rep: dict) -> None:
+    print(f"{'endpoint':<34} {'req':>6} {'erros':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for path, row in rep["endpoints"].items():
+        print(
+            f"{path:<34} {row['requests']:>6} {row['errors']:>6} {row['throughput_rps']:>8.2f} "
+            f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}"
+        )
+    t = rep["total"]
+    print(
+        f"{'TOTAL':<34} {t['requests']:>6} {'':>6} {t['throughput_rps']:>8.2f} "
+        f"{t['p50_ms']:>9.1f} {t['p95_ms']:>9.1f} {t['p99_ms']:>9.1f}"
+    )
+    print(f"duração: {rep['wall_s']:.2f}s | backend substituto: {rep.get('standin')}")
+
+
+def run_load(args) -> int:
+    requests, exchanges = load_cassette(args.cassette)
+    if not requests:
+        print("cassete sem requisições gravadas")
+        return 1
+    print(f"cassete: {len(requests)} requisições, {len(exchanges)} trocas com o LLM")
+
+    standin_port, app_port = _free_port(), _free_port()
+    standin_url = f"http://127.0.0.1:{standin_port}"
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(_routing_policy(f"{standin_url}/v1", args.routing_file), f)
+        policy_path = f.name
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env.update({
+        "MODEL_ROUTING_FILE": policy_path,
+        "OPENAI_API_KEY": "replay",
+        "RECORD_CASSETTE": "",
+        "PROFILE_CATALOG": "0",
+        "LLM_HEALTH_INTERVAL_S": "0",
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+    })
+
+    procs = []
+    try:
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), os.path.abspath(args.cassette),
+             "--serve-standin", str(standin_port), "--latency-scale", str(args.latency_scale)],
+            cwd=ROOT, env=env,
+        ))
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=ROOT, env=env,
+        ))
+        _wait_ready(f"{standin_url}/v1/models")
+        _wait_ready(f"http://127.0.0.1:{app_port}/health")
+
+        results, wall = asyncio.run(drive(f"http://127.0.0.1:{app_port}", requests, args.concurrency, args.requests or len(requests)))
+        rep = report(results, wall)
+        with urllib.request.urlopen(f"{standin_url}/_stats", timeout=5) as r:
+            rep["standin"] = json.load(r)
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait(timeout=10)
+        os.unlink(policy_path)
+
+    print_report(rep)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rep, f, indent=2)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cassette")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=0, help="total de requisições (padrão: uma passada no cassete)")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=1, help="workers do uvicorn")
+    parser.add_argument("--routing-file", default="", help="política de modelos a manter (backends são substituídos)")
+    parser.add_argument("--json", default="", help="grava o relatório neste arquivo")
+    # uso interno: processo do backend substituto
+    parser.add_argument("--serve-standin", type=int, default=0, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_standin:
+        return serve_standin(args)
+    return run_load(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
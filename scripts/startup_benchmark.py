@@ -0,0 +1,105 @@
+"""
+Benchmark de cold start.
+
+1) `python -X importtime -c "import app.main"` -> tempo total de import e os
+   módulos mais caros (cumulativo);
+2) sobe o uvicorn numa porta livre e mede o tempo até o primeiro 200 em /health.
+
+Uso:
+    python scripts/startup_benchmark.py [--top 15] [--max-import-s 1.0] [--max-healthy-s 3.0]
+
+Com --max-*, sai com código 1 se o limite for ultrapassado (guarda contra regressões).
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def measure_imports(top: int) -> float:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT, env=_env(), capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  <self us> | <cumulative us> | <módulo>"
+        own_part, cumulative_part, name = line.split("|", 2)
+        own_us = own_part.split(":", 1)[1]
+        rows.append((int(cumulative_part), int(own_us), name.strip()))
+
+    total = next((c for c, _, n in rows if n == "app.main"), max(c for c, _, _ in rows))
+    print(f"import app.main: {total / 1e6:.3f}s")
+    print(f"{'cumulativo (ms)':>16} {'próprio (ms)':>13}  módulo")
+    for cumulative, own, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1e3:16.1f} {own / 1e3:13.1f}  {name}")
+    return total / 1e6
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_healthy(timeout_s: float = 30.0) -> float:
+    port = _free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=_env(),
+    )
+    try:
+        while time.perf_counter() - start < timeout_s:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=0.5) as r:
+                    if r.status == 200:
+                        elapsed = time.perf_counter() - start
+                        print(f"primeiro /health 200: {elapsed:.3f}s")
+                        return elapsed
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("servidor não respondeu /health a tempo")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-import-s", type=float, default=None)
+    parser.add_argument("--max-healthy-s", type=float, default=None)
+    args = parser.parse_args()
+
+    import_s = measure_imports(args.top)
+    healthy_s = measure_first_healthy()
+
+    failed = False
+    if args.max_import_s is not None and import_s > args.max_import_s:
+        print(f"REGRESSÃO: import {import_s:.3f}s > {args.max_import_s:.3f}s")
+        failed = True
+    if args.max_healthy_s is not None and healthy_s > args.max_healthy_s:
+        print(f"REGRESSÃO: primeiro /health {healthy_s:.3f}s > {args.max_healthy_s:.3f}s")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
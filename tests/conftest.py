@@ -0,0 +1,14 @@
+import pytest
+
+from app import model_routing
+from tests.fakes import FakeBackend
+
+
+@pytest.fixture
+def fake_backend():
+    """Instala um FakeBackend como backend padrão da política de roteamento."""
+    backend = FakeBackend()
+    model_routing.set_policy(None)
+    model_routing._backends = {backend.name: backend}
+    yield backend
+    model_routing.set_policy(None)
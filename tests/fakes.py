@@ -0,0 +1,33 @@
+"""Dublês do LLM usados pelos testes (nenhum teste acessa a rede)."""
+from types import SimpleNamespace
+
+from app.llm_backends import LLMBackend
+
+
+def chat_completion(text: str, usage=None):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=usage,
+    )
+
+
+class FakeBackend(LLMBackend):
+    """Backend sem rede: `chat`/`respond` delegam para funções do teste."""
+
+    def __init__(self, name: str = "openai", chat=None, respond=None):
+        super().__init__()
+        self.name = name
+        self.calls = []
+        self._chat = chat or (lambda **kwargs: chat_completion("ok"))
+        self._respond = respond
+
+    def client(self):
+        raise AssertionError("os testes não chamam o SDK")
+
+    async def chat(self, **kwargs):
+        self.calls.append(("chat", kwargs))
+        return self._chat(**kwargs)
+
+    async def respond(self, **kwargs):
+        self.calls.append(("respond", kwargs))
+        return self._respond(**kwargs)
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from app import metrics
+from app.admission import AdmissionControlMiddleware, EndpointLimits, OTHER_PATHS
+
+
+async def _ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _request(middleware, path, body=b"", headers=()):
+    sent = []
+    received = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return received.pop(0) if received else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "headers": list(headers)}
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"], sent
+
+
+def test_unknown_paths_share_one_gate():
+    mw = AdmissionControlMiddleware(_ok_app, global_capacity=10, limits={"/analyze": EndpointLimits()})
+    for i in range(50):
+        _request(mw, f"/debug/profiles/{i}")
+    assert set(mw._gates) == {"/analyze", OTHER_PATHS}
+
+
+def test_body_size_limit_is_checked_before_the_app():
+    mw = AdmissionControlMiddleware(_ok_app, global_capacity=10, limits={"/analyze": EndpointLimits(max_body_bytes=10)})
+    status, _ = _request(mw, "/analyze", headers=[(b"content-length", b"11")])
+    assert status == 413
+    # sem Content-Length, conta os bytes recebidos
+    assert _request(mw, "/analyze", body=b"x" * 11)[0] == 413
+    assert _request(mw, "/analyze", body=b"x" * 10)[0] == 200
+
+
+def test_rejections_on_unknown_paths_use_a_fixed_metric_label():
+    before = metrics.snapshot()["counters"].get(f"admission.rejected.413.{OTHER_PATHS}", 0)
+    mw = AdmissionControlMiddleware(_ok_app, global_capacity=10, limits={})
+    status, sent = _request(mw, "/qualquer/coisa", headers=[(b"content-length", str(10 * 1024 * 1024).encode())])
+    assert status == 413
+    assert "excede" in json.loads(sent[1]["body"])["detail"]
+    counters = metrics.snapshot()["counters"]
+    assert counters[f"admission.rejected.413.{OTHER_PATHS}"] == before + 1
+    assert not any(k.endswith("/qualquer/coisa") for k in counters)
+
+
+def test_full_queue_returns_429_with_retry_after():
+    limits = {"/analyze": EndpointLimits(max_concurrency=1, max_queue=0)}
+    release = None
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await _ok_app(scope, receive, send)
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        mw = AdmissionControlMiddleware(slow_app, global_capacity=10, limits=limits)
+        statuses = []
+
+        async def one():
+            sent = []
+
+            async def receive():
+                return {"type": "http.request", "body": b"", "more_body": False}
+
+            async def send(message):
+                sent.append(message)
+
+            await mw({"type": "http", "method": "POST", "path": "/analyze", "headers": []}, receive, send)
+            statuses.append((sent[0]["status"], dict(sent[0]["headers"])))
+
+        first = asyncio.create_task(one())
+        await asyncio.sleep(0)
+        await one()
+        release.set()
+        await first
+        return statuses
+
+    statuses = asyncio.run(run())
+    assert statuses[0][0] == 429 and b"retry-after" in statuses[0][1]
+    assert statuses[1][0] == 200
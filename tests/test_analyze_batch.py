@@ -0,0 +1,72 @@
+import asyncio
+
+from app.usecase import analyze_batch_usecase as ab
+from app.tokens import usage_scope
+from app.usecase import analyze_usecase as au
+from tests.fakes import chat_completion
+
+
+def test_split_batch_output_ignores_missing_duplicate_and_out_of_range():
+    raw = (
+        "<<<RESULTADO 1>>>\nprimeira\n<<<FIM 1>>>\n"
+        "<<<RESULTADO 1>>>\nrepetida\n<<<FIM 1>>>\n"
+        "<<<RESULTADO 3>>>\n \n<<<FIM 3>>>\n"
+        "<<<RESULTADO 9>>>\nfora\n<<<FIM 9>>>"
+    )
+    assert ab.split_batch_output(raw, 3) == {0: "primeira"}
+
+
+def test_batch_prompt_delimits_each_entry():
+    prompt = ab._build_batch_prompt("tea", ["um", "dois"])
+    assert "<<<ENTRADA 1>>>\num\n<<<FIM ENTRADA 1>>>" in prompt
+    assert "<<<ENTRADA 2>>>\ndois\n<<<FIM ENTRADA 2>>>" in prompt
+
+
+def test_concurrent_requests_share_one_call_and_missing_items_fall_back(monkeypatch):
+    routes = []
+
+    async def routed_call(route, call, model_override=None):
+        routes.append(route)
+        if route == "analyze_batch":
+            return chat_completion("<<<RESULTADO 1>>>\nanálise 1\n<<<FIM 1>>>\n<<<RESULTADO 3>>>\nanálise 3\n<<<FIM 3>>>")
+        return chat_completion("individual")
+
+    monkeypatch.setattr(ab, "routed_call", routed_call)
+    monkeypatch.setattr(au, "routed_call", routed_call)
+
+    async def run():
+        batcher = ab.AnalyzeMicroBatcher(window_ms=10, max_items=8)
+        return await asyncio.gather(*(batcher.submit("tea", f"mensagem {i}", None) for i in range(3)))
+
+    results = asyncio.run(run())
+    assert [content for content, _ in results] == ["análise 1", "individual", "análise 3"]
+    # o prompt devolvido é o individual, nunca o do lote
+    assert "mensagem 1" in results[1][1] and "mensagem 0" not in results[1][1]
+    assert routes == ["analyze_batch", "analyze"]
+
+
+def test_batch_usage_is_split_across_requests(fake_backend):
+    def chat(**kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        if "<<<ENTRADA" in prompt:
+            # a 2ª entrada fica sem resultado e vai para a chamada individual
+            return chat_completion(
+                "<<<RESULTADO 1>>>\nanálise curta\n<<<FIM 1>>>",
+                usage={"prompt_tokens": 90, "completion_tokens": 30},
+            )
+        return chat_completion("individual", usage={"prompt_tokens": 40, "completion_tokens": 5})
+
+    fake_backend._chat = chat
+
+    async def request(batcher, message):
+        with usage_scope() as usage:
+            await batcher.submit("tea", message, None)
+        return usage
+
+    async def run():
+        batcher = ab.AnalyzeMicroBatcher(window_ms=10, max_items=8)
+        return await asyncio.gather(request(batcher, "m" * 10), request(batcher, "m" * 20))
+
+    first, second = asyncio.run(run())
+    assert (first.input_tokens, first.output_tokens, first.calls, first.shared_calls) == (30, 30, 1, 1)
+    assert (second.input_tokens, second.output_tokens, second.calls, second.shared_calls) == (60 + 40, 5, 2, 1)
@@ -0,0 +1,31 @@
+import asyncio
+
+from app.usecase import analyze_usecase as au
+from tests.fakes import chat_completion
+
+
+def test_analyze_many_keeps_order_and_bounds_concurrency(monkeypatch):
+    running = {"now": 0, "peak": 0}
+
+    async def routed_call(route, call, model_override=None):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+        return chat_completion(model_override)
+
+    monkeypatch.setattr(au, "routed_call", routed_call)
+    items = [("tea", "mensagem", f"m{i}", None) for i in range(10)]
+    results = asyncio.run(au.analyze_many(items, concurrency=3))
+    assert [content for content, _ in results] == [f"m{i}" for i in range(10)]
+    assert running["peak"] <= 3
+
+
+def test_analyze_many_returns_item_errors_in_place(monkeypatch):
+    async def routed_call(route, call, model_override=None):
+        return chat_completion("ok")
+
+    monkeypatch.setattr(au, "routed_call", routed_call)
+    results = asyncio.run(au.analyze_many([("tea", "a", None, None), ("inexistente", "b", None, None)]))
+    assert results[0][0] == "ok"
+    assert isinstance(results[1], ValueError)
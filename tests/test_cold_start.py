@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_app_does_not_load_heavy_sdks():
+    # processo novo: neste os testes já importaram os módulos
+    code = "import sys, app.main; print(sorted(m for m in ('openai', 'numpy', 'PIL') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_openai_client_is_created_lazily(monkeypatch):
+    from app import openai_client
+
+    monkeypatch.setattr(openai_client, "openai_api_key", "teste")
+    monkeypatch.setattr(openai_client, "_client", None)
+    client = openai_client.get_client()
+    assert openai_client.get_client() is client
@@ -0,0 +1,63 @@
+import csv
+import io
+import statistics
+
+import pytest
+
+from app.usecase.consolidate_export_usecase import RunningStats, export_consolidation, stream_csv
+
+MESSAGES = [
+    "1. Contraste: 4\n2. Clareza: 5\nPontuação Geral: 4,5",
+    "Contraste: 2\nClareza: 3",
+    "Contraste: 3",
+]
+
+
+def _csv(chunks) -> list:
+    return list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+
+
+def test_running_stats_match_statistics_module():
+    values = [4.0, 2.0, 3.0, 5.0, 1.5]
+    st = RunningStats()
+    for v in values:
+        st.add(v)
+    assert st.mean == pytest.approx(statistics.mean(values))
+    assert st.stdev == pytest.approx(statistics.stdev(values))
+    assert (st.min, st.max) == (1.5, 5.0)
+
+
+def test_scores_table_is_long_format_without_overall():
+    rows = _csv(export_consolidation(MESSAGES, table="scores"))
+    assert rows[0] == ["message_index", "criterion", "score"]
+    assert rows[1:] == [
+        ["0", "Contraste", "4.0"], ["0", "Clareza", "5.0"],
+        ["1", "Contraste", "2.0"], ["1", "Clareza", "3.0"],
+        ["2", "Contraste", "3.0"],
+    ]
+
+
+def test_stats_table_counts_coverage():
+    rows = {r[0]: r for r in _csv(export_consolidation(MESSAGES, table="stats"))[1:]}
+    assert rows["Clareza"][1:3] == ["2", "3"]
+    assert float(rows["Contraste"][3]) == pytest.approx(3.0)
+
+
+def test_csv_is_streamed_in_chunks():
+    chunks = list(stream_csv(["a"], iter([(i,) for i in range(5)]), chunk_rows=2))
+    assert len(chunks) == 3
+    assert _csv(chunks) == [["a"], ["0"], ["1"], ["2"], ["3"], ["4"]]
+
+
+def test_invalid_format_or_table():
+    with pytest.raises(ValueError):
+        export_consolidation(MESSAGES, fmt="xlsx")
+    with pytest.raises(ValueError):
+        export_consolidation(MESSAGES, table="outra")
+
+
+def test_arrow_round_trip():
+    pa = pytest.importorskip("pyarrow")
+    data = b"".join(export_consolidation(MESSAGES, table="scores", fmt="arrow"))
+    table = pa.ipc.open_stream(data).read_all()
+    assert table.column("criterion").to_pylist() == ["Contraste", "Clareza", "Contraste", "Clareza", "Contraste"]
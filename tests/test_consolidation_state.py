@@ -0,0 +1,60 @@
+import pytest
+
+from app.usecase.consolidate_usecase import (
+    aggregate_evaluations,
+    clear_consolidation_caches,
+    consolidation_state,
+)
+
+
+def _message(contraste: int, clareza: int, problem: str) -> str:
+    return (
+        f"1. Contraste: {contraste}\n2. Clareza: {clareza}\n"
+        f"Resumo Executivo\n❌ Principais Problemas:\n- {problem}\n📊 Pontuação Geral: {contraste}"
+    )
+
+
+MESSAGES = [_message(i % 5 + 1, (i * 2) % 5 + 1, f"Problema {i % 3}") for i in range(30)]
+
+
+@pytest.fixture(autouse=True)
+def _clean_caches():
+    clear_consolidation_caches()
+    yield
+    clear_consolidation_caches()
+
+
+def _summary(messages):
+    out = aggregate_evaluations(messages, bootstrap_iterations=0)
+    return (
+        [(c.name, c.n, c.mean, c.stdev, c.scores) for c in out["criteria"]],
+        out["overall"].mean_reported_overall,
+        [(i.text, i.count) for i in out["common_problems"]],
+    )
+
+
+def test_incremental_state_matches_a_cold_run():
+    for n in (10, 20, 30):
+        _summary(MESSAGES[:n])
+    incremental = _summary(MESSAGES)
+    clear_consolidation_caches()
+    assert incremental == _summary(MESSAGES)
+
+
+def test_prefix_state_is_reused_without_copying_lists():
+    prefix = consolidation_state(MESSAGES[:20])
+    extended = consolidation_state(MESSAGES[:21])
+    assert extended.seq is prefix.seq
+    # o estado do prefixo continua descrevendo só as 20 primeiras mensagens
+    assert prefix.n_messages == 20 and prefix.stats["Contraste"].n == 20
+    assert len(prefix.scores("Contraste")) == 20
+    assert sum(count for _, count in prefix.tally("problems")) == 20
+
+
+def test_diverging_lists_do_not_share_appends():
+    consolidation_state(MESSAGES[:20])
+    a = consolidation_state(MESSAGES[:20] + [_message(5, 5, "Só em A")])
+    b = consolidation_state(MESSAGES[:20] + [_message(1, 1, "Só em B")])
+    assert a.seq is not b.seq
+    assert "Só em A" not in [t for t, _ in b.tally("problems")]
+    assert b.scores("Contraste")[-1] == 1.0 and a.scores("Contraste")[-1] == 5.0
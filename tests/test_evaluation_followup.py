@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.llm_backends import BackendUnsupported
+from app.usecase import evaluation_followup_usecase as fu
+from app.usecase.evaluation_followup_usecase import EvaluationSession, EvaluationSessionStore, _is_missing_state
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code, message, code=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.code = code
+
+
+def _session(image_chars: int) -> EvaluationSession:
+    return EvaluationSession(prompt="p", image_base64="x" * image_chars, evaluation="e")
+
+
+def test_store_is_bounded_by_total_bytes():
+    store = EvaluationSessionStore(max_items=10, max_bytes=250)
+    for sid in ("a", "b", "c"):
+        store.remember(sid, _session(100))
+    assert store.get("a") is None
+    assert store.get("b") and store.get("c")
+    assert store.total_bytes == 2 * _session(100).size
+
+
+def test_oversized_session_is_not_kept():
+    store = EvaluationSessionStore(max_items=10, max_bytes=50)
+    store.remember("kept", _session(10))
+    assert store.remember("big", _session(100)) == "big"
+    assert store.get("big") is None and store.get("kept") is not None
+
+
+def test_replacing_a_session_does_not_leak_bytes():
+    store = EvaluationSessionStore(max_items=10, max_bytes=1000)
+    store.remember("a", _session(100))
+    store.remember("a", _session(50))
+    assert store.total_bytes == _session(50).size
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (ProviderError(400, "Previous response with id 'resp_1' not found."), True),
+    (ProviderError(404, "not found", code="previous_response_not_found"), True),
+    (BackendUnsupported("sem Responses API"), True),
+    (ProviderError(400, "Invalid value for 'input'.", code="invalid_value"), False),
+    (ProviderError(404, "The model 'x' does not exist", code="model_not_found"), False),
+    (ProviderError(500, "Previous response with id 'resp_1' not found."), False),
+])
+def test_is_missing_state(exc, expected):
+    assert _is_missing_state(exc) is expected
+
+
+def _run_follow_up(fake_backend, monkeypatch, error):
+    monkeypatch.setattr(fu, "_sessions", EvaluationSessionStore())
+    fu.get_evaluation_sessions().remember("resp_1", _session(4))
+
+    def respond(**kwargs):
+        if "previous_response_id" in kwargs:
+            raise error
+        return SimpleNamespace(output_text="resposta", id="resp_2")
+
+    fake_backend._respond = respond
+    return asyncio.run(fu.follow_up("resp_1", "e o contraste?"))
+
+
+def test_expired_state_replays_the_context(fake_backend, monkeypatch):
+    answer, next_id, replayed = _run_follow_up(
+        fake_backend, monkeypatch, ProviderError(400, "x", code="previous_response_not_found")
+    )
+    assert (answer, next_id, replayed) == ("resposta", "resp_2", True)
+    replay_input = fake_backend.calls[-1][1]["input"]
+    assert replay_input[-1] == {"role": "user", "content": "e o contraste?"}
+    assert fu.get_evaluation_sessions().get("resp_2").history == (("e o contraste?", "resposta"),)
+
+
+def test_other_bad_requests_are_not_replayed(fake_backend, monkeypatch):
+    with pytest.raises(ProviderError):
+        _run_follow_up(fake_backend, monkeypatch, ProviderError(400, "Invalid 'max_output_tokens'"))
+    assert len(fake_backend.calls) == 1
@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.usecase.evaluation_multi_usecase import evaluate_images, split_multi_image_output
+
+CRITERIA = ["Clareza"]
+EVALUATION = "Clareza: 4\n\nResumo Executivo\n📊 Pontuação Geral: 4"
+
+
+def _section(i: int, text: str) -> str:
+    return f"<<<IMAGEM {i}>>>\n{text}\n<<<FIM IMAGEM {i}>>>"
+
+
+def test_split_keeps_first_valid_section_per_image():
+    raw = "\n".join([
+        _section(2, "segunda"),
+        _section(1, "primeira"),
+        _section(1, "repetida"),
+        _section(5, "fora do grupo"),
+        "<<<IMAGEM 3>>> sem fechamento",
+        _section(4, "  "),
+    ])
+    assert split_multi_image_output(raw, 4) == {0: "primeira", 1: "segunda"}
+
+
+def test_mismatched_markers_are_ignored():
+    assert split_multi_image_output("<<<IMAGEM 1>>> x <<<FIM IMAGEM 2>>>", 2) == {}
+
+
+def test_missing_or_incomplete_sections_fall_back_to_single_evaluation(fake_backend):
+    def respond(**kwargs):
+        images = [p for p in kwargs["input"][0]["content"] if p["type"] == "input_image"]
+        if len(images) > 1:
+            # imagem 2 sem Resumo Executivo, imagem 3 ausente
+            return SimpleNamespace(output_text=_section(1, EVALUATION) + _section(2, "Clareza: 2"), id="g")
+        return SimpleNamespace(output_text=EVALUATION.replace("4", "1", 1), id="s")
+
+    fake_backend._respond = respond
+    results = asyncio.run(evaluate_images("q", ["aGk=", "aGk=", "aGk="], "p", CRITERIA, group_size=3))
+
+    assert [r.index for r in results] == [0, 1, 2]
+    assert results[0].message == EVALUATION
+    assert [r.message.splitlines()[0] for r in results[1:]] == ["Clareza: 1", "Clareza: 1"]
+    assert len(fake_backend.calls) == 3  # um grupo + dois individuais
+
+
+def test_failed_fallback_is_reported_per_image(fake_backend):
+    def respond(**kwargs):
+        raise RuntimeError("fora do ar")
+
+    fake_backend._respond = respond
+    results = asyncio.run(evaluate_images("q", ["aGk=", "aGk="], "p", CRITERIA, group_size=2))
+    assert all(r.message is None and isinstance(r.error, RuntimeError) for r in results)
@@ -0,0 +1,51 @@
+from app.usecase.evaluation_usecase import (
+    find_missing_evaluation_parts,
+    merge_evaluation_outputs,
+    validate_evaluation_output,
+)
+
+import pytest
+
+CRITERIA = ["Clareza", "Contraste", "Navegação"]
+
+SUMMARY = "Resumo Executivo\n📊 Pontuação Geral: 4"
+
+
+def test_find_missing_parts_lists_criteria_and_summary():
+    output = "Clareza: 4\nNavegação: 9\n"
+    missing, summary_missing = find_missing_evaluation_parts(output, CRITERIA)
+    # nota fora de 1..5 não conta como presente
+    assert missing == ["Contraste", "Navegação"]
+    assert summary_missing
+
+
+def test_complete_output_has_nothing_missing():
+    output = f"Clareza: 4\nContraste: 3\nNavegação: 5\n\n{SUMMARY}"
+    assert find_missing_evaluation_parts(output, CRITERIA) == ([], False)
+    validate_evaluation_output(output, CRITERIA)
+
+
+def test_merge_keeps_questionnaire_order_and_original_scores():
+    original = "Navegação: 2\nClareza: 4\n"
+    repair = "Contraste: 3\nClareza: 1\n\n" + SUMMARY
+    merged = merge_evaluation_outputs(original, repair, CRITERIA)
+    assert merged.splitlines()[:3] == ["Clareza: 4", "Contraste: 3", "Navegação: 2"]
+    assert merged.endswith(SUMMARY)
+    assert find_missing_evaluation_parts(merged, CRITERIA) == ([], False)
+
+
+def test_merge_prefers_original_summary():
+    original = "Clareza: 4\n\nResumo Executivo\noriginal"
+    repair = "Contraste: 3\n\nResumo Executivo\nreparo"
+    merged = merge_evaluation_outputs(original, repair, ["Clareza", "Contraste"])
+    assert "original" in merged and "reparo" not in merged
+
+
+def test_merge_without_criteria_preserves_original_body():
+    merged = merge_evaluation_outputs("texto livre", SUMMARY, [])
+    assert merged == f"texto livre\n\n{SUMMARY}"
+
+
+def test_validate_raises_on_missing_score():
+    with pytest.raises(ValueError, match="Contraste"):
+        validate_evaluation_output(f"Clareza: 4\n\n{SUMMARY}", ["Clareza", "Contraste"])
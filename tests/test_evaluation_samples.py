@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.usecase import evaluation_usecase as ev
+from tests.fakes import chat_completion
+from app.usecase.evaluation_usecase import consolidate_samples, evaluate_image_samples, parse_criterion_scores
+
+CRITERIA = ["Clareza", "Contraste"]
+SUMMARY = "\n\nResumo Executivo\n📊 Pontuação Geral: 3"
+
+
+def test_parse_criterion_scores_ignores_out_of_range_and_missing():
+    assert parse_criterion_scores("Clareza: 4\nContraste: 7\n", CRITERIA) == {"Clareza": 4}
+
+
+def test_consolidate_samples_statistics():
+    outputs = ["Clareza: 2\nContraste: 5", "Clareza: 4\nContraste: 5", "Clareza: 3"]
+    result = consolidate_samples(outputs, CRITERIA)
+    clareza, contraste = result.consensus
+    assert (clareza.n, clareza.median, clareza.mean, clareza.min, clareza.max) == (3, 3.0, 3.0, 2.0, 4.0)
+    assert clareza.stdev == pytest.approx(1.0)
+    assert (contraste.n, contraste.median, contraste.stdev) == (2, 5.0, 0.0)
+    assert result.samples == outputs
+
+
+def test_representative_prefers_complete_then_closest_to_median():
+    close_but_incomplete = "Clareza: 3\nContraste: 4"
+    complete_far = "Clareza: 1\nContraste: 4" + SUMMARY
+    complete_close = "Clareza: 3\nContraste: 5" + SUMMARY
+    result = consolidate_samples([close_but_incomplete, complete_far, complete_close], CRITERIA)
+    assert result.message == complete_close
+
+
+def test_criterion_without_scores_has_empty_consensus():
+    result = consolidate_samples(["Clareza: 4" + SUMMARY], CRITERIA)
+    assert result.consensus[1].n == 0 and result.consensus[1].median is None
+
+
+def test_samples_use_a_single_chat_call_with_n(fake_backend, monkeypatch):
+    monkeypatch.setattr(ev, "EVALUATION_SAMPLING_MODE", "n")
+    texts = ["Clareza: 4\nContraste: 4" + SUMMARY, "Clareza: 2\nContraste: 4" + SUMMARY]
+    fake_backend._chat = lambda **kw: SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=t)) for t in texts[: kw["n"]]], usage=None
+    )
+    result = asyncio.run(evaluate_image_samples("q", "aGk=", 2, prompt="p", criteria=CRITERIA))
+    assert [c[0] for c in fake_backend.calls] == ["chat"]
+    assert fake_backend.calls[0][1]["n"] == 2
+    assert result.samples == texts
+
+
+def test_samples_fall_back_to_parallel_calls(fake_backend, monkeypatch):
+    monkeypatch.setattr(ev, "EVALUATION_SAMPLING_MODE", "parallel")
+    fake_backend._respond = lambda **kw: SimpleNamespace(output_text="Clareza: 5\nContraste: 5" + SUMMARY, id="r")
+    result = asyncio.run(evaluate_image_samples("q", "aGk=", 3, prompt="p", criteria=CRITERIA))
+    calls = fake_backend.calls
+    assert [c[0] for c in calls] == ["respond"] * 3
+    # o input (com a data URL) é montado uma vez e compartilhado
+    assert all(c[1]["input"] is calls[0][1]["input"] for c in calls)
+    assert result.consensus[0].median == 5.0
+
+
+def test_n_shortfall_is_topped_up_with_parallel_calls(fake_backend, monkeypatch):
+    monkeypatch.setattr(ev, "EVALUATION_SAMPLING_MODE", "n")
+    # servidor compatível que ignora `n`
+    fake_backend._chat = lambda **kw: chat_completion("Clareza: 2\nContraste: 2" + SUMMARY)
+    fake_backend._respond = lambda **kw: SimpleNamespace(output_text="Clareza: 4\nContraste: 4" + SUMMARY, id="r")
+    result = asyncio.run(evaluate_image_samples("q", "aGk=", 3, prompt="p", criteria=CRITERIA))
+    assert [c[0] for c in fake_backend.calls] == ["chat", "respond", "respond"]
+    assert len(result.samples) == 3 and result.consensus[0].median == 4.0
+
+
+def test_failed_samples_are_dropped_not_fatal(fake_backend, monkeypatch):
+    monkeypatch.setattr(ev, "EVALUATION_SAMPLING_MODE", "parallel")
+    outcomes = iter([RuntimeError("timeout"), "Clareza: 3\nContraste: 3", "Clareza: 5\nContraste: 5"])
+
+    def respond(**kw):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(output_text=outcome + SUMMARY, id="r")
+
+    fake_backend._respond = respond
+    result = asyncio.run(evaluate_image_samples("q", "aGk=", 3, prompt="p", criteria=CRITERIA))
+    assert len(result.samples) == 2 and result.consensus[0].n == 2
+
+
+def test_all_samples_failing_raises(fake_backend, monkeypatch):
+    monkeypatch.setattr(ev, "EVALUATION_SAMPLING_MODE", "parallel")
+
+    def respond(**kw):
+        raise RuntimeError("fora do ar")
+
+    fake_backend._respond = respond
+    with pytest.raises(RuntimeError):
+        asyncio.run(evaluate_image_samples("q", "aGk=", 2, prompt="p", criteria=CRITERIA))
@@ -0,0 +1,60 @@
+import base64
+import io
+
+import pytest
+
+from app.usecase import image_tiling_usecase as tiling
+from app.usecase.evaluation_usecase import merge_tile_evaluations, parse_evaluation_message
+from app.usecase.image_tiling_usecase import slice_tall_image, tile_offsets
+
+
+def test_short_images_are_not_tiled():
+    assert tile_offsets(1280, 1600) == []
+    assert tile_offsets(0, 5000) == []
+
+
+def test_offsets_cover_the_image_with_overlap():
+    offsets = tile_offsets(1280, 12000)
+    tile_h = int(1280 * tiling.EVALUATION_TILE_ASPECT)
+    assert offsets[0] == (0, tile_h)
+    assert offsets[-1][1] == 12000
+    for (top, bottom), (next_top, _) in zip(offsets, offsets[1:]):
+        assert bottom - top == tile_h
+        assert next_top < bottom  # sobreposição: nada cortado entre trechos
+
+
+def test_tile_count_is_capped_with_taller_tiles(monkeypatch):
+    monkeypatch.setattr(tiling, "EVALUATION_MAX_TILES", 3)
+    offsets = tile_offsets(1000, 30000)
+    assert len(offsets) == 3
+    assert offsets[0][0] == 0 and offsets[-1][1] == 30000
+    assert all(bottom > next_top for (_, bottom), (next_top, _) in zip(offsets, offsets[1:]))
+
+
+def test_slice_tall_image_returns_png_tiles():
+    Image = pytest.importorskip("PIL.Image")
+    buf = io.BytesIO()
+    Image.new("RGBA", (100, 400), (255, 0, 0, 255)).save(buf, format="PNG")
+    tiles = slice_tall_image(base64.b64encode(buf.getvalue()).decode())
+    assert len(tiles) == len(tile_offsets(100, 400))
+    with Image.open(io.BytesIO(base64.b64decode(tiles[0]))) as first:
+        assert first.size == (100, int(100 * tiling.EVALUATION_TILE_ASPECT))
+
+
+def test_unreadable_image_is_sent_whole():
+    assert slice_tall_image("bm90IGFuIGltYWdl") is None
+
+
+def test_merge_uses_worst_verifiable_score_and_dedups_summary():
+    outputs = [
+        "Clareza: 4\nContraste: N/A\n\nResumo Executivo\n✅ Pontos Positivos:\n- Bom contraste\n"
+        "❌ Principais Problemas:\n- Sem rótulo",
+        "Clareza: 2\nContraste: N/A\n\nResumo Executivo\n✅ Pontos Positivos:\n- bom contraste!\n"
+        "❌ Principais Problemas:\n- Foco invisível",
+    ]
+    merged = merge_tile_evaluations(outputs, ["Clareza", "Contraste"])
+    assert merged.splitlines()[:2] == ["Clareza: 2", "Contraste: 3"]
+    parsed = parse_evaluation_message(merged)
+    assert parsed["positives"] == ["Bom contraste"]
+    assert parsed["problems"] == ["Sem rótulo", "Foco invisível"]
+    assert "📊 Pontuação Geral: 2,5" in merged
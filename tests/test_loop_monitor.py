@@ -0,0 +1,51 @@
+import asyncio
+import logging
+import time
+
+from app import metrics
+from app.loop_monitor import LoopMonitor, LoopMonitorMiddleware, _task_routes
+
+
+def _counter(name: str) -> int:
+    return metrics.snapshot()["counters"].get(name, 0)
+
+
+def test_blocking_call_is_logged_with_route_and_stack(caplog):
+    async def blocking_app(scope, receive, send):
+        time.sleep(0.3)  # chamada síncrona dentro do loop
+
+    async def main():
+        monitor = LoopMonitor(interval_s=0.01, threshold_s=0.05)
+        monitor.start()
+        try:
+            await asyncio.sleep(0.05)
+            await LoopMonitorMiddleware(blocking_app)({"type": "http", "method": "POST", "path": "/evaluation"}, None, None)
+            await asyncio.sleep(0.1)  # o vigia vê o batimento voltar
+        finally:
+            monitor.stop()
+
+    before = _counter("event_loop.blocked")
+    with caplog.at_level(logging.WARNING, logger="loop_monitor"):
+        asyncio.run(main())
+
+    assert _counter("event_loop.blocked") == before + 1
+    warnings = [r.getMessage() for r in caplog.records if r.name == "loop_monitor"]
+    assert len(warnings) == 1
+    assert "POST /evaluation" in warnings[0] and "blocking_app" in warnings[0]
+    assert _task_routes == {}
+
+
+def test_cooperative_code_is_not_reported():
+    async def main():
+        monitor = LoopMonitor(interval_s=0.01, threshold_s=0.1)
+        monitor.start()
+        try:
+            for _ in range(20):
+                await asyncio.sleep(0.01)
+        finally:
+            monitor.stop()
+
+    before = _counter("event_loop.blocked")
+    asyncio.run(main())
+    assert _counter("event_loop.blocked") == before
+    assert "event_loop.lag_s" in metrics.snapshot()["observations"]
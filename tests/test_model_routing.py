@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import model_routing as mr
+from app.llm_backends import is_backend_fault
+from tests.fakes import FakeBackend
+
+
+class ServerError(Exception):
+    status_code = 500
+
+
+@pytest.fixture
+def policy():
+    def install(policy, backends=("openai",)):
+        mr.set_policy({"tiers": {}, "routes": {}, "backends": {}, "tenants": {}, **policy})
+        mr._backends = {name: FakeBackend(name) for name in backends}
+        return mr._backends
+
+    yield install
+    mr.set_policy(None)
+
+
+def test_route_resolves_tiers_and_override(policy):
+    policy({
+        "tiers": {"fast": "mini", "flagship": "big"},
+        "routes": {"analyze": {"primary": "fast", "fallback": "flagship", "latency_budget_s": 3}},
+    })
+    route = mr.get_route("analyze")
+    assert (route.primary, route.fallback, route.latency_budget_s) == ("mini", "big", 3.0)
+    assert mr.get_route("analyze", model_override="custom").primary == "custom"
+
+
+def test_fallback_equal_to_primary_is_dropped(policy):
+    policy({"tiers": {"fast": "mini"}, "routes": {"analyze": {"primary": "fast", "fallback": "mini"}}})
+    assert mr.get_route("analyze").fallback is None
+
+
+def test_routed_call_falls_back_after_latency_budget(policy):
+    policy({"routes": {"analyze": {"primary": "slow", "fallback": "quick", "latency_budget_s": 0.05}}})
+    calls = []
+
+    async def call(backend, model):
+        calls.append(model)
+        if model == "slow":
+            await asyncio.sleep(1)
+        return model
+
+    assert asyncio.run(mr.routed_call("analyze", call)) == "quick"
+    assert calls == ["slow", "quick"]
+
+
+def test_routed_call_falls_back_on_error(policy):
+    policy({"routes": {"analyze": {"primary": "a", "fallback": "b"}}})
+
+    async def call(backend, model):
+        if model == "a":
+            raise ServerError("503")
+        return model
+
+    assert asyncio.run(mr.routed_call("analyze", call)) == "b"
+
+
+def test_routed_call_without_fallback_raises(policy):
+    policy({"routes": {"analyze": {"primary": "a"}}})
+
+    async def call(backend, model):
+        raise ServerError("503")
+
+    with pytest.raises(ServerError):
+        asyncio.run(mr.routed_call("analyze", call))
+
+
+def test_tenant_backend_overrides_route_without_crossing_backends(policy):
+    policy(
+        {
+            "tiers": {"fast": "mini"},
+            "routes": {"analyze": {"primary": "fast", "fallback_backend": "openai"}},
+            "tenants": {"acme": {"backend": "onprem", "tiers": {"fast": "qwen"}}},
+        },
+        backends=("openai", "onprem"),
+    )
+    with mr.tenant_scope("acme"):
+        route = mr.get_route("analyze")
+    assert (route.backend, route.primary, route.fallback, route.fallback_backend) == ("onprem", "qwen", None, None)
+    assert mr.get_route("analyze").backend == "openai"
+
+
+def test_route_fallback_backend_uses_its_default_model(policy):
+    backends = policy(
+        {"routes": {"analyze": {"primary": "gpt", "backend": "openai", "fallback_backend": "onprem"}}},
+        backends=("openai", "onprem"),
+    )
+    backends["onprem"].default_model = "local-model"
+    route = mr.get_route("analyze")
+    assert (route.fallback_backend, route.fallback) == ("onprem", "local-model")
+
+
+def test_client_errors_do_not_mark_the_backend_down(policy):
+    backends = policy({"routes": {"analyze": {"primary": "a"}}})
+
+    class BadRequest(Exception):
+        status_code = 400
+
+    async def call(backend, model):
+        raise BadRequest()
+
+    for _ in range(5):
+        with pytest.raises(BadRequest):
+            asyncio.run(mr.routed_call("analyze", call))
+    assert backends["openai"].healthy
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (asyncio.TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (ServerError(), True),
+    (type("RateLimited", (Exception,), {"status_code": 429})(), True),
+    (type("BadRequest", (Exception,), {"status_code": 400})(), False),
+    (KeyError("bug local"), False),
+])
+def test_is_backend_fault(exc, expected):
+    assert is_backend_fault(exc) is expected
+
+
+def test_openai_network_errors_are_backend_faults():
+    openai = pytest.importorskip("openai")
+    httpx = pytest.importorskip("httpx")
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    assert is_backend_fault(openai.APIConnectionError(request=request))
+    assert is_backend_fault(openai.APITimeoutError(request=request))
+
+
+def _tenant_app():
+    seen = []
+
+    async def inner(scope, receive, send):
+        seen.append(mr.current_tenant())
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    return TestClient(mr.TenantMiddleware(inner)), seen
+
+
+def test_tenant_middleware_rejects_unknown_tenants(policy):
+    policy({"tenants": {"acme": {"backend": "openai"}}})
+    client, seen = _tenant_app()
+    assert client.get("/", headers={"X-Tenant-Id": "acme"}).status_code == 200
+    assert client.get("/").status_code == 200
+    assert client.get("/", headers={"X-Tenant-Id": "Acme"}).status_code == 403
+    assert seen == ["acme", None]
+
+
+def test_tenant_middleware_requires_signature_when_secret_is_set(policy, monkeypatch):
+    policy({"tenants": {"acme": {"backend": "openai"}}})
+    monkeypatch.setattr(mr, "LLM_TENANT_SECRET", "s3gredo")
+    client, seen = _tenant_app()
+    signed = {"X-Tenant-Id": "acme", "X-Tenant-Signature": mr.tenant_signature("acme", "s3gredo")}
+    assert client.get("/", headers=signed).status_code == 200
+    assert client.get("/", headers={"X-Tenant-Id": "acme"}).status_code == 403
+    assert client.get("/", headers={**signed, "X-Tenant-Signature": b"\xe9"}).status_code == 403
+    assert seen == ["acme"]
+
+
+def test_tenant_header_is_ignored_without_tenants_or_secret(policy):
+    policy({})
+    client, seen = _tenant_app()
+    assert client.get("/", headers={"X-Tenant-Id": "customer-1"}).status_code == 200
+    assert seen == [None]
+
+
+def test_operational_paths_skip_tenant_checks(policy):
+    policy({"tenants": {"acme": {"backend": "openai"}}})
+    client, seen = _tenant_app()
+    assert client.get("/health", headers={"X-Tenant-Id": "customer-1"}).status_code == 200
+    assert client.get("/analyze", headers={"X-Tenant-Id": "customer-1"}).status_code == 403
@@ -0,0 +1,25 @@
+from app.schemas import ExistingProfile
+from app.usecase import profile_usecase as pu
+
+
+def _profiles(n: int):
+    profiles = [ExistingProfile(name=f"Perfil {i}", description=f"descrição genérica número {i}") for i in range(n)]
+    profiles.append(ExistingProfile(name="Dislexia", description="dificuldade de leitura e troca de letras"))
+    return profiles
+
+
+def test_prompt_keeps_only_top_k_most_similar(monkeypatch):
+    monkeypatch.setattr(pu, "PROFILE_PROMPT_TOP_K", 3)
+    selected = pu._select_candidate_profiles("troca de letras na leitura", _profiles(50))
+    assert len(selected) == 3
+    assert selected[0].name == "Dislexia"
+
+
+def test_prompt_respects_token_budget(monkeypatch):
+    monkeypatch.setattr(pu, "PROFILE_PROMPT_TOP_K", 50)
+    monkeypatch.setattr(pu, "PROFILE_PROMPT_TOKEN_BUDGET", 40)
+    selected = pu._select_candidate_profiles("leitura", _profiles(50))
+    # sempre envia ao menos um perfil, mesmo acima do orçamento
+    assert 1 <= len(selected) < 10
+    prompt = pu._build_profile_classification_prompt("leitura", _profiles(50))
+    assert prompt.count("- Nome:") == len(selected)
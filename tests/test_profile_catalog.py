@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from app import model_routing
+from app.prompts import BUILTIN_PROFILES
+from app.usecase.profile_catalog_usecase import ASSETS, QUESTIONNAIRE, CatalogEntry, ProfileCatalog, catalog_key, match_builtin
+
+
+class ServerError(Exception):
+    status_code = 500
+
+
+def test_match_builtin_accepts_key_or_canonical_name():
+    name, description = BUILTIN_PROFILES["tea"]
+    assert match_builtin("TEA", "") == "tea"
+    assert match_builtin(f"  {name.upper()} ", description.replace(" ", "  ")) == "tea"
+    assert match_builtin("tea", "outra descrição") is None
+    assert match_builtin("desconhecido", "") is None
+
+
+def test_catalog_key_follows_the_routed_model(fake_backend):
+    before = {kind: catalog_key(kind, "tdah") for kind in (QUESTIONNAIRE, ASSETS)}
+    assert before[QUESTIONNAIRE] != before[ASSETS]
+    model_routing.set_policy({
+        "tiers": {}, "backends": {}, "tenants": {},
+        "routes": {"questionnaire_generate": {"primary": "outro-modelo"}},
+    })
+    model_routing._backends = {fake_backend.name: fake_backend}
+    assert catalog_key(QUESTIONNAIRE, "tdah") != before[QUESTIONNAIRE]
+    assert catalog_key(ASSETS, "tdah") == before[ASSETS]
+
+
+def test_failed_warm_up_does_not_mark_backends_down(fake_backend):
+    def chat(**kwargs):
+        raise ServerError("503")
+
+    fake_backend._chat = chat
+    assert asyncio.run(ProfileCatalog().refresh()) == 0
+    assert fake_backend.calls  # o aquecimento chegou a chamar o backend
+    assert fake_backend.healthy and fake_backend._failures == 0
+
+
+def test_load_only_mode_serves_persisted_entries_without_llm_calls(fake_backend, tmp_path):
+    name, description = BUILTIN_PROFILES["dislexia"]
+    entry = CatalogEntry(QUESTIONNAIRE, "dislexia", catalog_key(QUESTIONNAIRE, "dislexia"), "q", "p", time.time())
+    ProfileCatalog(str(tmp_path))._persist(entry)
+
+    loaded = ProfileCatalog(str(tmp_path))
+    asyncio.run(loaded.run(generate=False))
+    assert loaded.lookup(QUESTIONNAIRE, name, "") == entry
+    assert loaded.lookup(ASSETS, name, "") is None
+    assert fake_backend.calls == []
+
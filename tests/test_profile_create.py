@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from app.usecase import profile_create_usecase as pc
+from tests.fakes import chat_completion
+
+VALID_QUESTIONNAIRE = "\n".join(
+    [f"### Critério {i}\nObjetivo Cognitivo: x\nComo Avaliar: x\nEscala Likert: x\nEvidências a coletar: x\nReferências: x" for i in range(6)]
+    + ["Resumo Executivo\nqualquer coisa"]
+)
+
+
+def _fake_routed_call(outputs):
+    """`outputs`: parte -> lista de respostas, consumidas em ordem."""
+    calls = []
+
+    async def routed_call(route, call, model_override=None):
+        part = route.rsplit(".", 1)[-1]
+        calls.append(part)
+        return chat_completion(outputs[part].pop(0))
+
+    return routed_call, calls
+
+
+def test_postprocess_questionnaire_replaces_summary_with_template():
+    out = pc._postprocess_questionnaire(f"```markdown\n{VALID_QUESTIONNAIRE}\n```")
+    assert "qualquer coisa" not in out
+    assert "(preencher após a avaliação da imagem)" in out
+
+
+def test_postprocess_questionnaire_rejects_missing_sections():
+    with pytest.raises(ValueError, match="faltando seções"):
+        pc._postprocess_questionnaire("### A\nResumo Executivo")
+
+
+def test_only_the_invalid_part_is_retried(monkeypatch):
+    routed_call, calls = _fake_routed_call({
+        "guidelines": ["Diretrizes"],
+        "questionnaire": ["inválido", VALID_QUESTIONNAIRE],
+    })
+    monkeypatch.setattr(pc, "routed_call", routed_call)
+    monkeypatch.setattr(pc, "PROFILE_ASSETS_MAX_RETRIES", 1)
+
+    result = asyncio.run(pc.create_profile_assets("Perfil", "Descrição"))
+    assert result["guidelines"] == "Diretrizes"
+    assert calls.count("guidelines") == 1
+    assert calls.count("questionnaire") == 2
+
+
+def test_invalid_output_after_retries_raises_value_error(monkeypatch):
+    routed_call, _ = _fake_routed_call({
+        "guidelines": ["Diretrizes"],
+        "questionnaire": ["inválido", "inválido"],
+    })
+    monkeypatch.setattr(pc, "routed_call", routed_call)
+    monkeypatch.setattr(pc, "PROFILE_ASSETS_MAX_RETRIES", 1)
+
+    with pytest.raises(ValueError, match="questionnaire"):
+        asyncio.run(pc.create_profile_assets("Perfil", "Descrição"))
@@ -0,0 +1,37 @@
+from app.schemas import ExistingProfile
+from app.usecase.profile_match_usecase import fold, get_profile_index, match_existing_profile, tokenize
+
+PROFILES = [
+    ExistingProfile(name="TEA", description="Transtorno do espectro autista, rotina previsível e linguagem literal"),
+    ExistingProfile(name="TDAH", description="Déficit de atenção e hiperatividade, distração e impulsividade"),
+    ExistingProfile(name="Dislexia", description="Dificuldade de leitura, troca de letras e decodificação lenta"),
+]
+
+
+def test_fold_and_tokenize_drop_accents_and_stopwords():
+    assert fold("Nível Atenção") == "nivel atencao"
+    assert tokenize("Pessoa com dificuldade de leitura") == ["dificuldade", "leitura"]
+
+
+def test_exact_name_matches_ignoring_case_and_accents():
+    assert match_existing_profile("dislexia", PROFILES) == "Dislexia"
+
+
+def test_clear_description_matches_locally():
+    assert match_existing_profile("muita distração e impulsividade, hiperatividade", PROFILES) == "TDAH"
+
+
+def test_ambiguous_or_unrelated_description_is_left_to_the_llm():
+    assert match_existing_profile("baixa visão e daltonismo", PROFILES) is None
+    assert match_existing_profile("distração e dificuldade de leitura", PROFILES) is None
+    assert match_existing_profile("qualquer coisa", []) is None
+
+
+def test_index_is_cached_by_profile_set():
+    assert get_profile_index(PROFILES) is get_profile_index(list(PROFILES))
+
+
+def test_rank_orders_by_score():
+    ranked = get_profile_index(PROFILES).rank("troca de letras na leitura")
+    assert PROFILES[ranked[0][0]].name == "Dislexia"
+    assert [s for _, s in ranked] == sorted((s for _, s in ranked), reverse=True)
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import profiling
+from app.main import app
+from app.profiling import ProfilingMiddleware, StackSampler, token_matches
+
+
+@pytest.fixture
+def token(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "s3gredo")
+    monkeypatch.setattr(profiling, "PROFILING_DIR", str(tmp_path))
+    return "s3gredo"
+
+
+def test_token_matches_compares_bytes(token):
+    assert token_matches("s3gredo") and token_matches(b"s3gredo")
+    assert not token_matches("errado") and not token_matches(None)
+    # não ASCII não pode virar 500
+    assert not token_matches("é") and not token_matches(b"\xe9") and not token_matches("☃")
+
+
+def test_token_disabled_never_matches(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "")
+    assert not token_matches("")
+
+
+def test_non_ascii_profile_token_is_forbidden_not_an_error(token):
+    r = TestClient(app).get("/debug/profiles/x", headers={"X-Profile-Token": b"\xc3\xa9"})
+    assert r.status_code == 403
+
+
+def _profiled_client():
+    async def inner(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    return TestClient(ProfilingMiddleware(inner))
+
+
+def test_middleware_profiles_only_with_the_token(token, tmp_path):
+    client = _profiled_client()
+    r = client.get("/x", headers={"X-Profile": b"\xe9"})
+    assert r.status_code == 200 and "x-profile-id" not in r.headers
+
+    profile_id = client.get("/x", params={"profile": token}).headers["x-profile-id"]
+    assert profiling.profile_path(profile_id) is not None
+    assert client.get("/x", headers={"X-Profile": token}).headers["x-profile-id"] != profile_id
+
+
+def test_sample_weights_follow_wall_time_under_a_busy_gil():
+    sampler = StackSampler(threading.get_ident(), interval_s=0.001)
+    sampler.start()
+    end = time.perf_counter() + 0.3
+    while time.perf_counter() < end:  # CPU puro: o amostrador só roda na troca de GIL
+        pass
+    sampler.stop()
+
+    profile = sampler.to_speedscope("busy")["profiles"][0]
+    total = sum(profile["weights"])
+    assert total == pytest.approx(profile["endValue"])
+    assert 0.8 * sampler.duration_s <= total <= sampler.duration_s
+    assert profile["weights"] == sorted(profile["weights"], reverse=True)
@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+import pytest
+
+from app.usecase.questionnaire_store_usecase import QuestionnaireStore, questionnaire_id_for
+
+QUESTIONNAIRE = "### Clareza\nTexto\n### Contraste\nTexto"
+
+
+def _questionnaire(i: int) -> str:
+    return f"### Critério {i}\nTexto"
+
+
+def test_register_and_resolve_by_id():
+    store = QuestionnaireStore()
+    item = asyncio.run(store.register(QUESTIONNAIRE))
+    assert item.id == questionnaire_id_for(QUESTIONNAIRE)
+    assert asyncio.run(store.resolve(questionnaire_id=item.id)) is item
+
+
+def test_unknown_id_raises_key_error():
+    with pytest.raises(KeyError):
+        asyncio.run(QuestionnaireStore().resolve(questionnaire_id="0" * 64))
+
+
+def test_inline_traffic_does_not_evict_registered_ids():
+    store = QuestionnaireStore(max_items=2, inline_max_items=2)
+    registered = asyncio.run(store.register(QUESTIONNAIRE))
+    for i in range(10):
+        asyncio.run(store.resolve(questionnaire=_questionnaire(i)))
+    assert asyncio.run(store.resolve(questionnaire_id=registered.id)) is registered
+
+
+def test_inline_questionnaire_is_cached_but_not_persisted(tmp_path):
+    store = QuestionnaireStore(directory=str(tmp_path))
+    first = asyncio.run(store.resolve(questionnaire=QUESTIONNAIRE))
+    assert asyncio.run(store.resolve(questionnaire=QUESTIONNAIRE)) is first
+    assert os.listdir(tmp_path) == []
+
+
+def test_registered_questionnaire_survives_restart(tmp_path):
+    item = asyncio.run(QuestionnaireStore(directory=str(tmp_path)).register(QUESTIONNAIRE))
+    reloaded = asyncio.run(QuestionnaireStore(directory=str(tmp_path)).get(item.id))
+    assert reloaded is not None and reloaded.criteria == item.criteria
+
+
+def test_directory_keeps_at_most_max_files(tmp_path):
+    store = QuestionnaireStore(directory=str(tmp_path), max_files=3)
+    for i in range(5):
+        asyncio.run(store.register(_questionnaire(i)))
+    assert len(os.listdir(tmp_path)) == 3
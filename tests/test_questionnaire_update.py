@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.usecase import questionnaire_usecase as qu
+from tests.fakes import chat_completion
+
+QUESTIONNAIRE = """# Questionário
+
+### Clareza
+Como Avaliar: o texto cita o Resumo Executivo da página?
+
+### Contraste
+Como Avaliar: contraste mínimo.
+
+## Resumo Executivo
+✅ Pontos Positivos:
+"""
+
+
+def test_sections_stop_at_summary_heading_only():
+    sections = qu.split_questionnaire_sections(QUESTIONNAIRE)
+    assert [s.title for s in sections] == ["Clareza", "Contraste"]
+    # a menção ao Resumo Executivo no corpo não corta o critério
+    assert "da página?" in QUESTIONNAIRE[sections[0].start:sections[0].end]
+    assert QUESTIONNAIRE[sections[1].start:sections[1].end].rstrip().endswith("contraste mínimo.")
+
+
+def test_splice_preserves_untouched_text():
+    sections = qu.split_questionnaire_sections(QUESTIONNAIRE)
+    out = qu.splice_sections(QUESTIONNAIRE, sections, {1: "### Contraste\nNovo texto."})
+    assert out == QUESTIONNAIRE.replace("Como Avaliar: contraste mínimo.", "Novo texto.")
+    assert qu.splice_sections(QUESTIONNAIRE, sections, {}) == QUESTIONNAIRE
+
+
+def test_parse_relevant_sections():
+    assert qu._parse_relevant_sections('ok {"sections": [2, 2, 9, 1]}', 2) == [0, 1]
+    assert qu._parse_relevant_sections("sem json", 2) is None
+
+
+def _fake_chat(section_result):
+    """A seleção (só a mensagem do usuário) escolhe as duas seções; as reescritas vão para `section_result`."""
+    def chat(**kwargs):
+        messages = kwargs["messages"]
+        if len(messages) == 1:
+            return chat_completion('{"sections": [1, 2]}')
+        return section_result(messages[-1]["content"])
+    return chat
+
+
+def test_failed_section_keeps_original(fake_backend):
+    def section(prompt):
+        if "### Clareza" in prompt:
+            raise RuntimeError("timeout")
+        return chat_completion("### Contraste\nNovo texto.")
+
+    fake_backend._chat = _fake_chat(section)
+    content, _ = asyncio.run(qu.update_questionnaire(QUESTIONNAIRE, "nova descrição", None))
+    assert "o texto cita o Resumo Executivo da página?" in content
+    assert "Novo texto." in content
+    rewrite_prompts = [kw["messages"][-1]["content"] for _, kw in fake_backend.calls[1:]]
+    assert len(rewrite_prompts) == 2 and all("nova descrição" in p for p in rewrite_prompts)
+
+
+def test_all_sections_failing_raises(fake_backend):
+    def section(prompt):
+        raise RuntimeError("backend fora")
+
+    fake_backend._chat = _fake_chat(section)
+    with pytest.raises(RuntimeError):
+        asyncio.run(qu.update_questionnaire(QUESTIONNAIRE, "nova descrição", None))
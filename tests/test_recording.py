@@ -0,0 +1,108 @@
+import json
+import threading
+
+from fastapi.testclient import TestClient
+
+from app import metrics, recording
+from app.recording import PLACEHOLDER_IMAGE, CassetteRecorder, llm_fingerprint, sanitize_body, sanitize_llm_response
+from tests.fakes import chat_completion
+
+
+def test_fingerprint_ignores_images_and_matches_replayed_json():
+    with_image = [{"role": "user", "content": [
+        {"type": "text", "text": "avalie"},
+        {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}},
+    ]}]
+    without_image = [{"role": "user", "content": [{"type": "text", "text": "avalie"}]}]
+    assert llm_fingerprint("chat", {"messages": with_image}) == llm_fingerprint("chat", {"messages": without_image})
+    assert llm_fingerprint("chat", {"messages": without_image}) != llm_fingerprint("respond", {"input": without_image})
+    assert llm_fingerprint("respond", {"input": "a"}) != llm_fingerprint("respond", {"input": "b"})
+    # o substituto recebe o mesmo payload em JSON
+    payload = {"model": "m", "input": with_image, "instructions": "sys"}
+    assert llm_fingerprint("respond", payload) == llm_fingerprint("respond", json.loads(json.dumps(payload)))
+
+
+def test_sanitize_body_redacts_text_and_images_by_default():
+    body = {
+        "profile_key": "tea",
+        "message": "dados do usuário, com nome e e-mail",
+        "messages": ["dados do usuário, com nome e e-mail", "outro"],
+        "imageBase64": "iVBORw0K...",
+        "samples": 3,
+    }
+    data = json.loads(sanitize_body(json.dumps(body).encode()))
+    assert data["profile_key"] == "tea" and data["samples"] == 3
+    assert data["imageBase64"] == PLACEHOLDER_IMAGE
+    assert "usuário" not in json.dumps(data, ensure_ascii=False)
+    assert len(data["message"]) == len(body["message"])
+    assert data["messages"][0] == data["message"] != data["messages"][1]
+
+
+def test_sanitize_body_verbatim_opt_in(monkeypatch):
+    monkeypatch.setattr(recording, "RECORD_VERBATIM_TEXT", True)
+    data = json.loads(sanitize_body(b'{"message": "texto", "images": ["abc"]}'))
+    assert data == {"message": "texto", "images": [PLACEHOLDER_IMAGE]}
+
+
+def test_sanitize_body_ignores_non_json():
+    assert sanitize_body(b"") is None and sanitize_body(b"not json") is None
+
+
+def test_llm_response_keeps_metadata_and_redacts_generated_text():
+    response = {
+        "id": "chatcmpl-1",
+        "model": "gpt",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "diagnóstico"}}],
+        "usage": {"total_tokens": 10},
+    }
+    out = sanitize_llm_response(response)
+    message = out["choices"][0]["message"]
+    assert (out["id"], out["model"], message["role"], out["usage"]) == ("chatcmpl-1", "gpt", "assistant", {"total_tokens": 10})
+    assert message["content"] != "diagnóstico" and len(message["content"]) >= len("diagnóstico")
+
+
+def test_recorder_writes_from_its_own_thread(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    recorder = CassetteRecorder(str(path))
+    payload = {"model": "m", "messages": [{"role": "user", "content": "oi"}]}
+    recorder.write({"type": "request", "path": "/analyze"})
+    recorder.record_llm("chat", payload, chat_completion("resposta secreta"), 0.123456)
+    recorder.close()
+
+    request, llm = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert request == {"type": "request", "path": "/analyze"}
+    assert llm["fingerprint"] == llm_fingerprint("chat", payload)
+    assert llm["latency_s"] == 0.1235
+    assert "secreta" not in json.dumps(llm)
+
+
+def test_full_queue_drops_records(tmp_path):
+    recorder = CassetteRecorder(str(tmp_path / "c.jsonl"), max_pending=1)
+    before = metrics.snapshot()["counters"].get("recording.dropped", 0)
+    blocker = threading.Event()
+    recorder._submit(lambda: blocker.wait() or {"n": 0})
+    for i in range(5):
+        recorder.write({"n": i})
+    blocker.set()
+    recorder.close()
+    assert metrics.snapshot()["counters"]["recording.dropped"] > before
+
+
+def test_query_drops_profiling_token_and_redacts_values():
+    query = recording.sanitize_query(b"profile=s3gredo&model=gpt&q=texto%20livre")
+    assert "s3gredo" not in query and "profile" not in query
+    assert "model=gpt" in query and "texto" not in query
+    assert recording.sanitize_query(b"") == ""
+
+
+def test_recorded_request_query_is_sanitized(tmp_path, monkeypatch):
+    async def inner(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    recorder = CassetteRecorder(str(tmp_path / "c.jsonl"))
+    monkeypatch.setattr(recording, "_recorder", recorder)
+    TestClient(recording.RecorderMiddleware(inner)).get("/analyze", params={"profile": "s3gredo", "model": "m"})
+    recorder.close()
+    record = json.loads((tmp_path / "c.jsonl").read_text(encoding="utf-8"))
+    assert record["query"] == "model=m"
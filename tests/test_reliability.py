@@ -0,0 +1,65 @@
+import itertools
+import math
+
+import pytest
+from fastapi.testclient import TestClient
+
+np = pytest.importorskip("numpy")
+
+from app.main import app
+from app.usecase.reliability_usecase import bootstrap_means, compute_reliability, icc_2_1, krippendorff_alpha_interval
+
+
+def _alpha_by_definition(x):
+    """Alfa intervalar direto da definição (pares de valores), para conferência."""
+    units = [[v for v in col if not math.isnan(v)] for col in x.T]
+    units = [u for u in units if len(u) >= 2]
+    values = [v for u in units for v in u]
+    n = len(values)
+    d_o = sum(
+        sum((a - b) ** 2 for a, b in itertools.permutations(u, 2)) / (len(u) - 1) for u in units
+    ) / n
+    d_e = sum((a - b) ** 2 for a, b in itertools.permutations(values, 2)) / (n * (n - 1))
+    return 1 - d_o / d_e
+
+
+def test_krippendorff_alpha_matches_definition_with_gaps():
+    rng = np.random.default_rng(3)
+    x = rng.integers(1, 6, size=(7, 5)).astype(float)
+    x[rng.random(x.shape) < 0.2] = np.nan
+    assert krippendorff_alpha_interval(np, x) == pytest.approx(_alpha_by_definition(x))
+
+
+def test_krippendorff_alpha_perfect_agreement():
+    x = np.array([[1.0, 3.0, 5.0], [1.0, 3.0, 5.0]])
+    assert krippendorff_alpha_interval(np, x) == pytest.approx(1.0)
+
+
+def test_icc_2_1_shrout_fleiss_example():
+    # Shrout & Fleiss (1979), tabela 2: 6 alvos × 4 juízes, ICC(2,1) = 0,29
+    y = np.array([[9, 2, 5, 8], [6, 1, 3, 2], [8, 4, 6, 8], [7, 1, 2, 6], [10, 5, 6, 9], [6, 2, 4, 7]], dtype=float)
+    assert icc_2_1(np, y) == pytest.approx(0.29, abs=0.005)
+
+
+def test_bootstrap_is_deterministic_and_brackets_the_mean():
+    rng = np.random.default_rng(0)
+    x = rng.normal(3.0, 1.0, size=(40, 3))
+    per_col, overall = bootstrap_means(np, x, iterations=500, seed=7, confidence=0.95)
+    assert (per_col, overall) == bootstrap_means(np, x, iterations=500, seed=7, confidence=0.95)
+    for (lo, hi), m in zip(per_col, x.mean(axis=0)):
+        assert lo < m < hi
+    assert overall[0] < x.mean() < overall[1]
+
+
+def test_compute_reliability_without_rows():
+    result = compute_reliability([], ["A"], iterations=10)
+    assert result.krippendorff_alpha is None and result.overall_ci is None
+
+
+def test_consolidate_endpoint_reports_reliability():
+    messages = [f"Contraste: {1 + i % 5}\nClareza: {1 + (i + 1) % 5}" for i in range(10)]
+    r = TestClient(app).post("/evaluation/consolidate", json={"messages": messages, "bootstrap_iterations": 100})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["reliability"]["bootstrap_iterations"] == 100
+    assert all(c["ci_low"] is not None for c in body["criteria"])
@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.prompts import prompt_hash
+from tests.fakes import chat_completion
+
+
+def test_used_prompt_is_opt_in(fake_backend):
+    client = TestClient(app)
+    body = {"profile_key": "tea", "message": "botão sem rótulo"}
+
+    data = client.post("/analyze", json=body).json()
+    assert data["content"] == "ok"
+    assert data["prompt_id"] == "analyze:tea"
+    assert data["used_prompt"] is None
+
+    data = client.post("/analyze", json={**body, "include_used_prompt": True}).json()
+    assert "botão sem rótulo" in data["used_prompt"]
+    assert data["prompt_hash"] == prompt_hash(data["used_prompt"])
+
+
+def test_large_responses_are_compressed(fake_backend):
+    fake_backend._chat = lambda **kwargs: chat_completion("x" * 5000)
+    client = TestClient(app)
+    r = client.post("/analyze", json={"profile_key": "tea", "message": "m"}, headers={"Accept-Encoding": "gzip"})
+    assert r.headers.get("content-encoding") in ("gzip", "br")
+    assert r.json()["content"] == "x" * 5000
@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import tokens
+from app.llm_backends import OpenAIBackend, OpenAICompatibleBackend
+
+
+class _RecordingClient:
+    def __init__(self):
+        self.kwargs = None
+
+        async def create(**kwargs):
+            self.kwargs = kwargs
+            return SimpleNamespace(
+                id="r",
+                output_text="ok",
+                choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+                usage=None,
+            )
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+        self.responses = SimpleNamespace(create=create)
+
+
+def test_input_budget_rejects_before_calling():
+    with pytest.raises(tokens.TokenBudgetExceeded):
+        tokens.check_input_budget("suggest_profile_name", "x" * 4 * 5000)
+
+
+def test_output_budget_grows_per_criterion_and_request_only_reduces():
+    budget = tokens.get_budget("evaluate_image")
+    assert tokens.output_budget("evaluate_image", criteria_count=3) == budget.max_output_tokens + 3 * budget.output_tokens_per_criterion
+    assert tokens.output_budget("evaluate_image", requested=100) == 100
+    assert tokens.output_budget("evaluate_image", requested=10**6) == budget.max_output_tokens
+
+
+def test_reasoning_models_get_headroom():
+    assert tokens.is_reasoning_model("gpt-5.2-2025-12-11")
+    assert tokens.is_reasoning_model("openai/o3-mini")
+    assert not tokens.is_reasoning_model("gpt-4.1-mini")
+    assert tokens.provider_output_limit("gpt-4.1-mini", 60) == 60
+    assert tokens.provider_output_limit("gpt-5", 60) == 60 + tokens.REASONING_OUTPUT_HEADROOM_TOKENS
+
+
+def test_openai_chat_sends_max_completion_tokens_with_headroom(monkeypatch):
+    client = _RecordingClient()
+    backend = OpenAIBackend()
+    monkeypatch.setattr(backend, "client", lambda: client)
+    asyncio.run(backend.chat(model="gpt-5", messages=[], max_completion_tokens=60))
+    assert client.kwargs["max_completion_tokens"] == 60 + tokens.REASONING_OUTPUT_HEADROOM_TOKENS
+    assert "max_tokens" not in client.kwargs
+
+
+def test_compatible_server_receives_max_tokens():
+    client = _RecordingClient()
+    backend = OpenAICompatibleBackend("local", "http://localhost:8000/v1", responses_api=False)
+    backend._client = client
+    asyncio.run(backend.respond(model="qwen", input="oi", max_output_tokens=50))
+    assert client.kwargs["max_tokens"] == 50
+    assert "max_completion_tokens" not in client.kwargs
+
+
+def test_usage_is_summed_within_scope():
+    with tokens.usage_scope() as usage:
+        tokens.record_usage(SimpleNamespace(usage={"prompt_tokens": 10, "completion_tokens": 3}))
+        tokens.record_usage(SimpleNamespace(usage={"input_tokens": 5, "output_tokens": 2,
+                                                   "input_tokens_details": {"cached_tokens": 4}}))
+    assert usage.as_dict() == {
+        "input_tokens": 15, "output_tokens": 5, "cached_tokens": 4, "estimated_input_tokens": 0, "calls": 2,
+        "shared_calls": 0,
+    }
+
+
+def test_split_usage_is_proportional_and_exact():
+    totals = tokens.UsageTotals(input_tokens=101, output_tokens=10, cached_tokens=3, calls=1)
+    shares = tokens.split_usage(totals, [1, 1, 2], [0, 0, 0])
+    assert [s.input_tokens for s in shares] == [25, 25, 51]
+    assert sum(s.cached_tokens for s in shares) == 3
+    # sem peso de saída: divide igualmente
+    assert sorted(s.output_tokens for s in shares) == [3, 3, 4]
+    assert all((s.calls, s.shared_calls) == (1, 1) for s in shares)